@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Run the benchmarks:
+
+    python -m benchmarks [-k PATTERN] [--save results.json] [--compare baseline.json]
+
+The database benchmarks need a MongoDB server given by the
+MONGOKIT_BENCH_URI environment variable or by --uri. ``--uri mock`` runs
+them on the in-memory backend (``pip install mongokit_ng[mock]``).
+"""
+import argparse
+import sys
+
+from . import runner
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('-k', dest='pattern', help='only run the benchmarks containing PATTERN')
+    parser.add_argument('--uri', help='MongoDB uri of the database benchmarks, or "mock"')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds spent per benchmark')
+    parser.add_argument('--save', help='write the results as json')
+    parser.add_argument('--compare', help='compare the results with a json baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slow down reported as a regression (default 0.1)')
+    args = parser.parse_args(argv)
+
+    results = runner.run(args.pattern, repeat=args.repeat, min_time=args.min_time,
+                         connection=runner.get_connection(args.uri))
+    if args.save:
+        runner.save(results, args.save)
+    if args.compare:
+        regressions = runner.compare(results, runner.load(args.compare), args.threshold)
+        for name, field, old, new, ratio in regressions:
+            print("REGRESSION %-40s %s: %s -> %s (x%.2f)" % (name, field, old, new, ratio))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Load and soak harness: run a mix of workloads from several threads and
+processes and report the throughput, the latency percentiles, the CPU
+usage and the memory of the workers.
+
+    python -m benchmarks.load --uri mongodb://localhost --threads 1,2,4,8 --duration 30
+    python -m benchmarks.load --uri mock --mix save=2,find=1 --processes 2
+
+The workloads are:
+
+- ``save``: construct, validate and save a document
+- ``find``: find 20 documents and wrap them
+- ``autorefs``: load a document with 6 autoref'ed documents
+- ``versioned_save``: save a new revision of a versioned document
+- ``gridfs_read``: load a document and read a 64KB GridFS file
+
+The data is created once by the main process, except on the ``mock``
+backend where each process has its own in-memory server.
+
+A CPU usage close to 100% per process while adding threads does not
+increase the throughput means the workload is bound by the GIL.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from mongokit_ng import profiling
+
+from .runner import MONGODB_URI_ENV, get_connection
+from .schemas import SCHEMAS, make_flat
+
+DB_NAME = 'mongokit_load'
+
+
+class Workload(object):
+    """
+    `prepare()` creates the data of the workload, `get_operation()` returns
+    the operation run in a loop by a thread. The operation takes a
+    :class:`random.Random` as argument.
+    """
+    name = None
+
+    def prepare(self, db):
+        pass
+
+    def get_operation(self, db):
+        raise NotImplementedError
+
+
+class SaveWorkload(Workload):
+    name = 'save'
+
+    def prepare(self, db):
+        db.load_save.drop()
+
+    def get_operation(self, db):
+        collection = db.load_save
+
+        def operation(rng):
+            collection.Flat(make_flat(rng.randrange(1000))).save()
+        return operation
+
+
+class FindWorkload(Workload):
+    name = 'find'
+
+    def prepare(self, db):
+        db.load_find.drop()
+        db.load_find.insert_many([make_flat(i) for i in range(1000)])
+
+    def get_operation(self, db):
+        collection = db.load_find
+
+        def operation(rng):
+            list(collection.Flat.find({'age': {'$gte': rng.randrange(20, 70)}}).limit(20))
+        return operation
+
+
+class AutorefsWorkload(Workload):
+    name = 'autorefs'
+
+    def prepare(self, db):
+        db.load_authors.drop()
+        db.load_autorefs.drop()
+        authors = []
+        for i in range(60):
+            author = db.load_authors.Author({'name': 'author %s' % i})
+            author.save()
+            authors.append(author)
+        for i in range(10):
+            doc = db.load_autorefs.AutorefDoc()
+            doc['title'] = 'title %s' % i
+            doc['author'] = authors[i * 6]
+            doc['reviewers'] = authors[i * 6 + 1:i * 6 + 6]
+            doc.save()
+
+    def get_operation(self, db):
+        collection = db.load_autorefs
+        ids = collection.distinct('_id')
+
+        def operation(rng):
+            collection.AutorefDoc.find_one({'_id': rng.choice(ids)})
+        return operation
+
+
+class VersionedSaveWorkload(Workload):
+    name = 'versioned_save'
+
+    def prepare(self, db):
+        db.load_pages.drop()
+        db.versioned_load_pages.drop()
+
+    def get_operation(self, db):
+        # concurrent saves of a same document would race on the revision
+        # number, each thread has its own document
+        page = db.load_pages.Page()
+        page['title'] = 'page of %s' % threading.current_thread().name
+        page.save()
+
+        def operation(rng):
+            page['views'] += 1
+            page.save()
+        return operation
+
+
+class GridFSReadWorkload(Workload):
+    name = 'gridfs_read'
+
+    def prepare(self, db):
+        # the files of the documents go to the default GridFS bucket
+        for name in ('load_files', 'fs.files', 'fs.chunks'):
+            db.drop_collection(name)
+        for i in range(10):
+            doc = db.load_files.Attachment({'name': 'file %s' % i})
+            doc.save()
+            doc.fs.content = os.urandom(64 * 1024)
+
+    def get_operation(self, db):
+        collection = db.load_files
+        ids = collection.distinct('_id')
+
+        def operation(rng):
+            collection.Attachment.find_one({'_id': rng.choice(ids)}).fs.content
+        return operation
+
+
+WORKLOADS = dict((workload.name, workload) for workload in [
+    SaveWorkload(), FindWorkload(), AutorefsWorkload(), VersionedSaveWorkload(), GridFSReadWorkload()])
+
+
+def parse_mix(mix):
+    """
+    parse a mix like ``save=2,find=1`` into a dict of weights by workload
+    """
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in WORKLOADS:
+            raise ValueError("unknown workload %r, expected one of %s" % (name, ', '.join(sorted(WORKLOADS))))
+        weights[name] = float(weight) if weight else 1.
+    return weights
+
+
+_connections = {}
+
+
+def _get_connection(uri):
+    # the autorefs of the registered documents stay bound to the first
+    # connection, which matters for the in-memory backend
+    if uri not in _connections:
+        connection = get_connection(uri)
+        if connection is None:
+            raise ValueError("no MongoDB server, give an uri or set %s" % MONGODB_URI_ENV)
+        _connections[uri] = connection
+    return _connections[uri]
+
+
+def prepare(connection, weights):
+    connection.register(SCHEMAS)
+    db = connection[DB_NAME]
+    for name in weights:
+        WORKLOADS[name].prepare(db)
+
+
+def _get_rusage():
+    if resource is None:
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    rss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return usage.ru_utime + usage.ru_stime, rss
+
+
+def _run_thread(db, weights, seed, start, deadlines, result):
+    rng = random.Random(seed)
+    names = sorted(weights)
+    cum_weights = []
+    total = 0
+    for name in names:
+        total += weights[name]
+        cum_weights.append(total)
+    try:
+        operations = dict((name, WORKLOADS[name].get_operation(db)) for name in names)
+    except Exception:
+        start.abort()
+        raise
+    latencies = dict((name, []) for name in names)
+    errors = dict((name, 0) for name in names)
+    first_errors = {}
+    start.wait()
+    warmup_end, end = deadlines['warmup_end'], deadlines['end']
+    while True:
+        now = time.perf_counter()
+        if now >= end:
+            break
+        name = rng.choices(names, cum_weights=cum_weights)[0]
+        try:
+            operations[name](rng)
+        except Exception as e:
+            if now >= warmup_end:
+                errors[name] += 1
+                first_errors.setdefault(name, repr(e))
+            continue
+        if now >= warmup_end:
+            latencies[name].append(time.perf_counter() - now)
+    result['latencies'] = latencies
+    result['errors'] = errors
+    result['first_errors'] = first_errors
+
+
+def run_process(uri, weights, threads, duration, warmup=0., seed=0, prepare_data=False, profile=False):
+    """
+    run the workloads from `threads` threads of the current process during
+    `duration` seconds (after `warmup` seconds) and return the raw results
+    """
+    connection = _get_connection(uri)
+    if prepare_data:
+        prepare(connection, weights)
+    else:
+        connection.register(SCHEMAS)
+    db = connection[DB_NAME]
+    if profile:
+        profiling.reset()
+        profiling.enable()
+
+    # the threads set up their operations, then all start together
+    start = threading.Barrier(threads + 1)
+    deadlines = {}
+    results = [{} for _ in range(threads)]
+    workers = []
+    for index in range(threads):
+        worker = threading.Thread(
+            target=_run_thread, name='load-%s' % index,
+            args=(db, weights, seed * 1000 + index, start, deadlines, results[index]))
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+    deadlines['warmup_end'] = time.perf_counter() + warmup
+    deadlines['end'] = deadlines['warmup_end'] + duration
+    try:
+        start.wait()
+    except threading.BrokenBarrierError:
+        raise RuntimeError("a thread failed to set up its workloads")
+    # the CPU time is measured over the same period as the latencies
+    time.sleep(max(0, deadlines['warmup_end'] - time.perf_counter()))
+    cpu_start, _ = _get_rusage()
+    for worker in workers:
+        worker.join()
+    cpu_end, rss = _get_rusage()
+    if profile:
+        profiling.disable()
+
+    latencies = dict((name, []) for name in weights)
+    errors = dict((name, 0) for name in weights)
+    first_errors = {}
+    for result in results:
+        for name, values in result.get('latencies', {}).items():
+            latencies[name].extend(values)
+        for name, count in result.get('errors', {}).items():
+            errors[name] += count
+        for name, error in result.get('first_errors', {}).items():
+            first_errors.setdefault(name, error)
+    return {
+        'latencies': latencies,
+        'errors': errors,
+        'first_errors': first_errors,
+        'duration': duration,
+        'cpu_seconds': cpu_end - cpu_start if cpu_start is not None else None,
+        'rss_bytes': rss,
+        'phases': profiling.snapshot()['phases'] if profile else None,
+    }
+
+
+def percentile(values, q):
+    """
+    return the `q` percentile of the sorted `values` (nearest rank)
+    """
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(round(q / 100. * len(values))) - 1))
+    return values[index]
+
+
+def _merge_phases(results):
+    phases = {}
+    for result in results:
+        for item in result['phases'] or []:
+            key = (item['document'], item['phase'])
+            entry = phases.setdefault(key, {
+                'document': item['document'], 'phase': item['phase'],
+                'count': 0, 'total_ms': 0., 'max_ms': 0.})
+            entry['count'] += item['count']
+            entry['total_ms'] += item['total_ms']
+            entry['max_ms'] = max(entry['max_ms'], item['max_ms'])
+    for entry in phases.values():
+        entry['mean_ms'] = entry['total_ms'] / entry['count']
+    return sorted(phases.values(), key=lambda entry: entry['total_ms'], reverse=True)
+
+
+def summarize(results, threads):
+    """
+    merge the results of the processes into a report
+    """
+    duration = results[0]['duration']
+    workloads = {}
+    total = 0
+    for name in sorted(results[0]['latencies']):
+        latencies = sorted(value for result in results for value in result['latencies'][name])
+        total += len(latencies)
+        workloads[name] = {
+            'count': len(latencies),
+            'errors': sum(result['errors'][name] for result in results),
+            'first_error': next((result['first_errors'][name] for result in results
+                                 if name in result['first_errors']), None),
+            'ops_per_sec': len(latencies) / duration,
+            'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+            'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+            'max_ms': latencies[-1] * 1000 if latencies else None,
+        }
+    cpu = [result['cpu_seconds'] for result in results if result['cpu_seconds'] is not None]
+    rss = [result['rss_bytes'] for result in results if result['rss_bytes'] is not None]
+    report = {
+        'processes': len(results),
+        'threads': threads,
+        'duration': duration,
+        'ops_per_sec': total / duration,
+        'workloads': workloads,
+        # 100% means that a process used one core during the whole run
+        'cpu_percent_per_process': 100. * sum(cpu) / duration / len(cpu) if cpu else None,
+        'max_rss_mb': max(rss) / 1024. / 1024. if rss else None,
+        'total_rss_mb': sum(rss) / 1024. / 1024. if rss else None,
+    }
+    if results[0]['phases'] is not None:
+        report['phases'] = _merge_phases(results)
+    return report
+
+
+def run(uri, weights, threads=4, processes=1, duration=10., warmup=1., profile=False):
+    """
+    run the workloads from `processes` processes of `threads` threads and
+    return the report
+    """
+    uri = uri or os.environ.get(MONGODB_URI_ENV)
+    mock = uri == 'mock'
+    if not mock:
+        prepare(_get_connection(uri), weights)
+    kwargs = dict(threads=threads, duration=duration, warmup=warmup, prepare_data=mock, profile=profile)
+    if processes == 1:
+        results = [run_process(uri, weights, **kwargs)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(run_process, uri, weights, seed=seed, **kwargs)
+                       for seed in range(processes)]
+            results = [future.result() for future in futures]
+    return summarize(results, threads)
+
+
+def _format(value, pattern):
+    return pattern % value if value is not None else '-'
+
+
+def print_report(report, log=print):
+    log("%s process(es) x %s thread(s): %.1f ops/s, cpu %s%% per process, max rss %s MB" % (
+        report['processes'], report['threads'], report['ops_per_sec'],
+        _format(report['cpu_percent_per_process'], '%.0f'), _format(report['max_rss_mb'], '%.1f')))
+    for name, stats in sorted(report['workloads'].items()):
+        log("    %-16s %8.1f ops/s  p50 %8s ms  p99 %8s ms  errors %s" % (
+            name, stats['ops_per_sec'], _format(stats['p50_ms'], '%.2f'),
+            _format(stats['p99_ms'], '%.2f'), stats['errors']))
+        if stats['first_error']:
+            log("        first error: %s" % stats['first_error'])
+    for phase in report.get('phases', [])[:10]:
+        log("    %-16s %-20s %10.1f ms  %8d calls" % (
+            phase['document'], phase['phase'], phase['total_ms'], phase['count']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load')
+    parser.add_argument('--uri', help='MongoDB uri, or "mock" for the in-memory backend')
+    parser.add_argument('--mix', default=','.join(sorted(WORKLOADS)),
+                        help='weighted workloads, like save=2,find=1 (default: all, same weight)')
+    parser.add_argument('--threads', default='4', help='threads per process, or a list like 1,2,4,8')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=10., help='seconds measured per run')
+    parser.add_argument('--warmup', type=float, default=1., help='seconds run before measuring')
+    parser.add_argument('--profile', action='store_true', help='report the time spent per document phase')
+    parser.add_argument('--save', help='write the reports as json')
+    args = parser.parse_args(argv)
+
+    weights = parse_mix(args.mix)
+    reports = []
+    for threads in [int(threads) for threads in args.threads.split(',')]:
+        report = run(args.uri, weights, threads=threads, processes=args.processes,
+                     duration=args.duration, warmup=args.warmup, profile=args.profile)
+        print_report(report)
+        reports.append(report)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(reports, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
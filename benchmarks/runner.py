@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import gc
+import json
+import os
+import statistics
+import timeit
+import tracemalloc
+
+BENCHMARKS = []
+
+# the database benchmarks run against the MongoDB server of this uri
+MONGODB_URI_ENV = 'MONGOKIT_BENCH_URI'
+
+
+class Benchmark(object):
+    def __init__(self, name, setup, db=False):
+        self.name = name
+        self.setup = setup
+        self.db = db
+
+
+def benchmark(name, db=False):
+    """
+    register a benchmark. The decorated function does the setup and
+    returns the operation to time. If `db` is True, it takes a connection
+    as argument.
+    """
+    def decorator(setup):
+        BENCHMARKS.append(Benchmark(name, setup, db))
+        return setup
+    return decorator
+
+
+def get_connection(uri=None):
+    """
+    return a connection for the database benchmarks or None if no server
+    is configured. The ``mock`` uri runs them on the in-memory backend of
+    :mod:`mongokit_ng.mock`, whose timings are not comparable with the
+    ones of a server.
+    """
+    uri = uri or os.environ.get(MONGODB_URI_ENV)
+    if not uri:
+        return None
+    if uri == 'mock':
+        from mongokit_ng.mock import MockConnection
+        return MockConnection()
+    from mongokit_ng import Connection
+    return Connection(uri)
+
+
+def measure(operation, repeat=5, min_time=0.2):
+    """
+    time `operation` and measure the memory it allocates. Return a dict
+    with the mean, min and max time per call in microseconds and the peak
+    of memory allocated by one call in bytes.
+    """
+    timer = timeit.Timer(operation)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time / repeat:
+            break
+        number *= 10 if elapsed < min_time / repeat / 10 else 2
+    timings = [elapsed / number * 1e6 for elapsed in timer.repeat(repeat, number)]
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'mean_us': statistics.mean(timings),
+        'min_us': min(timings),
+        'max_us': max(timings),
+        'number': number,
+        'peak_bytes': peak - start,
+    }
+
+
+def run(pattern=None, repeat=5, min_time=0.2, connection=None, log=print):
+    """
+    run the benchmarks whose name contains `pattern` and return their
+    results by name. The database benchmarks are skipped if `connection`
+    is None.
+    """
+    from . import suite  # noqa: F401, registers the benchmarks
+    results = {}
+    for bench in BENCHMARKS:
+        if pattern and pattern not in bench.name:
+            continue
+        if bench.db:
+            if connection is None:
+                log("%-40s skipped (no database)" % bench.name)
+                continue
+            operation = bench.setup(connection)
+        else:
+            operation = bench.setup()
+        results[bench.name] = measure(operation, repeat=repeat, min_time=min_time)
+        log("%-40s %12.2f us %12d B" % (
+            bench.name, results[bench.name]['min_us'], results[bench.name]['peak_bytes']))
+    return results
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    compare `results` with `baseline` and return a list of
+    (name, field, baseline value, new value, ratio) for the benchmarks
+    whose best time or memory peak grew by more than `threshold`.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        for field in ('min_us', 'peak_bytes'):
+            old, new = baseline[name][field], result[field]
+            if old and new > old * (1 + threshold):
+                regressions.append((name, field, old, new, float(new) / old))
+    return regressions
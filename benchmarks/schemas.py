@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import datetime
+
+from mongokit_ng import Document, VersionedDocument, CustomType, Set
+from bson.objectid import ObjectId
+
+
+class Flat(Document):
+    structure = {
+        'name': str,
+        'email': str,
+        'age': int,
+        'score': float,
+        'active': bool,
+        'created_at': datetime.datetime,
+        'owner': ObjectId,
+        'tags': [str],
+    }
+    required_fields = ['name', 'email']
+    default_values = {'active': True, 'score': 0.}
+
+
+class Nested(Document):
+    structure = {
+        'title': str,
+        'meta': {
+            'author': {'name': str, 'email': str},
+            'stats': {'views': int, 'likes': int, 'shares': {'twitter': int, 'facebook': int}},
+            'dates': {'created': datetime.datetime, 'updated': datetime.datetime},
+        },
+        'layout': {
+            'header': {'title': str, 'menu': {'items': [str], 'active': str}},
+            'body': {'blocks': [{'kind': str, 'content': str}]},
+        },
+    }
+
+
+class LargeList(Document):
+    structure = {
+        'name': str,
+        'values': [int],
+        'items': [{'name': str, 'value': int, 'at': datetime.datetime}],
+    }
+
+
+class I18nDoc(Document):
+    structure = {
+        'title': str,
+        'summary': str,
+        'body': {'text': str, 'words': int},
+    }
+    i18n = ['title', 'summary', 'body.text']
+    use_dot_notation = True
+
+
+class Author(Document):
+    structure = {
+        'name': str,
+    }
+
+
+class AutorefDoc(Document):
+    structure = {
+        'title': str,
+        'author': Author,
+        'reviewers': [Author],
+    }
+    use_autorefs = True
+
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class CustomPoint(CustomType):
+    mongo_type = dict
+    python_type = Point
+
+    def to_bson(self, value):
+        if value is not None:
+            return {'x': value.x, 'y': value.y}
+
+    def to_python(self, value):
+        if value is not None:
+            return Point(value['x'], value['y'])
+
+
+class CustomDate(CustomType):
+    mongo_type = str
+    python_type = datetime.date
+
+    def to_bson(self, value):
+        if value is not None:
+            return value.isoformat()
+
+    def to_python(self, value):
+        if value is not None:
+            return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class CustomTypeDoc(Document):
+    structure = {
+        'position': CustomPoint(),
+        'path': [CustomPoint()],
+        'day': CustomDate(),
+        'labels': Set(str),
+    }
+
+
+class Page(VersionedDocument):
+    structure = {
+        'title': str,
+        'views': int,
+    }
+    default_values = {'views': 0}
+
+
+class Attachment(Document):
+    structure = {
+        'name': str,
+    }
+    gridfs = {'files': ['content']}
+
+
+SCHEMAS = [Flat, Nested, LargeList, I18nDoc, Author, AutorefDoc, CustomTypeDoc, Page, Attachment]
+
+
+# the factories return documents as they are stored in the database
+def make_flat(i=0):
+    return {
+        'name': 'user %s' % i,
+        'email': 'user%s@example.com' % i,
+        'age': 20 + i % 50,
+        'score': i / 3.,
+        'active': bool(i % 2),
+        'created_at': datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=i),
+        'owner': ObjectId(),
+        'tags': ['tag%s' % j for j in range(5)],
+    }
+
+
+def make_nested(i=0):
+    now = datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=i)
+    return {
+        'title': 'page %s' % i,
+        'meta': {
+            'author': {'name': 'bob', 'email': 'bob@example.com'},
+            'stats': {'views': i, 'likes': i // 2, 'shares': {'twitter': 1, 'facebook': 2}},
+            'dates': {'created': now, 'updated': now},
+        },
+        'layout': {
+            'header': {'title': 'header', 'menu': {'items': ['home', 'about', 'blog'], 'active': 'home'}},
+            'body': {'blocks': [{'kind': 'text', 'content': 'block %s' % j} for j in range(10)]},
+        },
+    }
+
+
+def make_large_list(i=0, size=1000):
+    at = datetime.datetime(2020, 1, 1)
+    return {
+        'name': 'list %s' % i,
+        'values': list(range(size)),
+        'items': [{'name': 'item %s' % j, 'value': j, 'at': at} for j in range(size)],
+    }
+
+
+def make_i18n(i=0):
+    return {
+        'title': [{'lang': 'en', 'value': 'hello %s' % i}, {'lang': 'fr', 'value': 'bonjour %s' % i}],
+        'summary': [{'lang': 'en', 'value': 'summary'}, {'lang': 'fr', 'value': 'résumé'}],
+        'body': {'text': [{'lang': 'en', 'value': 'some text'}, {'lang': 'fr', 'value': 'du texte'}],
+                 'words': 2},
+    }
+
+
+def make_custom_type(i=0):
+    return {
+        'position': {'x': i, 'y': -i},
+        'path': [{'x': j, 'y': j} for j in range(20)],
+        'day': '2020-01-%02d' % (1 + i % 28),
+        'labels': ['a', 'b', 'c'],
+    }
+
+
+FACTORIES = {
+    'flat': (Flat, make_flat),
+    'nested': (Nested, make_nested),
+    'large_list': (LargeList, make_large_list),
+    'i18n': (I18nDoc, make_i18n),
+    'custom_type': (CustomTypeDoc, make_custom_type),
+}
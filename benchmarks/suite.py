@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from bson import BSON
+from mongokit_ng import SchemaDocument
+from mongokit_ng.helpers import DotCollapsedDict
+
+from .runner import benchmark
+from .schemas import FACTORIES, SCHEMAS
+
+DB_NAME = 'mongokit_bench'
+
+
+def _get_class(cls):
+    # the first instance completes the structure (i18n, autorefs), the
+    # benchmarks measure the following ones
+    cls()
+    return cls
+
+
+for _name, (_cls, _make) in sorted(FACTORIES.items()):
+
+    def _init_skeleton(cls=_cls):
+        cls = _get_class(cls)
+        return lambda: cls()
+    benchmark('init_skeleton[%s]' % _name)(_init_skeleton)
+
+    def _init_from_son(cls=_cls, make=_make):
+        cls = _get_class(cls)
+        # the embedded values are converted in place so a fresh son is
+        # decoded for each call, as a cursor does
+        raw = BSON.encode(make())
+        return lambda: cls(BSON(raw).decode())
+    benchmark('init_from_son[%s]' % _name)(_init_from_son)
+
+    def _validate(cls=_cls, make=_make):
+        doc = _get_class(cls)(make())
+        # the schema part of Document.validate(), without the size check
+        # which asks the server for its limits
+        return lambda: SchemaDocument.validate(doc)
+    benchmark('validate[%s]' % _name)(_validate)
+
+    def _process_custom_type(cls=_cls, make=_make):
+        doc = _get_class(cls)(make())
+
+        def operation():
+            doc._process_custom_type('bson', doc, doc.structure)
+            doc._process_custom_type('python', doc, doc.structure)
+        return operation
+    benchmark('process_custom_type[%s]' % _name)(_process_custom_type)
+
+    def _dot_collapsed(make=_make):
+        son = make()
+        return lambda: DotCollapsedDict(son)
+    benchmark('dot_collapsed_dict[%s]' % _name)(_dot_collapsed)
+
+
+def _get_collection(connection, name='bench'):
+    connection.register(SCHEMAS)
+    collection = connection[DB_NAME][name]
+    collection.drop()
+    return collection
+
+
+@benchmark('save[flat]', db=True)
+def save_flat(connection):
+    collection = _get_collection(connection)
+    make = FACTORIES['flat'][1]
+
+    def operation():
+        collection.Flat(make()).save()
+    return operation
+
+
+@benchmark('save[nested]', db=True)
+def save_nested(connection):
+    collection = _get_collection(connection)
+    make = FACTORIES['nested'][1]
+
+    def operation():
+        collection.Nested(make()).save()
+    return operation
+
+
+@benchmark('cursor_wrap[flat x 100]', db=True)
+def cursor_wrap(connection):
+    collection = _get_collection(connection)
+    make = FACTORIES['flat'][1]
+    collection.insert_many([make(i) for i in range(100)])
+    return lambda: list(collection.Flat.find())
+
+
+@benchmark('cursor_wrap[large_list x 10]', db=True)
+def cursor_wrap_large_list(connection):
+    collection = _get_collection(connection)
+    make = FACTORIES['large_list'][1]
+    collection.insert_many([make(i) for i in range(10)])
+    return lambda: list(collection.LargeList.find())
+
+
+@benchmark('to_json[nested]', db=True)
+def to_json(connection):
+    collection = _get_collection(connection)
+    doc = collection.Nested(FACTORIES['nested'][1]())
+    return doc.to_json
+
+
+@benchmark('from_json[nested]', db=True)
+def from_json(connection):
+    collection = _get_collection(connection)
+    json = collection.Nested(FACTORIES['nested'][1]()).to_json()
+    return lambda: collection.Nested.from_json(json)
+
+
+@benchmark('load_autorefs[1 + 5 refs]', db=True)
+def load_autorefs(connection):
+    collection = _get_collection(connection)
+    authors = []
+    for i in range(6):
+        author = collection.Author({'name': 'author %s' % i})
+        author.save()
+        authors.append(author)
+    doc = collection.AutorefDoc()
+    doc['title'] = 'title'
+    doc['author'] = authors[0]
+    doc['reviewers'] = authors[1:]
+    doc.save()
+    return lambda: collection.AutorefDoc.find_one({'_id': doc['_id']})
@@ -51,4 +51,6 @@ from pymongo import (
     HASHED as INDEX_HASHED
 )
 from .migration import DocumentMigration
+from .audit import QueryAuditor
+from .monitoring import CommandMonitor
 # pylint: enable=W0401,W0614,W0611
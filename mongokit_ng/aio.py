@@ -0,0 +1,639 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+asyncio API built on Motor (``pip install mongokit_ng[async]``).
+
+:class:`AsyncConnection` is used like :class:`~mongokit_ng.Connection`,
+the documents and their schema are the same but the methods doing I/O are
+coroutines:
+
+>>> connection = AsyncConnection()
+>>> connection.register([BlogPost, User])
+>>> post = await connection.test.posts.BlogPost.find_one({'slug': 'hello'})
+>>> async for post in connection.test.posts.BlogPost.find({'published': True}):
+...     print(post['author']['name'])
+>>> await post.save()
+>>> await post.fs.put(data, filename='image')
+>>> data = await post.fs.get('image')
+
+The registered documents are subclasses of the declared ones, so
+``isinstance(post, BlogPost)`` is still true.
+
+The autorefs of the documents loaded by a cursor are resolved for a whole
+batch at once, with one query per referenced collection, and the
+referenced documents are checked in the same way before a save.
+
+Not supported: ``VersionedDocument``, the lazy migrations
+(``migration_handler``), ``find_and_modify()``, ``bulk_load()``,
+``parallel_scan()``, the GridFS disk cache and the writing of inline
+files. Motor 2 does not import on Python 3.11 and later.
+"""
+import asyncio
+import contextvars
+from collections.abc import Iterable, Mapping
+from uuid import uuid4
+
+from bson.dbref import DBRef
+from gridfs.errors import NoFile
+from motor.motor_asyncio import (
+    AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorCursor,
+    AsyncIOMotorDatabase, AsyncIOMotorGridIn, AsyncIOMotorGridOut)
+
+from .collection import CollectionMixin
+from .connection import MongoPieConnection
+from .cursor import (
+    _attach_refs, _get_autoref_paths, _get_ref_database, _missing_reference, wrap_document)
+from .database import DatabaseMixin
+from .document import DELETE_BATCH_SIZE, Document
+from .grid import InlineFile, _batches
+from .helpers import DotedDict
+from .monitoring import get_comment, is_enabled
+from .mongo_exceptions import MultipleResultsFound, OperationFailure
+from .versioned_document import VersionedDocument
+
+# the cascade saves started by the validation of a document (see
+# Document._make_reference), awaited by AsyncDocument.save()
+_pending_saves = contextvars.ContextVar('mongokit_pending_saves', default=None)
+
+_async_classes = {}
+
+
+def get_async_class(doc_class):
+    """
+    return the subclass of `doc_class` whose methods doing I/O are
+    coroutines
+    """
+    if issubclass(doc_class, AsyncDocument):
+        return doc_class
+    async_class = _async_classes.get(doc_class)
+    if async_class is None:
+        if issubclass(doc_class, VersionedDocument):
+            raise TypeError("%s: VersionedDocument is not supported by the asyncio API" % doc_class.__name__)
+        if doc_class.migration_handler is not None:
+            raise TypeError("%s: the lazy migrations are not supported by the asyncio API" % doc_class.__name__)
+        # AsyncDocument comes after the classes declared by the user in the
+        # mro, so their own methods are kept
+        async_class = _async_classes[doc_class] = type(
+            doc_class.__name__, (doc_class, AsyncDocument), {'__module__': doc_class.__module__})
+    return async_class
+
+
+async def resolve_references(collection, doc_class, sons):
+    """
+    replace the DBRefs held by the autoref fields of the raw documents
+    `sons` of `collection` by the referenced documents. They are fetched
+    with one query per referenced collection, and their own autorefs are
+    resolved the same way.
+    """
+    paths = _get_autoref_paths(doc_class) if doc_class.use_autorefs else []
+    if not paths or not sons:
+        return
+    connection = collection.database.connection
+    fallback = collection.database.name if doc_class.force_autorefs_current_db else None
+    wanted = {}
+    for path, ref_class in paths:
+        def collect(value, ref_class=ref_class):
+            if isinstance(value, DBRef):
+                key = (_get_ref_database(value, fallback), value.collection, ref_class)
+                wanted.setdefault(key, set()).add(value.id)
+            return value
+        for son in sons:
+            _attach_refs(son, doc_class.structure, path.split('.'), collect)
+    if not wanted:
+        return
+
+    async def fetch(database, name, ref_class, ids):
+        target = connection[database][name]
+        found = await target.find({'_id': {'$in': list(ids)}}).to_list(None)
+        await resolve_references(target, ref_class, found)
+        objs = {}
+        for son in found:
+            obj = get_async_class(ref_class)(son, collection=target)
+            obj._prefetched = True
+            objs[son['_id']] = obj
+        return objs
+
+    keys = list(wanted)
+    results = await asyncio.gather(*[fetch(*(key + (wanted[key],))) for key in keys])
+    found = dict(zip(keys, results))
+    for path, ref_class in paths:
+        def resolve(value, ref_class=ref_class):
+            if isinstance(value, DBRef):
+                database = _get_ref_database(value, fallback)
+                obj = found[(database, value.collection, ref_class)].get(value.id)
+                if obj is None:
+                    raise _missing_reference(ref_class, database, value.id)
+                return obj
+            return value
+        for son in sons:
+            _attach_refs(son, doc_class.structure, path.split('.'), resolve)
+
+
+async def delete_files(database, docids, inline_collection=None, batch_size=DELETE_BATCH_SIZE):
+    """
+    coroutine version of :func:`mongokit_ng.grid.delete_files`
+    """
+    for batch in _batches(docids, batch_size):
+        files = await database['fs.files'].find({'docid': {'$in': batch}}, projection=['_id']).to_list(None)
+        file_ids = [f['_id'] for f in files]
+        if file_ids:
+            await database['fs.files'].delete_many({'_id': {'$in': file_ids}})
+            await database['fs.chunks'].delete_many({'files_id': {'$in': file_ids}})
+        if inline_collection:
+            await database[inline_collection].delete_many({'docid': {'$in': batch}})
+
+
+class AsyncFS(object):
+    """
+    GridFS files of an async document. The files are stored like the ones
+    of :class:`~mongokit_ng.grid.FS` so both APIs can read them.
+    """
+    def __init__(self, obj, container=None):
+        self._obj = obj
+        self._container = container
+        self._root_collection = obj.db['fs']
+        if container is None:
+            for name in obj.gridfs.get('containers', []):
+                setattr(self, name, AsyncFS(obj, container=name))
+
+    def _get_spec(self, **kwargs):
+        if not self._obj.get('_id'):
+            raise RuntimeError('This document is not saved, no files should be attached')
+        spec = {'docid': self._obj['_id']}
+        if self._container is not None:
+            spec['container'] = self._container
+        spec.update(kwargs)
+        return spec
+
+    async def _iter_inline(self, filename):
+        if not self._obj.gridfs.get('inline_threshold'):
+            return []
+        name = self._obj.gridfs.get('inline_collection')
+        if name:
+            return await self._obj.db[name].find(self._get_spec(filename=filename)).to_list(None)
+        return [e for e in self._obj.get('_fs', []) if e['filename'] == filename and
+                (self._container is None or e['container'] == self._container)]
+
+    async def list(self, filename=None):
+        """
+        return the file documents attached to the object (all the versions
+        of `filename` if given), the oldest first
+        """
+        spec = self._get_spec() if filename is None else self._get_spec(filename=filename)
+        files = await self._root_collection.files.find(spec).sort('uploadDate', 1).to_list(None)
+        if filename is not None:
+            files.extend(await self._iter_inline(filename))
+            files.sort(key=lambda f: f['uploadDate'])
+        return files
+
+    async def open(self, filename, version=-1):
+        """
+        return a version of `filename` (the last one by default) as an
+        :class:`~motor.motor_asyncio.AsyncIOMotorGridOut` to stream it, or
+        as an :class:`~mongokit_ng.grid.InlineFile`
+        """
+        versions = await self.list(filename)
+        try:
+            file_document = versions[version]
+        except IndexError:
+            raise NoFile("no version %d for filename %r" % (version, filename))
+        if 'data' in file_document:
+            return InlineFile(file_document)
+        return AsyncIOMotorGridOut(self._root_collection, file_document=file_document)
+
+    async def get(self, filename, version=-1):
+        """
+        return the content of a version of `filename`
+        """
+        grid_out = await self.open(filename, version)
+        if isinstance(grid_out, InlineFile):
+            return grid_out.read()
+        return await grid_out.read()
+
+    def open_upload_stream(self, filename, content_type=None):
+        """
+        return an :class:`~motor.motor_asyncio.AsyncIOMotorGridIn` writing a
+        new version of `filename`:
+
+        >>> grid_in = doc.fs.open_upload_stream('video')
+        >>> for chunk in chunks:
+        ...     await grid_in.write(chunk)
+        >>> await grid_in.close()
+        """
+        return AsyncIOMotorGridIn(self._root_collection, encoding='utf-8',
+                                  **self._get_spec(filename=filename, content_type=content_type))
+
+    async def put(self, data, **kwargs):
+        """
+        store `data` (bytes or str) as a new file and return its id. Like
+        :meth:`mongokit_ng.grid.FS.put`, the attributes of the file
+        (`filename`, `content_type`...) are given as keywords:
+
+        >>> await doc.fs.put(data, filename='image', content_type='image/png')
+        """
+        grid_in = AsyncIOMotorGridIn(self._root_collection, encoding='utf-8', **self._get_spec(**kwargs))
+        await grid_in.write(data)
+        await grid_in.close()
+        return grid_in._id
+
+    async def delete(self, filename):
+        """
+        delete all the versions of `filename`
+        """
+        files = await self._root_collection.files.find(
+            self._get_spec(filename=filename), projection=['_id']).to_list(None)
+        file_ids = [f['_id'] for f in files]
+        if file_ids:
+            await self._root_collection.files.delete_many({'_id': {'$in': file_ids}})
+            await self._root_collection.chunks.delete_many({'files_id': {'$in': file_ids}})
+
+    def refresh(self):
+        # nothing is cached
+        pass
+
+    def __repr__(self):
+        return "<%s of object '%s'>" % (self.__class__.__name__, self._obj.__class__.__name__)
+
+
+class AsyncDocument(Document):
+    """
+    Document whose methods doing I/O are coroutines. The find methods
+    return an :class:`AsyncCursor`.
+
+    The documents registered to an :class:`AsyncConnection` are turned into
+    subclasses of their class and of AsyncDocument, a document can also
+    inherit from it directly.
+    """
+    _fs_class = AsyncFS
+    # the referenced documents are checked or loaded before the
+    # validation, so R.to_python() does no query
+    _prefetched = False
+    _references = None
+
+    def _get_size_limit(self):
+        # all the servers supported by Motor accept 16MB
+        return (15999999, '16MB')
+
+    def _find(self, method, *args, **kwargs):
+        cursor = self.collection.find(wrap=self._obj_class, *args, **kwargs)
+        if is_enabled():
+            comment = get_comment(self.collection.database.client, self._obj_class.__name__, method)
+            if comment is not None:
+                cursor.comment(comment)
+        return cursor
+
+    async def find_one(self, filter=None, *args, **kwargs):
+        if filter is not None and not isinstance(filter, Mapping):
+            filter = {'_id': filter}
+        docs = await self._find('find_one', filter, *args, **kwargs).limit(-1).to_list(1)
+        if docs:
+            return docs[0]
+
+    async def one(self, *args, **kwargs):
+        docs = await self._find('one', *args, **kwargs).limit(2).to_list(2)
+        if len(docs) > 1:
+            raise MultipleResultsFound("more than one result found")
+        elif docs:
+            return docs[0]
+
+    async def fetch_one(self, spec=None, *args, **kwargs):
+        docs = await self._find('fetch_one', self._get_fetch_spec(spec), *args, **kwargs).limit(2).to_list(2)
+        if len(docs) > 1:
+            raise MultipleResultsFound("more than one result found")
+        elif docs:
+            return docs[0]
+
+    async def find_random(self):
+        docs = await self.sample(1)
+        if docs:
+            return docs[0]
+
+    @classmethod
+    async def generate_index(cls, collection):
+        for fields, kwargs in cls._get_index_arguments():
+            await collection.create_index(fields, **kwargs)
+
+    @classmethod
+    async def sync_indexes(cls, collection, dry_run=False, drop=False):
+        existing = await collection.list_indexes().to_list(None)
+        plan, to_create = cls._get_index_plan(collection, existing, drop)
+        if not dry_run:
+            for name in plan['drop']:
+                await collection.drop_index(name)
+            if to_create:
+                await collection.create_indexes(to_create)
+        return plan
+
+    def bulk_load(self, *args, **kwargs):
+        raise TypeError("bulk_load() is not supported by the asyncio API, use a Connection")
+
+    def parallel_scan(self, *args, **kwargs):
+        raise TypeError("parallel_scan() is not supported by the asyncio API, use a Connection")
+
+    def _iter_references(self):
+        for path, ref_class in _get_autoref_paths(self.__class__):
+            refs = []
+
+            def collect(value):
+                refs.append(value)
+                return value
+            _attach_refs(self, self.structure, path.split('.'), collect)
+            for value in refs:
+                if value is not None and not isinstance(value, DBRef):
+                    yield ref_class, value
+
+    async def _prepare_references(self, seen=None):
+        # save the new referenced documents, check that the other ones
+        # exist, with one query per collection
+        seen = set() if seen is None else seen
+        seen.add(id(self))
+        wanted = {}
+        for ref_class, obj in self._iter_references():
+            if id(obj) in seen:
+                continue
+            if isinstance(obj, AsyncDocument):
+                if obj.use_autorefs:
+                    await obj._prepare_references(seen)
+                if '_id' not in obj:
+                    await obj.save()
+            if not getattr(obj, '_prefetched', False):
+                key = (obj.db.name, obj.collection.name)
+                wanted.setdefault(key, []).append((ref_class, obj))
+            seen.add(id(obj))
+        for (database, name), objs in wanted.items():
+            ids = [obj['_id'] for _, obj in objs]
+            found = await self.connection[database][name].find(
+                {'_id': {'$in': ids}}, projection=['_id']).to_list(None)
+            found = set(doc['_id'] for doc in found)
+            for ref_class, obj in objs:
+                if obj['_id'] not in found:
+                    raise _missing_reference(ref_class, database, obj['_id'])
+                obj._prefetched = True
+
+    def _process_custom_type(self, target, doc, struct, path="", root_path=""):
+        # keep the referenced documents while the document is in its bson
+        # form (validation, size check, save...) so they are put back
+        # without any query
+        if doc is self and self.use_autorefs:
+            if target == 'bson':
+                self._references = dict(((obj.db.name, obj.collection.name, obj['_id']), obj)
+                                        for _, obj in self._iter_references() if '_id' in obj)
+            elif self._references:
+                def restore(value):
+                    if isinstance(value, DBRef):
+                        obj = self._references.get((value.database, value.collection, value.id))
+                        if obj is not None:
+                            obj._prefetched = True
+                            return obj
+                    return value
+                for path_, _ in _get_autoref_paths(self.__class__):
+                    _attach_refs(self, self.structure, path_.split('.'), restore)
+        return super(AsyncDocument, self)._process_custom_type(target, doc, struct, path, root_path)
+
+    def save(self, uuid=False, validate=None, *args, **kwargs):
+        """
+        coroutine saving the document, see :meth:`Document.save`.
+
+        The new referenced documents are saved first and the other ones
+        must exist in the database.
+        """
+        coroutine = self._save(uuid, validate, *args, **kwargs)
+        pending = _pending_saves.get()
+        if pending is not None:
+            pending.append(coroutine)
+        return coroutine
+
+    async def _save(self, uuid=False, validate=None, *args, **kwargs):
+        if self.use_autorefs:
+            await self._prepare_references()
+        pending = []
+        token = _pending_saves.set(pending)
+        try:
+            if validate is True or (validate is None and self.skip_validation is False):
+                self.validate(auto_migrate=False)
+            elif self.use_autorefs:
+                self._make_reference(self, self.structure)
+        finally:
+            _pending_saves.reset(token)
+        for coroutine in pending:
+            await coroutine
+        if '_id' not in self and uuid:
+            self['_id'] = str("%s-%s" % (self.__class__.__name__, uuid4()))
+        self._process_custom_type('bson', self, self.structure)
+        try:
+            if '_id' in self:
+                await self.collection.replace_one({'_id': self['_id']}, self, upsert=True, *args, **kwargs)
+            else:
+                await self.collection.insert_one(self, *args, **kwargs)
+        finally:
+            self._process_custom_type('python', self, self.structure)
+        self._prefetched = True
+        return self
+
+    async def delete(self):
+        await self.collection.delete_one({'_id': self['_id']})
+        if self.gridfs and self.gridfs.get('cascade'):
+            await delete_files(self.db, [self['_id']], inline_collection=self.gridfs.get('inline_collection'))
+
+    async def remove(self, query, *args, **kwargs):
+        # like Document.remove(), return {'n': removed, 'ok': 1.0}
+        if query is not None and not isinstance(query, Mapping):
+            query = {'_id': query}
+        if not (self.gridfs and self.gridfs.get('cascade')):
+            result = await self.collection.delete_many(query, *args, **kwargs)
+            return result.raw_result
+        docids = [doc['_id'] for doc in await self.collection.find(query, projection=['_id']).to_list(None)]
+        removed = 0
+        for batch in _batches(docids, DELETE_BATCH_SIZE):
+            result = await self.collection.delete_many({'_id': {'$in': batch}})
+            removed += result.deleted_count
+            await delete_files(self.db, batch, inline_collection=self.gridfs.get('inline_collection'))
+        return {'n': removed, 'ok': 1.0}
+
+    async def reload(self):
+        old_doc = await self.collection.find_one({'_id': self['_id']})
+        if not old_doc:
+            raise OperationFailure('Can not reload an unsaved document.'
+                                   ' %s is not found in the database' % self['_id'])
+        await resolve_references(self.collection, self.__class__, [old_doc])
+        self._process_custom_type('bson', self, self.structure)
+        self.update(DotedDict(old_doc))
+        self._process_custom_type('python', self, self.structure)
+
+
+class AsyncCursor(AsyncIOMotorCursor):
+    """
+    Motor cursor yielding document instances. The autorefs of the
+    documents of a batch are resolved together.
+
+    >>> async for doc in db.test.MyDoc.find():
+    ...     print(doc)
+    >>> docs = await db.test.MyDoc.find().to_list(100)
+    """
+    def __init__(self, cursor, collection, wrap=None):
+        super(AsyncCursor, self).__init__(cursor, collection)
+        self._wrap = wrap
+        self._wrapped = []
+
+    async def _wrap_sons(self, sons):
+        if self._wrap is None:
+            return sons
+        by_class = {}
+        registered = self.collection._registered_documents
+        for son in sons:
+            doc_class = self._wrap
+            if self._wrap.type_field in son and son[self._wrap.type_field] in registered:
+                doc_class = registered[son[self._wrap.type_field]]._obj_class
+            by_class.setdefault(doc_class, []).append(son)
+        for doc_class, class_sons in by_class.items():
+            await resolve_references(self.collection, doc_class, class_sons)
+        docs = []
+        for son in sons:
+            doc = wrap_document(self.collection, self._wrap, son)
+            doc._prefetched = True
+            docs.append(doc)
+        return docs
+
+    async def next(self):
+        if not self._wrapped:
+            if not (self.alive and (self._buffer_size() or await self._get_more())):
+                raise StopAsyncIteration
+            # wrap the whole batch received
+            data = self._data()
+            sons = [data.popleft() for _ in range(len(data))]
+            self._wrapped = await self._wrap_sons(sons)
+            self._wrapped.reverse()
+        return self._wrapped.pop()
+
+    __anext__ = next
+
+    async def to_list(self, length):
+        docs = []
+        while self._wrapped and (length is None or len(docs) < length):
+            docs.append(self._wrapped.pop())
+        if length is None or len(docs) < length:
+            sons = await super(AsyncCursor, self).to_list(None if length is None else length - len(docs))
+            docs.extend(await self._wrap_sons(sons))
+        return docs
+
+    def rewind(self):
+        self._wrapped = []
+        return super(AsyncCursor, self).rewind()
+
+    def clone(self):
+        return self.__class__(self.delegate.clone(), self.collection, wrap=self._wrap)
+
+
+class AsyncCommandCursor(object):
+    """
+    Wrap a Motor command cursor (ie the result of an aggregation) to yield
+    document instances.
+    """
+    def __init__(self, command_cursor, collection, wrap):
+        self._command_cursor = command_cursor
+        self._collection = collection
+        self._wrap = wrap
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        son = await self._command_cursor.next()
+        await resolve_references(self._collection, self._wrap, [son])
+        return wrap_document(self._collection, self._wrap, son)
+
+    next = __anext__
+
+    async def to_list(self, length):
+        sons = await self._command_cursor.to_list(length)
+        await resolve_references(self._collection, self._wrap, sons)
+        return [wrap_document(self._collection, self._wrap, son) for son in sons]
+
+    @property
+    def alive(self):
+        return self._command_cursor.alive
+
+    def batch_size(self, batch_size):
+        self._command_cursor.batch_size(batch_size)
+        return self
+
+    async def close(self):
+        await self._command_cursor.close()
+
+
+class AsyncCollection(CollectionMixin, AsyncIOMotorCollection):
+    def _new_collection(self, name):
+        return AsyncCollection(self.database, name)
+
+    def find(self, *args, **kwargs):
+        wrap = kwargs.pop('wrap', None)
+        return AsyncCursor(self.delegate.find(*args, **kwargs), self, wrap=wrap)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        wrap = kwargs.pop('wrap', None)
+        cursor = AsyncIOMotorCollection.aggregate(self, pipeline, *args, **kwargs)
+        if wrap is not None:
+            return AsyncCommandCursor(cursor, self, wrap)
+        return cursor
+
+    async def one(self, *args, **kwargs):
+        docs = await self.find(*args, **kwargs).limit(2).to_list(2)
+        if len(docs) > 1:
+            raise MultipleResultsFound("more than one result found")
+        elif docs:
+            return docs[0]
+
+    async def sample(self, k, filter=None, wrap=None):
+        pipeline = []
+        if filter:
+            pipeline.append({'$match': filter})
+        pipeline.append({'$sample': {'size': k}})
+        return await self.aggregate(pipeline, wrap=wrap).to_list(None)
+
+
+class AsyncDatabase(DatabaseMixin, AsyncIOMotorDatabase):
+    def _new_collection(self, name):
+        return AsyncCollection(self, name)
+
+
+class AsyncConnection(MongoPieConnection, AsyncIOMotorClient):
+    """
+    asyncio connection to MongoDB. No request is sent before the first
+    operation.
+    """
+    def register(self, obj_list):
+        decorator = None
+        if not isinstance(obj_list, Iterable):
+            decorator = obj_list
+            obj_list = [obj_list]
+        super(AsyncConnection, self).register([get_async_class(obj) for obj in obj_list])
+        return decorator
+
+    def _new_database(self, name):
+        return AsyncDatabase(self, name)
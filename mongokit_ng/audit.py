@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import logging
+import os
+import random
+import sys
+import threading
+from collections import deque
+
+from pymongo.errors import OperationFailure
+
+log = logging.getLogger(__name__)
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+COLLSCAN = 'COLLSCAN'
+IN_MEMORY_SORT = 'SORT'
+EXAMINED_RATIO = 'EXAMINED_RATIO'
+
+
+def get_call_site():
+    """
+    return the first frame of the stack which is not in mongokit_ng as a
+    "file:line in function" string
+    """
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename.startswith(_PACKAGE_DIR):
+        frame = frame.f_back
+    if frame is None:
+        return None
+    return "%s:%s in %s" % (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+
+
+def _iter_stages(plan):
+    if not plan:
+        return
+    if 'queryPlan' in plan:
+        # slot based execution engine
+        plan = plan['queryPlan']
+    yield plan.get('stage')
+    if 'inputStage' in plan:
+        for stage in _iter_stages(plan['inputStage']):
+            yield stage
+    for input_stage in plan.get('inputStages', []):
+        for stage in _iter_stages(input_stage):
+            yield stage
+
+
+class QueryAuditor(object):
+    """
+    Development tool which runs `explain()` on a sample of the queries
+    issued by the documents (`find`, `find_one`, `one`, `fetch` and
+    `fetch_one`) and flags the ones which don't use an index properly:
+
+    * ``COLLSCAN``: the query scans the whole collection
+    * ``SORT``: the results are sorted in memory
+    * ``EXAMINED_RATIO``: more than `max_examined_ratio` documents are
+      examined per document returned (and at least `min_examined`)
+
+    The auditor is enabled on a connection or on a document class:
+
+    >>> connection.query_auditor = QueryAuditor(sample_rate=0.1)
+    >>> class MyDoc(Document):
+    ...     query_auditor = QueryAuditor()
+
+    The explain is done when the cursor is first iterated so the sort and
+    limit set after `find()` are taken into account. Each audited query is
+    attributed to its document class, the method used and the first line
+    of the caller outside mongokit_ng.
+    """
+    def __init__(self, sample_rate=1.0, max_examined_ratio=10, min_examined=100, max_entries=1000):
+        self.sample_rate = sample_rate
+        self.max_examined_ratio = max_examined_ratio
+        self.min_examined = min_examined
+        self.entries = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def track(self, cursor, document_class, method):
+        """
+        mark `cursor` to be explained when it is first iterated if it is
+        part of the sample.
+        """
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return cursor
+        cursor._audit = (self, document_class.__name__, method, get_call_site())
+        return cursor
+
+    def audit(self, cursor, document_name, method, call_site=None):
+        """
+        explain `cursor` and record the result. Return the entry.
+        """
+        try:
+            explain = cursor.clone().explain()
+        except OperationFailure:
+            log.warning("can't explain the query of %s.%s at %s" % (document_name, method, call_site),
+                        exc_info=True)
+            return None
+        entry = self._analyze(explain)
+        entry.update({
+            'document': document_name,
+            'method': method,
+            'call_site': call_site,
+            'collection': cursor.collection.full_name,
+            'filter': cursor._Cursor__spec,
+            'sort': cursor._Cursor__ordering and dict(cursor._Cursor__ordering),
+        })
+        with self._lock:
+            self.entries.append(entry)
+        if entry['flags']:
+            log.warning("%s.%s at %s: %s (%s examined, %s returned) on %s" % (
+                document_name, method, call_site, ', '.join(entry['flags']), entry['examined'],
+                entry['returned'], entry['filter']))
+        return entry
+
+    def _analyze(self, explain):
+        stages = list(_iter_stages(explain.get('queryPlanner', {}).get('winningPlan')))
+        stats = explain.get('executionStats', {})
+        examined = stats.get('totalDocsExamined', 0)
+        returned = stats.get('nReturned', 0)
+        flags = []
+        if COLLSCAN in stages:
+            flags.append(COLLSCAN)
+        if IN_MEMORY_SORT in stages:
+            flags.append(IN_MEMORY_SORT)
+        if examined >= self.min_examined and examined > self.max_examined_ratio * max(returned, 1):
+            flags.append(EXAMINED_RATIO)
+        return {
+            'flags': flags,
+            'stages': stages,
+            'examined': examined,
+            'keys_examined': stats.get('totalKeysExamined', 0),
+            'returned': returned,
+        }
+
+    def report(self):
+        """
+        return the flagged queries grouped by document, method and call
+        site:
+
+        >>> auditor.report()
+        [{'document': 'MyDoc', 'method': 'find', 'call_site': 'app.py:12 in index',
+          'collection': 'test.mongokit', 'flags': ['COLLSCAN'], 'count': 3,
+          'max_examined': 1500, 'filter': {'foo': 1}, 'sort': None}]
+        """
+        with self._lock:
+            entries = list(self.entries)
+        report = {}
+        for entry in entries:
+            if not entry['flags']:
+                continue
+            key = (entry['document'], entry['method'], entry['call_site'])
+            if key not in report:
+                report[key] = {
+                    'document': entry['document'],
+                    'method': entry['method'],
+                    'call_site': entry['call_site'],
+                    'collection': entry['collection'],
+                    'flags': [],
+                    'count': 0,
+                    'max_examined': 0,
+                }
+            item = report[key]
+            item['count'] += 1
+            item['max_examined'] = max(item['max_examined'], entry['examined'])
+            item['flags'] = sorted(set(item['flags']) | set(entry['flags']))
+            item['filter'] = entry['filter']
+            item['sort'] = entry['sort']
+        return list(report.values())
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Bulk loading of documents, see :meth:`Document.bulk_load`.
+
+The records are validated and encoded to BSON by a pool of processes and
+the encoded batches are inserted by a pool of threads. Both pools are fed
+through bounded queues so a slow server slows down the reading of the
+records instead of filling the memory.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue
+from threading import Lock, Thread
+from uuid import uuid4
+
+from bson import BSON, ObjectId
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import BulkWriteError
+
+from .mongo_exceptions import MaxDocumentSizeError
+
+DEFAULT_BATCH_SIZE = 1000
+# same limit as Document._get_size_limit()
+SIZE_LIMIT = (15999999, '16MB')
+
+# classes used to validate the records without connection, by document class
+_loader_classes = {}
+
+
+class BulkLoadResult(object):
+    """
+    Outcome of :meth:`Document.bulk_load`: the number of `inserted`
+    documents and the `errors` as a list of (index of the record, error
+    message) sorted by index.
+    """
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []
+
+    def __repr__(self):
+        return "<BulkLoadResult inserted=%s errors=%s>" % (self.inserted, len(self.errors))
+
+
+def _get_size(self):
+    # the size is checked on the encoded document
+    return 0
+
+
+def _get_size_limit(self):
+    return SIZE_LIMIT
+
+
+def get_loader_class(doc_class):
+    """
+    return a subclass of `doc_class` which can be validated without
+    connection
+    """
+    loader_class = _loader_classes.get(doc_class)
+    if loader_class is None:
+        loader_class = _loader_classes[doc_class] = type(doc_class.__name__, (doc_class,), {
+            '__module__': doc_class.__module__,
+            'get_size': _get_size,
+            '_get_size_limit': _get_size_limit,
+        })
+    return loader_class
+
+
+def encode_batch(doc_class, records, start=0, uuid=False):
+    """
+    validate the `records` as `doc_class` documents and encode them. Return
+    the (index, bson data) of the valid ones and the (index, error message)
+    of the others, the index of the first record being `start`.
+    """
+    loader_class = get_loader_class(doc_class)
+    docs = []
+    errors = []
+    for index, record in enumerate(records, start):
+        try:
+            doc = loader_class(record)
+            if not doc.skip_validation:
+                doc.validate()
+            if '_id' not in doc:
+                # RawBSONDocument are inserted as is, the _id can't be added later
+                doc['_id'] = "%s-%s" % (doc_class.__name__, uuid4()) if uuid else ObjectId()
+            doc._process_custom_type('bson', doc, doc.structure)
+            data = BSON.encode(doc)
+            if len(data) > SIZE_LIMIT[0]:
+                raise MaxDocumentSizeError("The document size is too big, documents "
+                                           "lower than %s is allowed (got %s bytes)" % (SIZE_LIMIT[1], len(data)))
+        except Exception as e:
+            errors.append((index, "%s: %s" % (e.__class__.__name__, e)))
+        else:
+            docs.append((index, data))
+    return docs, errors
+
+
+def _iter_batches(records, batch_size):
+    batch = []
+    start = 0
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield start, batch
+            start += batch_size
+            batch = []
+    if batch:
+        yield start, batch
+
+
+def _write_batches(collection, queue, result, lock):
+    while True:
+        docs = queue.get()
+        if docs is None:
+            return
+        indexes = [index for index, _ in docs]
+        try:
+            collection.insert_many([RawBSONDocument(data) for _, data in docs], ordered=False)
+        except BulkWriteError as e:
+            inserted = e.details['nInserted']
+            errors = [(indexes[error['index']], error['errmsg']) for error in e.details['writeErrors']]
+        except Exception as e:
+            inserted = 0
+            errors = [(index, "%s: %s" % (e.__class__.__name__, e)) for index in indexes]
+        else:
+            inserted = len(docs)
+            errors = []
+        with lock:
+            result.inserted += inserted
+            result.errors.extend(errors)
+
+
+def bulk_load(document, records, processes=None, threads=4, batch_size=DEFAULT_BATCH_SIZE,
+              max_pending=None, uuid=False):
+    """
+    Insert the dicts of the iterable `records` as `document` (a document
+    bound to a collection) documents and return a :class:`BulkLoadResult`.
+    """
+    from .versioned_document import VersionedDocument
+    doc_class = document._obj_class
+    if doc_class.use_autorefs:
+        raise TypeError("%s: the documents with autorefs can't be bulk loaded" % doc_class.__name__)
+    if doc_class.migration_handler is not None:
+        raise TypeError("%s: the documents with a migration_handler can't be bulk loaded" % doc_class.__name__)
+    if issubclass(doc_class, VersionedDocument):
+        raise TypeError("%s: the versioned documents can't be bulk loaded" % doc_class.__name__)
+    processes = processes or os.cpu_count() or 1
+    # batches being encoded, and encoded batches waiting for a writer
+    max_pending = max_pending or 2 * max(processes, threads)
+    result = BulkLoadResult()
+    lock = Lock()
+    queue = Queue(max_pending)
+    writers = [Thread(target=_write_batches, args=(document.collection, queue, result, lock),
+                      name='mongokit-bulk-load', daemon=True) for _ in range(threads)]
+    for writer in writers:
+        writer.start()
+
+    def dispatch(future):
+        docs, errors = future.result()
+        if errors:
+            with lock:
+                result.errors.extend(errors)
+        if docs:
+            # blocks while the writers are behind
+            queue.put(docs)
+
+    try:
+        with ProcessPoolExecutor(processes) as executor:
+            pending = deque()
+            for start, batch in _iter_batches(records, batch_size):
+                pending.append(executor.submit(encode_batch, doc_class, batch, start, uuid))
+                if len(pending) >= max_pending:
+                    dispatch(pending.popleft())
+            while pending:
+                dispatch(pending.popleft())
+    finally:
+        for _ in writers:
+            queue.put(None)
+        for writer in writers:
+            writer.join()
+    result.errors.sort(key=lambda error: error[0])
+    return result
@@ -1,17 +1,309 @@
 # -*- coding: utf-8 -*-
 
-"""Console script for mongopie."""
+"""
+Operations command line of mongokit_ng (``pip install mongokit_ng[cli]``).
+
+The documents are imported from the modules given with ``--module``:
+
+    mongokit-ng -m myapp.models --uri mongodb://localhost sync-indexes --dry-run
+    mongokit-ng -m myapp.models migrate MyDocMigration MyDoc --resume
+    mongokit-ng -m myapp.models audit MyDoc --filter '{"foo": 1}' --sort '{"bar": -1}'
+    mongokit-ng -m myapp.models compact-revisions MyVersionedDoc --keep 5
+    mongokit-ng -m myapp.models profile-validation MyDoc --sample 500
+    mongokit-ng bench -- --save results.json
+
+The documents without ``__database__`` or ``__collection__`` use the
+``--database`` and ``--collection`` options.
+"""
+import importlib
+import inspect
 import sys
+
 import click
+from bson import json_util
+
+from . import profiling
+from .audit import QueryAuditor
+from .document import Document
+from .migration import DocumentMigration
+from .versioned_document import VersionedDocument
+
+MIGRATION_STATE_COLLECTION = 'mongokit_migrations'
+
+
+class Context(object):
+    """
+    state shared by the commands: the connection (created on first use)
+    and the documents and migrations found in the modules
+    """
+    def __init__(self, uri=None, database=None, collection=None, connection=None):
+        self.uri = uri
+        self.database = database
+        self.collection = collection
+        self._connection = connection
+        self._registered = False
+        self.documents = {}
+        self.migrations = {}
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            if self.uri == 'mock':
+                from .mock import MockConnection
+                self._connection = MockConnection()
+            else:
+                from .connection import Connection
+                self._connection = Connection(self.uri)
+        if not self._registered:
+            self._connection.register(list(self.documents.values()))
+            self._registered = True
+        return self._connection
+
+    def load_module(self, name):
+        try:
+            module = importlib.import_module(name)
+        except ImportError as e:
+            raise click.BadParameter("can't import %s: %s" % (name, e), param_hint='--module')
+        for obj in vars(module).values():
+            if not inspect.isclass(obj) or obj.__module__ != module.__name__:
+                continue
+            if issubclass(obj, Document):
+                self.documents[obj.__name__] = obj
+            elif issubclass(obj, DocumentMigration):
+                self.migrations[obj.__name__] = obj
+
+    def get_documents(self, names, base=Document):
+        """
+        return the document classes called `names`, or all of them
+        """
+        if not names:
+            return [doc for name, doc in sorted(self.documents.items()) if issubclass(doc, base)]
+        documents = []
+        for name in names:
+            doc = self.documents.get(name)
+            if doc is None or not issubclass(doc, base):
+                raise click.BadParameter("no %s called %s in the modules" % (base.__name__, name))
+            documents.append(doc)
+        return documents
+
+    def get_collection(self, doc):
+        database = getattr(doc, '__database__', None) or self.database
+        collection = getattr(doc, '__collection__', None) or self.collection
+        if not database or not collection:
+            raise click.UsageError("%s has no __database__ or __collection__, use --database "
+                                   "and --collection" % doc.__name__)
+        return self.connection[database][collection]
+
+    def get_callable(self, doc):
+        return getattr(self.get_collection(doc), doc.__name__)
+
+
+pass_context = click.make_pass_decorator(Context)
+
+
+def _parse_json(value, param_hint):
+    if value is None:
+        return None
+    try:
+        return json_util.loads(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint=param_hint)
+
+
+@click.group()
+@click.option('--uri', envvar='MONGOKIT_URI', help='MongoDB uri (MONGOKIT_URI)')
+@click.option('--module', '-m', 'modules', multiple=True, help='module defining the documents')
+@click.option('--database', help='database of the documents without __database__')
+@click.option('--collection', help='collection of the documents without __collection__')
+@click.pass_context
+def main(ctx, uri, modules, database, collection):
+    """Operations on the documents of a mongokit_ng application."""
+    if ctx.obj is None:
+        ctx.obj = Context(uri, database, collection)
+    else:
+        ctx.obj.database = database or ctx.obj.database
+        ctx.obj.collection = collection or ctx.obj.collection
+    for module in modules:
+        ctx.obj.load_module(module)
+
+
+@main.command('sync-indexes')
+@click.argument('documents', nargs=-1)
+@click.option('--dry-run', is_flag=True, help='only show what would be done')
+@click.option('--drop', is_flag=True, help='drop the conflicting and stale indexes')
+@pass_context
+def sync_indexes(context, documents, dry_run, drop):
+    """Create the declared indexes of DOCUMENTS (all by default).
+
+    The documents declaring no index are synchronized too: all the indexes
+    of their collection but _id_ are stale.
+    """
+    for doc in context.get_documents(documents):
+        try:
+            collection = context.get_collection(doc)
+        except click.UsageError:
+            # only the documents given by name need a collection
+            if documents:
+                raise
+            continue
+        plan = doc.sync_indexes(collection, dry_run=dry_run, drop=drop)
+        for action in ('create', 'drop', 'conflict', 'stale'):
+            for name in plan[action]:
+                click.echo("%s %s: %s %s" % (doc.__name__, collection.full_name, action, name))
+        if not any(plan[action] for action in ('create', 'drop', 'conflict', 'stale')):
+            click.echo("%s %s: up to date" % (doc.__name__, collection.full_name))
+
+
+@main.command()
+@click.argument('migration')
+@click.argument('document')
+@click.option('--resume', is_flag=True, help='continue an interrupted migration')
+@click.option('--batch-size', default=100, show_default=True,
+              help='documents migrated between two saves of the progress')
+@pass_context
+def migrate(context, migration, document, resume, batch_size):
+    """Run the MIGRATION of the DOCUMENT collection.
+
+    The ``allmigration`` methods are run first, then the ``migration``
+    ones on each document, by ``_id`` order. The progress is stored in the
+    mongokit_migrations collection so --resume skips what is already done.
+    """
+    migration_class = context.migrations.get(migration)
+    if migration_class is None:
+        raise click.BadParameter("no DocumentMigration called %s in the modules" % migration)
+    doc = context.get_documents([document])[0]
+    collection = context.get_collection(doc)
+    state_collection = collection.database[MIGRATION_STATE_COLLECTION]
+    state_id = '%s:%s' % (migration, collection.name)
+    state = resume and state_collection.find_one({'_id': state_id}) or {}
+    if not resume:
+        state_collection.delete_one({'_id': state_id})
+    if state.get('finished'):
+        click.echo("%s is already done on %s" % (migration, collection.full_name))
+        return
+
+    def save_state(**fields):
+        state_collection.update_one({'_id': state_id}, {'$set': fields}, upsert=True)
+
+    def done(method_name):
+        state_collection.update_one({'_id': state_id}, {'$addToSet': {'allmigrations': method_name}},
+                                    upsert=True)
+        click.echo("%s.%s done" % (migration, method_name))
+
+    migrator = migration_class(doc)
+    migrator.migrate_all(collection, skip=state.get('allmigrations', ()), callback=done)
+
+    if any(name.startswith('migration') for name in dir(migrator)):
+        spec = {}
+        if state.get('last_id') is not None:
+            spec = {'_id': {'$gt': state['last_id']}}
+        cursor = context.get_callable(doc).find(spec).sort('_id', 1)
+        count = 0
+        with click.progressbar(length=collection.count_documents(spec),
+                               label='migrating %s' % collection.full_name) as bar:
+            for obj in cursor:
+                migrator.migrate(obj)
+                count += 1
+                bar.update(1)
+                if count % batch_size == 0:
+                    save_state(last_id=obj['_id'])
+    save_state(finished=True)
+    click.echo("%s done on %s" % (migration, collection.full_name))
+
+
+@main.command()
+@click.argument('document')
+@click.option('--filter', 'filter_', help='query as extended json')
+@click.option('--sort', help='sort as extended json, like {"foo": -1}')
+@click.option('--limit', default=0, help='limit of the query')
+@click.option('--max-examined-ratio', default=10, show_default=True,
+              help='documents examined per document returned above which the query is flagged')
+@click.option('--min-examined', default=100, show_default=True)
+@pass_context
+def audit(context, document, filter_, sort, limit, max_examined_ratio, min_examined):
+    """Explain a query of DOCUMENT and flag a bad use of the indexes."""
+    doc = context.get_documents([document])[0]
+    auditor = QueryAuditor(max_examined_ratio=max_examined_ratio, min_examined=min_examined)
+    cursor = context.get_callable(doc).find(_parse_json(filter_, '--filter'))
+    sort = _parse_json(sort, '--sort')
+    if sort:
+        cursor = cursor.sort(list(sort.items()))
+    if limit:
+        cursor = cursor.limit(limit)
+    entry = auditor.audit(cursor, doc.__name__, 'find', call_site='cli')
+    if entry is None:
+        raise click.ClickException("can't explain the query")
+    click.echo("stages: %s" % ' > '.join(entry['stages']))
+    click.echo("examined: %s documents, %s keys, %s returned" % (
+        entry['examined'], entry['keys_examined'], entry['returned']))
+    click.echo("flags: %s" % (', '.join(entry['flags']) or 'none'))
+    if entry['flags']:
+        sys.exit(1)
+
+
+@main.command('compact-revisions')
+@click.argument('documents', nargs=-1)
+@click.option('--keep', default=10, show_default=True, help='revisions kept per document')
+@click.option('--compact', is_flag=True, help='run the compact command on the revision collections')
+@pass_context
+def compact_revisions(context, documents, keep, compact):
+    """Delete the old revisions of the VersionedDocuments DOCUMENTS (all by default)."""
+    for doc in context.get_documents(documents, base=VersionedDocument):
+        collection = context.get_collection(doc)
+        deleted = doc.compact_revisions(collection, keep=keep)
+        click.echo("%s: %s revisions deleted from versioned_%s" % (doc.__name__, deleted, collection.name))
+        if compact:
+            collection.database.command('compact', 'versioned_%s' % collection.name)
+
+
+@main.command('profile-validation')
+@click.argument('documents', nargs=-1)
+@click.option('--sample', default=100, show_default=True, help='documents validated per class')
+@click.option('--top', default=10, show_default=True, help='slowest paths shown per class')
+@pass_context
+def profile_validation(context, documents, sample, top):
+    """Profile the validation of a sample of real DOCUMENTS (all by default)."""
+    for doc in context.get_documents(documents):
+        objs = context.get_callable(doc).sample(sample)
+        if not objs:
+            click.echo("%s: no document" % doc.__name__)
+            continue
+        profiling.reset()
+        profiling.enable()
+        try:
+            errors = 0
+            for obj in objs:
+                try:
+                    obj.validate()
+                except Exception:
+                    errors += 1
+        finally:
+            profiling.disable()
+        stats = profiling.snapshot(top_paths=None)
+        click.echo("%s: %s documents, %s invalid" % (doc.__name__, len(objs), errors))
+        for phase in stats['phases']:
+            if phase['document'] == doc.__name__:
+                click.echo("    %-20s %10.3f ms/doc" % (phase['phase'], phase['total_ms'] / len(objs)))
+        paths = [path for path in stats['validation_paths'] if path['document'] == doc.__name__]
+        for path in paths[:top]:
+            click.echo("    %-40s %10.3f ms/doc" % (path['path'], path['total_ms'] / len(objs)))
+    profiling.reset()
 
 
-@click.command()
-def main(args=None):
-    """Console script for mongopie."""
-    click.echo("Replace this message by putting your code into "
-               "mongopie.cli.main")
-    click.echo("See click documentation at https://click.palletsprojects.com/")
-    return 0
+@main.command(context_settings={'ignore_unknown_options': True})
+@click.option('--load', is_flag=True, help='run the load harness instead of the micro-benchmarks')
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def bench(load, args):
+    """Run the benchmarks of the source tree with ARGS."""
+    try:
+        if load:
+            from benchmarks.load import main as bench_main
+        else:
+            from benchmarks.__main__ import main as bench_main
+    except ImportError:
+        raise click.ClickException("the benchmarks are not installed, run the command "
+                                   "from the root of the mongokit_ng source tree")
+    sys.exit(bench_main(list(args)))
 
 
 if __name__ == "__main__":
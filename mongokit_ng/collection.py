@@ -1,11 +1,14 @@
-import random
 import warnings
 
 from pymongo.collection import Collection as PymongoCollection
 from .mongo_exceptions import MultipleResultsFound
-from .cursor import Cursor
+from .cursor import Cursor, CommandCursor
 
-class Collection(PymongoCollection):
+class CollectionMixin(object):
+    """
+    Document registration and wrapping on top of a collection class of a
+    backend (pymongo or the in-memory one of :mod:`mongokit_ng.mock`).
+    """
     def __init__(self, *args, **kwargs):
         self._documents = {}
         self._collections = {}
@@ -29,28 +32,32 @@ class Collection(PymongoCollection):
         else:
             newkey = "%s.%s" % (self.name, key)
             if not newkey in self._collections:
-                self._collections[newkey] = Collection(self.database, newkey)
+                self._collections[newkey] = self._new_collection(newkey)
             return self._collections[newkey]
 
     def __getitem__(self, key):
         return self.__getattr__(key)
 
     def __call__(self, *args, **kwargs):
-        if "." not in self.__name:
+        if "." not in self.name:
             raise TypeError("'Collection' object is not callable. If you "
                             "meant to call the '%s' method on a 'Database' "
                             "object it is failing because no such method "
                             "exists." %
-                            self.__name)
-        name = self.__name.split(".")[-1]
+                            self.name)
+        name = self.name.split(".")[-1]
         raise TypeError("'Collection' object is not callable. "
                         "If you meant to call the '%s' method on a 'Collection' "
                         "object it is failing because no such method exists.\n"
                         "If '%s' is a Document then you may have forgotten to "
                         "register it to the connection." % (name, name))
 
-    def find(self, *args, **kwargs):
-        return Cursor(self, *args, **kwargs)
+    def aggregate(self, pipeline, *args, **kwargs):
+        wrap = kwargs.pop('wrap', None)
+        cursor = super().aggregate(pipeline, *args, **kwargs)
+        if wrap is not None:
+            return CommandCursor(cursor, self, wrap)
+        return cursor
     
     def find_and_modify(self, *args, **kwargs):
         obj_class = kwargs.pop('wrap', None)
@@ -64,18 +71,58 @@ class Collection(PymongoCollection):
 
 
     def one(self, *args, **kwargs):
-        bson_obj = self.find(*args, **kwargs)
-        count = bson_obj.count()
-        if count > 1:
-            raise MultipleResultsFound("%s results found" % count)
-        elif count == 1:
-            return next(bson_obj)
+        docs = list(self.find(*args, **kwargs).limit(2))
+        if len(docs) > 1:
+            raise MultipleResultsFound("more than one result found")
+        elif docs:
+            return docs[0]
+
+    def sample(self, k, filter=None, wrap=None):
+        """
+        return a list of `k` random documents (or less if there is not
+        enough documents) matching `filter`, using the `$sample` stage.
+        """
+        pipeline = []
+        if filter:
+            pipeline.append({'$match': filter})
+        pipeline.append({'$sample': {'size': k}})
+        return list(self.aggregate(pipeline, wrap=wrap))
 
     def find_random(self):
-        max = self.count()
-        if max:
-            num = random.randint(0, max-1)
-            return next(self.find().skip(num))
+        docs = self.sample(1)
+        if docs:
+            return docs[0]
     
-    def find_fulltext(self, search, **kwargs):
-        return self.database.command("text", self.name, search=search, **kwargs)
+    def find_fulltext(self, search, filter=None, projection=None, language=None,
+                      score_field='score', **kwargs):
+        """
+        return a cursor on the documents matching the `$text` query `search`
+        sorted by relevance. The score is returned in `score_field`.
+        """
+        spec, projection, sort = self._fulltext_query(search, filter, projection, language, score_field)
+        return self.find(spec, projection, **kwargs).sort(sort)
+
+    def _fulltext_query(self, search, filter, projection, language, score_field):
+        # the (filter, projection, sort) of a $text query
+        spec = dict(filter or {})
+        spec['$text'] = {'$search': search}
+        if language is not None:
+            spec['$text']['$language'] = language
+        score = {'$meta': 'textScore'}
+        if score_field is not None:
+            if projection is None:
+                projection = {}
+            elif not isinstance(projection, dict):
+                projection = dict((field, 1) for field in projection)
+            else:
+                projection = dict(projection)
+            projection[score_field] = score
+        return spec, projection, [(score_field or 'score', score)]
+
+
+class Collection(CollectionMixin, PymongoCollection):
+    def _new_collection(self, name):
+        return Collection(self.database, name)
+
+    def find(self, *args, **kwargs):
+        return Cursor(self, *args, **kwargs)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Columnar export of query results, see :meth:`Cursor.to_columns`.
+
+The raw documents of each batch received are read field by field into
+typed arrays, the documents are never instantiated. The types are taken
+from the structure of the document: int, float, bool, datetime and str
+fields get typed arrays, the other fields get arrays of objects. The
+values stored with another type than the one of the structure are read
+as missing values.
+"""
+import datetime
+
+try:
+    import numpy
+except ImportError:  # optional
+    numpy = None
+try:
+    import pyarrow
+except ImportError:  # optional
+    pyarrow = None
+
+from .schema_document import CustomType
+
+BACKENDS = ('numpy', 'arrow')
+TYPED_FIELDS = (int, float, bool, datetime.datetime, str)
+
+
+def get_field_types(doc_class, fields):
+    """
+    return the type of the `fields` of `doc_class`, None for the fields
+    which aren't int, float, bool, datetime or str.
+    """
+    collapsed_struct = doc_class._collapsed_struct if doc_class is not None else {}
+    types = []
+    for field in fields:
+        field_type = collapsed_struct.get(field)
+        # the custom types are read as stored
+        if isinstance(field_type, CustomType):
+            field_type = field_type.mongo_type
+        types.append(field_type if field_type in TYPED_FIELDS else None)
+    return types
+
+
+def _get_getter(field):
+    bits = field.split('.')
+    if len(bits) == 1:
+        return lambda son: son.get(field)
+
+    def getter(son):
+        for bit in bits:
+            if not isinstance(son, dict):
+                return None
+            son = son.get(bit)
+        return son
+    return getter
+
+
+_INT64_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+
+def _matches(value, field_type):
+    # bool is a subclass of int but isn't a number here
+    if field_type is int:
+        return (isinstance(value, int) and not isinstance(value, bool) and
+                _INT64_RANGE[0] <= value <= _INT64_RANGE[1])
+    if field_type is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, field_type)
+
+
+def _mask_mistyped(values, field_type):
+    # the values of another type than the structure's are read as missing
+    if field_type is None:
+        return values
+    return [value if value is None or _matches(value, field_type) else None for value in values]
+
+
+def _to_utc(value):
+    # naive UTC datetimes, as returned by a client without tz_aware
+    if value is not None and value.tzinfo is not None:
+        return (value - value.utcoffset()).replace(tzinfo=None)
+    return value
+
+
+class NumpyColumn(object):
+    # (dtype, value stored under the mask)
+    dtypes = {
+        int: ('int64', 0),
+        float: ('float64', float('nan')),
+        bool: ('bool', False),
+        datetime.datetime: ('datetime64[ms]', None),
+        str: (object, None),
+        None: (object, None),
+    }
+
+    def __init__(self, field_type):
+        self.field_type = field_type
+        self.dtype, self.fill_value = self.dtypes[field_type]
+        self.chunks = []
+        self.masks = []
+
+    def append(self, values):
+        values = _mask_mistyped(values, self.field_type)
+        mask = numpy.fromiter((value is None for value in values), bool, len(values))
+        if self.field_type is datetime.datetime:
+            values = [_to_utc(value) for value in values]
+        elif self.fill_value is not None and mask.any():
+            values = [self.fill_value if value is None else value for value in values]
+        if self.dtype is object:
+            # numpy.array() would make a 2-dimensional array of a list of
+            # lists of the same length
+            chunk = numpy.empty(len(values), dtype=object)
+            for no, value in enumerate(values):
+                chunk[no] = value
+        else:
+            chunk = numpy.array(values, dtype=self.dtype)
+        self.chunks.append(chunk)
+        self.masks.append(mask)
+
+    def finish(self):
+        if not self.chunks:
+            return numpy.ma.MaskedArray(numpy.array([], dtype=self.dtype), mask=numpy.array([], bool))
+        return numpy.ma.MaskedArray(numpy.concatenate(self.chunks), mask=numpy.concatenate(self.masks))
+
+
+class ArrowColumn(object):
+    def __init__(self, field_type):
+        self.field_type = field_type
+        self.type = {
+            int: pyarrow.int64(),
+            float: pyarrow.float64(),
+            bool: pyarrow.bool_(),
+            datetime.datetime: pyarrow.timestamp('ms'),
+            str: pyarrow.string(),
+        }.get(field_type)
+        self.chunks = []
+
+    def append(self, values):
+        values = _mask_mistyped(values, self.field_type)
+        if self.field_type is datetime.datetime:
+            values = [_to_utc(value) for value in values]
+        if self.type is None:
+            # the type is inferred once all the values are known
+            self.chunks.append(values)
+        else:
+            self.chunks.append(pyarrow.array(values, type=self.type))
+
+    def finish(self):
+        if self.type is None:
+            values = [value for chunk in self.chunks for value in chunk]
+            try:
+                return pyarrow.array(values)
+            except (pyarrow.ArrowException, TypeError, ValueError):
+                # ie ObjectId
+                return pyarrow.array([None if value is None else str(value) for value in values])
+        return pyarrow.chunked_array(self.chunks, type=self.type)
+
+
+def to_columns(batches, fields, types, backend='numpy'):
+    """
+    read the `fields` of the raw documents of `batches` (an iterable of
+    lists of documents) into a dict of numpy masked arrays (the mask being
+    True for the missing and null values) or into a pyarrow Table.
+    """
+    if backend == 'numpy':
+        if numpy is None:
+            raise ImportError("can't import numpy. Please install it before continuing.")
+        column_class = NumpyColumn
+    elif backend == 'arrow':
+        if pyarrow is None:
+            raise ImportError("can't import pyarrow. Please install it before continuing.")
+        column_class = ArrowColumn
+    else:
+        raise ValueError("backend must be one of %s not %r" % (', '.join(BACKENDS), backend))
+    getters = [_get_getter(field) for field in fields]
+    columns = [column_class(field_type) for field_type in types]
+    for batch in batches:
+        for getter, column in zip(getters, columns):
+            column.append([getter(son) for son in batch])
+    arrays = [column.finish() for column in columns]
+    if backend == 'arrow':
+        return pyarrow.Table.from_arrays(arrays, names=list(fields))
+    return dict(zip(fields, arrays))
@@ -2,6 +2,7 @@ from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 from pymongo.read_preferences import ReadPreference
 from .database import Database
+from .monitoring import CommandMonitor
 from collections.abc import Iterable
 import warnings
 class CallableMixin(object):
@@ -15,9 +16,15 @@ class CallableMixin(object):
         )
 
 class MongoPieConnection:
+    # a QueryAuditor used by all the documents of the connection
+    query_auditor = None
+
     def __init__(self, *args, **kwargs):
         self._databases = dict()
         self._registered_documents = dict()
+        # the monitors listening to this connection, see get_comment()
+        self._command_monitors = [listener for listener in kwargs.get('event_listeners') or []
+                                  if isinstance(listener, CommandMonitor)]
         super().__init__(*args, **kwargs)
 
     def register(self, obj_list):
@@ -55,11 +62,14 @@ class MongoPieConnection:
                                      "You cannot specify the `__database__` attribute without "
                                      "the `__collection__` attribute" % key)
         if key not in self._databases:
-            self._databases[key] = Database(self, key)
+            self._databases[key] = self._new_database(key)
         return self._databases[key]
 
     def __getitem__(self, key):
         return self.__getattr__(key)
+
+    def _new_database(self, name):
+        return Database(self, name)
         
 class Connection(MongoPieConnection, MongoClient):
     def __init__(self, *args, **kwargs):
@@ -25,49 +25,512 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+from bson.dbref import DBRef
+from bson.son import SON
 from pymongo.cursor import Cursor as PymongoCursor
 from collections import deque
+from queue import Queue, Empty
+from threading import Event, Thread
+from time import perf_counter
 
-class Cursor(PymongoCursor):
-    def __init__(self, *args, **kwargs):
-        self.__wrap = None
-        if kwargs:
-            self.__wrap = kwargs.pop('wrap', None)
-        super(Cursor, self).__init__(*args, **kwargs)
+from .columns import get_field_types, to_columns
+from .monitoring import tag, is_enabled, get_comment
+from .mongo_exceptions import AutoReferenceError
+from .profiling import record, _state as _profiling
+
+_autoref_paths = {}
+
+
+def wrap_document(collection, wrap, son):
+    """
+    wrap the raw document `son` into the `wrap` document class, or into
+    the registered document named by its `type_field` if any.
+    """
+    if _profiling.enabled:
+        start = perf_counter()
+        doc = _wrap_document(collection, wrap, son)
+        record(doc.__class__.__name__, 'wrap', perf_counter() - start)
+        return doc
+    return _wrap_document(collection, wrap, son)
+
+
+def _wrap_document(collection, wrap, son):
+    if wrap.type_field in son:
+        return getattr(collection, son[wrap.type_field])(son)
+    return wrap(son, collection=collection)
+
+
+class CommandCursor(object):
+    """
+    Wrap a pymongo CommandCursor (ie the result of an aggregation) to yield
+    document instances. Results are still streamed batch by batch.
+    """
+    def __init__(self, command_cursor, collection, wrap):
+        self._command_cursor = command_cursor
+        self._collection = collection
+        self._wrap = wrap
+
+    def __iter__(self):
+        return self
 
     def __next__(self):
+        return wrap_document(self._collection, self._wrap, next(self._command_cursor))
+
+    next = __next__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def alive(self):
+        return self._command_cursor.alive
+
+    @property
+    def cursor_id(self):
+        return self._command_cursor.cursor_id
+
+    def batch_size(self, batch_size):
+        self._command_cursor.batch_size(batch_size)
+        return self
+
+    def close(self):
+        self._command_cursor.close()
+
+
+def _dbref_id(expr):
+    """
+    aggregation expression extracting the `$id` of the DBRef at `expr`
+    """
+    return {'$arrayElemAt': [{'$map': {
+        'input': {'$filter': {
+            'input': {'$objectToArray': expr},
+            'as': 'ref',
+            'cond': {'$eq': ['$$ref.k', {'$literal': '$id'}]}}},
+        'as': 'ref',
+        'in': '$$ref.v'}}, 0]}
+
+
+def _get_ref_class(struct, path):
+    from .document import R
+    from .schema_document import SchemaProperties
+    if isinstance(struct, R):
+        return struct._doc
+    if isinstance(struct, SchemaProperties):
+        return struct
+    raise ValueError("%s is not an autoref field" % path)
+
+
+def _ref_ids_expression(struct, bits, path, expr='$', depth=0):
+    """
+    return the referenced document class found at `path` in `struct` and
+    an aggregation expression evaluating to the list of the ids it holds
+    """
+    key, rest = bits[0], bits[1:]
+    if not isinstance(struct, dict) or key not in struct:
+        raise ValueError("%s is not an autoref field" % path)
+    field = expr + key if expr == '$' else '%s.%s' % (expr, key)
+    sub_struct = struct[key]
+    if isinstance(sub_struct, list) and sub_struct:
+        var = 'prefetch%s' % depth
+        if rest:
+            ref_class, ids = _ref_ids_expression(sub_struct[0], rest, path, '$$' + var, depth + 1)
+        else:
+            ref_class, ids = _get_ref_class(sub_struct[0], path), [_dbref_id('$$' + var)]
+        # flatten the lists of ids of each item
+        return ref_class, {'$reduce': {
+            'input': {'$map': {'input': {'$ifNull': [field, []]}, 'as': var, 'in': ids}},
+            'initialValue': [],
+            'in': {'$concatArrays': ['$$value', '$$this']}}}
+    if rest:
+        return _ref_ids_expression(sub_struct, rest, path, field, depth)
+    return _get_ref_class(sub_struct, path), [_dbref_id(field)]
+
+
+def _attach_refs(doc, struct, bits, resolve):
+    key, rest = bits[0], bits[1:]
+    if not isinstance(doc, dict) or doc.get(key) is None:
+        return
+    sub_struct = struct[key]
+    if isinstance(sub_struct, list):
+        if rest:
+            for item in doc[key]:
+                _attach_refs(item, sub_struct[0], rest, resolve)
+        else:
+            doc[key] = [resolve(value) for value in doc[key]]
+    elif rest:
+        _attach_refs(doc[key], sub_struct, rest, resolve)
+    else:
+        doc[key] = resolve(doc[key])
+
+
+def _get_autoref_paths(doc_class):
+    """
+    return the (path, referenced class) of the autoref fields of
+    `doc_class`
+    """
+    paths = _autoref_paths.get(doc_class)
+    if paths is None:
+        paths = _autoref_paths[doc_class] = list(_iter_autoref_paths(doc_class.structure))
+    return paths
+
+
+def _iter_autoref_paths(struct, path=''):
+    from .document import R
+    from .schema_document import SchemaProperties
+    for key, value in struct.items():
+        if not isinstance(key, str):
+            continue
+        new_path = '%s.%s' % (path, key) if path else key
+        if isinstance(value, list) and value:
+            value = value[0]
+        if isinstance(value, (R, SchemaProperties)):
+            yield new_path, _get_ref_class(value, new_path)
+        elif isinstance(value, dict):
+            for item in _iter_autoref_paths(value, new_path):
+                yield item
+
+
+def _get_ref_database(dbref, fallback):
+    if dbref.database:
+        return dbref.database
+    if fallback is None:
+        raise RuntimeError("It appears that you try to use autorefs. I found a DBRef without"
+                           " database specified.\n If you do want to use the current database, you"
+                           " have to add the attribute `force_autorefs_current_db` as True."
+                           " The DBRef without database is : %s " % dbref)
+    return fallback
+
+
+def _missing_reference(ref_class, database, _id):
+    return AutoReferenceError('Something wrong append. You probably change'
+                              ' your object when passing it as a value to an autorefs enable document.\n'
+                              'A document with id "%s" is not saved in the database "%s" but was giving as'
+                              ' a reference to a %s document' % (_id, database, ref_class.__name__))
+
+
+class PrefetchCursor(CommandCursor):
+    """
+    CommandCursor returned by :meth:`Cursor.prefetch`. The documents joined
+    by the `$lookup` stages are attached to the autoref fields before the
+    results are wrapped.
+    """
+    def __init__(self, command_cursor, collection, wrap, prefetch):
+        super(PrefetchCursor, self).__init__(command_cursor, collection, wrap)
+        self._prefetch = prefetch
+
+    def __next__(self):
+        son = next(self._command_cursor)
+        for no, (path, ref_class, target) in enumerate(self._prefetch):
+            found = dict((doc['_id'], doc) for doc in son.pop('_prefetch_%s' % no, []))
+            _attach_refs(son, self._wrap.structure, path.split('.'),
+                         self._get_resolver(found, ref_class, target))
+        return wrap_document(self._collection, self._wrap, son)
+
+    next = __next__
+
+    def _get_resolver(self, found, ref_class, target):
+        db_name = target.database.name
+
+        def resolve(value):
+            # references living elsewhere are left to R.to_python()
+            if isinstance(value, DBRef) and value.collection == target.name \
+              and value.database in (None, db_name) and value.id in found:
+                obj = ref_class(found[value.id], collection=target)
+                obj._prefetched = True
+                return obj
+            return value
+        return resolve
+
+
+class BatchPrefetcher(Thread):
+    """
+    Thread fetching the batches of `cursor` ahead of its consumer. At most
+    `max_batches` batches wait in the queue, the thread blocks until the
+    consumer takes one. The server cursor is closed by the thread when it
+    is exhausted or stopped.
+    """
+    def __init__(self, cursor, max_batches):
+        super(BatchPrefetcher, self).__init__(name='mongokit-prefetch', daemon=True)
+        self._cursor = cursor
+        self._queue = Queue(max_batches)
+        self._stop_event = Event()
+
+    def run(self):
+        cursor = self._cursor
+        try:
+            while not self._stop_event.is_set():
+                if not cursor._refresh():
+                    break
+                batch, cursor._Cursor__data = cursor._Cursor__data, deque()
+                self._queue.put(batch)
+            if not self._stop_event.is_set():
+                self._queue.put(None)
+        except Exception as e:
+            if not self._stop_event.is_set():
+                self._queue.put(e)
+        finally:
+            cursor.close()
+
+    def get(self):
+        """
+        return the next batch, None if the cursor is exhausted
+        """
+        batch = self._queue.get()
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    def stop(self, wait=True):
+        self._stop_event.set()
+        # make room in the queue so the thread doesn't stay blocked
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Empty:
+                break
+        if wait:
+            self.join()
+
+
+class CursorMixin(object):
+    """
+    Methods shared by :class:`Cursor` and the cursor of the in-memory
+    backend (see :mod:`mongokit_ng.mock`). The raw documents are read batch
+    by batch: `_refresh()` appends the next batch to `_Cursor__data` and
+    returns the number of documents available, 0 once the cursor is
+    exhausted.
+    """
+    # set by QueryAuditor.track()
+    _audit = None
+    # (document name, method) used by CommandMonitor
+    _tag = None
+    # number of batches fetched ahead, see prefetch_batches()
+    _prefetch_batches = None
+    _prefetcher = None
+    # the document class of the results, None for raw documents
+    _wrap = None
+
+    def __next__(self):
+        self._run_audit()
         if self._Cursor__empty:
             raise StopIteration
-        if len(self.__data) or self._refresh():
+        if len(self._Cursor__data) or self._refresh():
             if isinstance(self._Cursor__data, deque):
                 item = self._Cursor__data.popleft()
             else:
                 item = self._Cursor__data.pop(0)
 
-            return self.__manipulate_item(item)
+            return self._wrap_son(item)
 
         else:
             raise StopIteration
 
+    next = __next__
+
     def __getitem__(self, index):
         # This will be a cursor if `index` is a slice
-        item_or_cursor = super(Cursor, self).__getitem__(index)
+        item_or_cursor = super(CursorMixin, self).__getitem__(index)
 
         if isinstance(item_or_cursor, dict):
-            return self.__manipulate_item(item_or_cursor)
+            return self._wrap_son(item_or_cursor)
         else:
             return item_or_cursor
 
-    def __manipulate_item(self, item):
+    def _wrap_son(self, son):
+        if self._wrap is not None:
+            return wrap_document(self.collection, self._wrap, son)
+        return son
+
+    def _run_audit(self):
+        if self._audit is not None:
+            audit, self._audit = self._audit, None
+            audit[0].audit(self, *audit[1:])
+
+    def _refresh_prefetched(self):
+        data = self._Cursor__data
+        if len(data) or self._Cursor__killed:
+            return len(data)
+        if self._prefetcher is None:
+            # the query is run by a clone owned by the background thread
+            cursor = self.clone()
+            cursor._tag = self._tag
+            self._prefetcher = BatchPrefetcher(cursor, self._prefetch_batches)
+            self._prefetcher.start()
+        try:
+            batch = self._prefetcher.get()
+        except Exception:
+            self._stop_prefetching()
+            raise
+        if batch is None:
+            self._stop_prefetching()
+            return 0
+        data.extend(batch)
+        return len(data)
+
+    def _stop_prefetching(self, wait=True):
+        if self._prefetcher is not None:
+            self._Cursor__killed = True
+            self._prefetcher.stop(wait=wait)
+            self._prefetcher = None
+
+    def prefetch_batches(self, n=1):
+        """
+        Fetch up to `n` batches ahead on a background thread while the
+        current one is processed, so the getMore round trips overlap with
+        the work of the caller:
+
+        >>> for doc in db.test.MyDoc.find().batch_size(1000).prefetch_batches(2):
+        ...     export(doc)
+
+        At most `n` batches are held in memory besides the current one.
+        Closing the cursor (or leaving a `with` block) stops the thread and
+        kills the server cursor.
+        """
+        if not isinstance(n, int):
+            raise TypeError("n must be an integer")
+        if n < 1:
+            raise ValueError("n must be greater than 0")
+        self._Cursor__check_okay_to_chain()
+        self._prefetch_batches = n
+        return self
+
+    def to_columns(self, fields=None, backend='numpy'):
+        """
+        Read the `fields` (dotted paths, `_id` and all the fields of the
+        structure by default) of the results into columns, without
+        instantiating the documents:
+
+        >>> columns = db.test.Measure.find({'sensor': 'a1'}).to_columns(['date', 'value'])
+        >>> pandas.DataFrame(columns)
+
+        Return a dict of numpy masked arrays whose mask is True where the
+        value is missing or null (`backend='numpy'`) or a pyarrow Table
+        (`backend='arrow'`). The int, float, bool, datetime and str fields
+        get typed arrays, the other ones arrays of objects. The fields are
+        also used as projection if the cursor has none.
+        """
+        wrap = self._wrap
+        if fields is None:
+            fields = ['_id'] + list(wrap._collapsed_struct if wrap is not None else [])
+        if self._Cursor__projection is None and self._Cursor__id is None and not self._Cursor__data:
+            self._Cursor__projection = dict.fromkeys(fields, 1)
+        return to_columns(self._iter_batches(), fields, get_field_types(wrap, fields), backend)
+
+    def to_ndjson(self, fileobj, backend='json'):
+        """
+        Write the results into the text file `fileobj`, one json document
+        per line, without instantiating the documents:
+
+        >>> with open('export.json', 'w') as f:
+        ...     db.test.MyDoc.find({'published': True}).to_ndjson(f)
+
+        Each line is the :meth:`Document.to_json` of the document. The
+        results are written batch by batch, so the memory used doesn't
+        depend on the number of results. `backend='orjson'` uses orjson
+        (if installed) to encode the documents, it writes compact lines and
+        doesn't escape the non-ASCII characters. Return the number of
+        documents written.
+        """
+        from .ndjson import to_ndjson
+        return to_ndjson(self._iter_batches(), fileobj, self.collection, self._wrap, backend)
+
+    def _iter_batches(self):
+        # the raw documents, batch by batch
+        self._run_audit()
+        if self._Cursor__empty:
+            return
+        data = self._Cursor__data
+        while len(data) or self._refresh():
+            batch = list(data)
+            data.clear()
+            yield batch
+
+    def rewind(self):
+        self._stop_prefetching()
+        return super(CursorMixin, self).rewind()
+
+    def close(self):
+        self._stop_prefetching()
+        super(CursorMixin, self).close()
+
+
+class Cursor(CursorMixin, PymongoCursor):
+    def __init__(self, *args, **kwargs):
+        if kwargs:
+            self._wrap = kwargs.pop('wrap', None)
+        super(Cursor, self).__init__(*args, **kwargs)
+
+    def _refresh(self):
+        if self._prefetch_batches:
+            return self._refresh_prefetched()
+        if self._tag is None or not is_enabled():
+            return super(Cursor, self)._refresh()
+        if self._Cursor__id is None and self._Cursor__comment is None:
+            self._Cursor__comment = get_comment(self._Cursor__collection.database.client, *self._tag)
+        with tag(*self._tag):
+            return super(Cursor, self)._refresh()
+
+    def __del__(self):
+        self._stop_prefetching(wait=False)
+        super(Cursor, self).__del__()
+
+    def _wrap_son(self, son):
         if self._Cursor__manipulate:
             db = self._Cursor__collection.database
-            son = db._fix_outgoing(item, self._Cursor__collection)
-        else:
-            son = item
-        if self.__wrap is not None:
-            if self.__wrap.type_field in son:
-                return getattr(self._Cursor__collection,
-                               son[self.__wrap.type_field])(son)
-            return self.__wrap(son, collection=self._Cursor__collection)
-        else:
-            return son
+            son = db._fix_outgoing(son, self._Cursor__collection)
+        return super(Cursor, self)._wrap_son(son)
+
+    def prefetch(self, *paths, **kwargs):
+        """
+        Run the query as an aggregation joining the documents referenced by
+        the autoref fields in `paths` with `$lookup` stages, so they are
+        fetched in the same round trip instead of one query per reference.
+
+        >>> for post in db.test.BlogPost.find({'published': True}).prefetch('author', 'comments.user'):
+        ...     print(post['author']['name'])
+
+        The referenced documents are looked up in the `__collection__` of
+        their class or, by default, in the collection of the query. Use
+        `collections` to map a path to another collection name:
+
+        >>> db.test.BlogPost.find().prefetch('author', collections={'author': 'users'})
+
+        The filter, sort, skip, limit and projection of the cursor are kept.
+        Return a :class:`PrefetchCursor`.
+        """
+        collections = kwargs.pop('collections', {})
+        if kwargs:
+            raise TypeError("unexpected arguments: %s" % ', '.join(kwargs))
+        wrap = self._wrap
+        if wrap is None or not wrap.use_autorefs:
+            raise TypeError("prefetch() needs a cursor of documents with use_autorefs")
+        collection = self._Cursor__collection
+        pipeline = []
+        if self._Cursor__spec:
+            pipeline.append({'$match': self._Cursor__spec})
+        if self._Cursor__ordering:
+            pipeline.append({'$sort': SON(self._Cursor__ordering)})
+        if self._Cursor__skip:
+            pipeline.append({'$skip': self._Cursor__skip})
+        if self._Cursor__limit:
+            pipeline.append({'$limit': abs(self._Cursor__limit)})
+        if self._Cursor__projection:
+            pipeline.append({'$project': self._Cursor__projection})
+        prefetch = []
+        for no, path in enumerate(paths):
+            ref_class, ids = _ref_ids_expression(wrap.structure, path.split('.'), path)
+            target = collections.get(path) or getattr(ref_class, '__collection__', None) or collection.name
+            pipeline.append({'$addFields': {'_prefetch_ids_%s' % no: ids}})
+            pipeline.append({'$lookup': {
+                'from': target,
+                'localField': '_prefetch_ids_%s' % no,
+                'foreignField': '_id',
+                'as': '_prefetch_%s' % no}})
+            prefetch.append((path, ref_class, collection.database[target]))
+        if prefetch:
+            pipeline.append({'$project': dict(('_prefetch_ids_%s' % no, 0) for no in range(len(paths)))})
+        command_cursor = collection.aggregate(pipeline)
+        return PrefetchCursor(command_cursor, collection, wrap, prefetch)
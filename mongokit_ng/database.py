@@ -3,7 +3,11 @@ from .collection import Collection
 from .document import Document
 from . import DBRef
 
-class Database(PymongoDB):
+class DatabaseMixin(object):
+    """
+    Document registration on top of a database class of a backend (pymongo
+    or the in-memory one of :mod:`mongokit_ng.mock`).
+    """
     def __init__(self, *args, **kwargs):
         self._collections = dict()
         super().__init__(*args, **kwargs)
@@ -14,7 +18,7 @@ class Database(PymongoDB):
             return getattr(self[document.__collection__], key)
             
         if not key in self._collections:
-            self._collections[key] = Collection(self, key)
+            self._collections[key] = self._new_collection(key)
         return self._collections[key]
 
     def __getitem__(self, key):
@@ -26,12 +30,17 @@ class Database(PymongoDB):
 
     def dereference(self, dbref, model=None):
         if model is None:
-            return super(Database, self).dereference(dbref)
+            return super(DatabaseMixin, self).dereference(dbref)
         if not isinstance(dbref, DBRef):
             raise TypeError("first argument must be a DBRef")
         if dbref.database is not None and dbref.database != self.name:
             raise ValueError("trying to dereference a DBRef that points to "
-                             "another database (%r not %r)" % (dbref.database, self._Database__name))
+                             "another database (%r not %r)" % (dbref.database, self.name))
         if not issubclass(model, Document):
             raise TypeError("second argument must be a Document")
-        return getattr(self[dbref.collection], model.__name__).one({'_id': dbref.id})
\ No newline at end of file
+        return getattr(self[dbref.collection], model.__name__).one({'_id': dbref.id})
+
+
+class Database(DatabaseMixin, PymongoDB):
+    def _new_collection(self, name):
+        return Collection(self, name)
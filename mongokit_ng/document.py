@@ -44,7 +44,11 @@ from .helpers import (
     totimestamp,
     fromtimestamp,
     DotedDict)
-from .grid import FS
+from .grid import FS, delete_files, DELETE_BATCH_SIZE
+from .parallel import parallel_scan
+from .bulk import bulk_load, DEFAULT_BATCH_SIZE
+from .monitoring import tag
+from .profiling import profiled
 import pymongo
 from bson import BSON
 from bson.binary import Binary
@@ -52,12 +56,13 @@ from bson.code import Code
 from bson.dbref import DBRef
 from bson.objectid import ObjectId
 import re
+from collections.abc import Mapping
 from copy import deepcopy
 from uuid import UUID, uuid4
 import logging
 import datetime
 
-STRUCTURE_KEYWORDS += ['_id', '_ns', '_revision', '_version']
+STRUCTURE_KEYWORDS += ['_id', '_ns', '_revision', '_version', '_fs']
 
 log = logging.getLogger(__name__)
 
@@ -153,6 +158,9 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
     indexes = []
     gridfs = []
     migration_handler = None
+    query_auditor = None
+    # class of the `fs` attribute of the documents with gridfs
+    _fs_class = FS
 
     authorized_types = SchemaDocument.authorized_types + [
         Binary,
@@ -183,7 +191,7 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
                 self._make_reference(self, self.structure)
             # gridfs
             if self.gridfs:
-                self.fs = FS(self)
+                self.fs = self._fs_class(self)
         else:
             self.fs = None
         if self.migration_handler:
@@ -257,6 +265,7 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
         else:
             super(Document, self).validate()
 
+    @profiled('get_size')
     def get_size(self):
         """
         return the size of the underlying bson object
@@ -288,7 +297,15 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
 
         See pymongo's documentation for more details on arguments.
         """
-        return self.collection.find(wrap=self._obj_class, *args, **kwargs)
+        return self._find('find', *args, **kwargs)
+
+    def _find(self, method, *args, **kwargs):
+        cursor = self.collection.find(wrap=self._obj_class, *args, **kwargs)
+        cursor._tag = (self._obj_class.__name__, method)
+        auditor = self.query_auditor or self.connection.query_auditor
+        if auditor is not None:
+            auditor.track(cursor, self._obj_class, method)
+        return cursor
 
     def find_and_modify(self, *args, **kwargs):
         """
@@ -296,13 +313,17 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
         """
         return self.collection.find_and_modify(wrap=self._obj_class, *args, **kwargs)
 
-    def find_one(self, *args, **kwargs):
+    def find_one(self, filter=None, *args, **kwargs):
         """
         Get the first object found from the database.
 
         See pymongo's documentation for more details on arguments.
         """
-        return self.collection.find_one(wrap=self._obj_class, *args, **kwargs)
+        if filter is not None and not isinstance(filter, Mapping):
+            filter = {'_id': filter}
+        for doc in self._find('find_one', filter, *args, **kwargs).limit(-1):
+            return doc
+        return None
 
     def one(self, *args, **kwargs):
         """
@@ -311,37 +332,188 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
         result.
 
         If no document is found, `one()` returns `None`
+
+        Only two documents are fetched, in a single round trip.
         """
-        bson_obj = self.find(*args, **kwargs)
-        count = bson_obj.count()
-        if count > 1:
-            raise MultipleResultsFound("%s results found" % count)
-        elif count == 1:
-            try:
-                doc = next(bson_obj)
-            except StopIteration:
-                doc = None
-            return doc
+        docs = list(self._find('one', *args, **kwargs).limit(2))
+        if len(docs) > 1:
+            raise MultipleResultsFound("more than one result found")
+        elif docs:
+            return docs[0]
+
+    def sample(self, k, filter=None):
+        """
+        return a list of `k` random documents matching `filter`.
+
+        The documents are picked by the server with a `$sample` stage so
+        only one round trip is needed whatever the number of documents.
+        """
+        return self.collection.sample(k, filter=filter, wrap=self._obj_class)
 
     def find_random(self):
         """
         return one random document from the collection
         """
-        import random
-        max = self.collection.count()
-        if max:
-            num = random.randint(0, max-1)
-            return next(self.find().skip(num))
+        docs = self.sample(1)
+        if docs:
+            return docs[0]
 
-    def find_fulltext(self, search, **kwargs):
+    def find_fulltext(self, search, filter=None, projection=None, language=None,
+                      score_field='score', **kwargs):
         """
-        Executes a full-text search. Additional parameters may be passed as keyword arguments.
+        Executes a full-text search with a `$text` query. A text index must
+        exist on the collection.
+
+        Return a cursor of documents sorted by relevance, like :meth:`find`.
+        The relevance score is added to each document under `score_field`
+        (as this field is not in the structure, use `score_field=None` to
+        get documents which can be saved back; sorting without the score
+        requires MongoDB 4.4). `filter` is merged with the `$text` query
+        and additional parameters (ie `limit`, `batch_size`) are passed to
+        :meth:`find`.
+
+        >>> db.test.MyDoc.find_fulltext('coffee shop', filter={'published': True}, limit=20)
         """
-        rv = self.collection.database.command("text", self.collection.name, search=search, **kwargs)
-        if 'results' in rv:
-            for res in rv['results']:
-                res['obj'] = self._obj_class(res['obj'])
-        return rv
+        spec, projection, sort = self.collection._fulltext_query(
+            search, filter, projection, language, score_field)
+        return self._find('find_fulltext', spec, projection, **kwargs).sort(sort)
+
+    def parallel_scan(self, fn, workers=4, filter=None, mode='thread', key='_id', splits=None,
+                      batch_size=None, uri=None, connection_kwargs=None):
+        """
+        Apply `fn` to all the documents matching `filter` using `workers`
+        threads (``mode='thread'``) or processes (``mode='process'``) and
+        return the values returned by `fn`, except None, in the order of
+        `key`.
+
+        The documents are split into `splits` (`workers` by default) ranges
+        of `key`, which must be indexed, from a `$sample` of the collection,
+        and each range is read by its own cursor:
+
+        >>> def backfill(doc):
+        ...     doc['slug'] = slugify(doc['title'])
+        ...     doc.save()
+        >>> db.test.BlogPost.parallel_scan(backfill, workers=8, filter={'slug': None})
+
+        With processes, each worker opens its own connection to `uri`
+        with the arguments `connection_kwargs`, so `fn` and the document
+        class must be defined at the top level of a module and the results
+        must be picklable:
+
+        >>> db.test.BlogPost.parallel_scan(backfill, mode='process', uri='mongodb://db1,db2/?replicaSet=rs0')
+        """
+        return parallel_scan(self, fn, workers=workers, filter=filter, mode=mode, key=key,
+                             splits=splits, batch_size=batch_size, uri=uri,
+                             connection_kwargs=connection_kwargs)
+
+    def bulk_load(self, records, processes=None, threads=4, batch_size=DEFAULT_BATCH_SIZE,
+                  max_pending=None, uuid=False):
+        """
+        Insert the dicts of the iterable `records` as fast as possible and
+        return a :class:`~mongokit_ng.bulk.BulkLoadResult`. Each record is
+        handled like ``MyDoc(record).save()``.
+
+        The records are validated and encoded by `processes` processes
+        (the number of CPUs by default), by batches of `batch_size`, and
+        inserted by `threads` threads. At most `max_pending` batches are
+        waiting at each step, so `records` can be a generator of any size:
+
+        >>> result = db.test.MyDoc.bulk_load(csv.DictReader(open('data.csv')))
+        >>> for index, error in result.errors:
+        ...     print("record %s: %s" % (index, error))
+
+        The invalid records and the ones refused by the server are reported
+        in `errors`, the others are still inserted. The documents with
+        autorefs, versioning or a migration_handler are not supported, and
+        the document class must be defined at the top level of a module.
+        """
+        return bulk_load(self, records, processes=processes, threads=threads, batch_size=batch_size,
+                         max_pending=max_pending, uuid=uuid)
+
+    def aggregate(self, pipeline, wrap=True, allowDiskUse=None, batchSize=None, **kwargs):
+        """
+        Run an aggregation pipeline against the collection of the object.
+
+        If `wrap` is True, the results are yield as instances of the object
+        (or of the document named by their `type_field`) by a cursor which
+        streams them batch by batch. Otherwise, the raw pymongo
+        CommandCursor is returned.
+
+        The field paths used by the `$match` and `$project` stages are
+        checked against the structure before the pipeline is sent, as long
+        as the stages before them keep the shape of the documents.
+
+        >>> db.test.MyDoc.aggregate([{'$match': {'foo': 1}}, {'$sort': {'bar': -1}}], batchSize=100)
+
+        See pymongo's documentation for more details on arguments.
+        """
+        self._validate_pipeline(pipeline)
+        if allowDiskUse is not None:
+            kwargs['allowDiskUse'] = allowDiskUse
+        if batchSize is not None:
+            kwargs['batchSize'] = batchSize
+        if wrap:
+            kwargs['wrap'] = self._obj_class
+        return self.collection.aggregate(pipeline, **kwargs)
+
+    @classmethod
+    def _validate_pipeline(cls, pipeline):
+        if cls.use_schemaless:
+            return
+        for stage in pipeline:
+            for operator, value in stage.items():
+                if operator == '$match':
+                    cls._validate_query_paths(value)
+                elif operator == '$project':
+                    for key, projection in value.items():
+                        if projection in (0, 1, True, False):
+                            cls._validate_field_path(key)
+                        elif isinstance(projection, str) and projection.startswith('$') and \
+                                not projection.startswith('$$'):
+                            cls._validate_field_path(projection[1:])
+                    # the documents don't follow the structure anymore
+                    return
+                elif operator not in ('$sort', '$limit', '$skip', '$sample'):
+                    return
+
+    @classmethod
+    def _validate_query_paths(cls, query):
+        for key, value in query.items():
+            if key in ('$and', '$or', '$nor'):
+                for subquery in value:
+                    cls._validate_query_paths(subquery)
+            elif not key.startswith('$'):
+                cls._validate_field_path(key)
+
+    @classmethod
+    def _validate_field_path(cls, path):
+        """
+        raise a StructureError if `path` can't be found in the structure
+        """
+        bits = path.split('.')
+        if bits[0] in STRUCTURE_KEYWORDS:
+            return
+        struct = cls.structure
+        for bit in bits:
+            if isinstance(struct, (list, tuple)):
+                if bit.isdigit():
+                    if isinstance(struct, tuple):
+                        struct = struct[int(bit)] if int(bit) < len(struct) else None
+                    else:
+                        struct = struct[0] if struct else None
+                    continue
+                struct = struct[0] if struct else None
+            if isinstance(struct, CustomType) or not isinstance(struct, dict):
+                # we can't go further, the path may exist
+                return
+            if bit in struct:
+                struct = struct[bit]
+            else:
+                typed_keys = [key for key in struct if type(key) is type]
+                if not typed_keys:
+                    raise StructureError("%s: can't find %s in structure" % (
+                        getattr(cls, '_obj_class', cls).__name__, path))
+                struct = struct[typed_keys[0]]
 
     def get_from_id(self, id):
         """
@@ -356,6 +528,9 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
 
         The query is launch against the db and collection of the object.
         """
+        return self._find('fetch', self._get_fetch_spec(spec), *args, **kwargs)
+
+    def _get_fetch_spec(self, spec):
         if spec is None:
             spec = {}
         for key in self.structure:
@@ -364,9 +539,9 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
                     spec[key].update({'$exists': True})
             else:
                 spec[key] = {'$exists': True}
-        return self.find(spec, *args, **kwargs)
+        return spec
 
-    def fetch_one(self, *args, **kwargs):
+    def fetch_one(self, spec=None, *args, **kwargs):
         """
         return one document which match the structure of the object
         `fetch_one()` takes the same arguments than the the pymongo.collection.find method.
@@ -376,12 +551,11 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
 
         The query is launch against the db and collection of the object.
         """
-        bson_obj = self.fetch(*args, **kwargs)
-        count = bson_obj.count()
-        if count > 1:
-            raise MultipleResultsFound("%s results found" % count)
-        elif count == 1:
-            return next(bson_obj)
+        docs = list(self._find('fetch_one', self._get_fetch_spec(spec), *args, **kwargs).limit(2))
+        if len(docs) > 1:
+            raise MultipleResultsFound("more than one result found")
+        elif docs:
+            return docs[0]
 
     def reload(self):
         """
@@ -400,6 +574,8 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
         else:
             self.update(DotedDict(old_doc))
         self._process_custom_type('python', self, self.structure)
+        if self.gridfs:
+            self.fs.refresh()
 
     def get_dbref(self):
         """
@@ -421,24 +597,72 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
 
         `save()` follow the pymongo.collection.save arguments
         """
-        if validate is True or (validate is None and self.skip_validation is False):
-            self.validate(auto_migrate=False)
-        else:
-            if self.use_autorefs:
-                self._make_reference(self, self.structure)
-        if '_id' not in self:
-            if uuid:
-                self['_id'] = str("%s-%s" % (self.__class__.__name__, uuid4()))
-        self._process_custom_type('bson', self, self.structure)
-        self.collection.save(self, *args, **kwargs)
-        self._process_custom_type('python', self, self.structure)
+        with tag(self.__class__.__name__, 'save'):
+            if validate is True or (validate is None and self.skip_validation is False):
+                self.validate(auto_migrate=False)
+            else:
+                if self.use_autorefs:
+                    self._make_reference(self, self.structure)
+            if '_id' not in self:
+                if uuid:
+                    self['_id'] = str("%s-%s" % (self.__class__.__name__, uuid4()))
+            self._process_custom_type('bson', self, self.structure)
+            self.collection.save(self, *args, **kwargs)
+            self._process_custom_type('python', self, self.structure)
         return self
 
     def delete(self):
         """
         delete the document from the collection from his _id.
+
+        If `gridfs` has the `cascade` option, the files attached to the
+        document are deleted as well.
+        """
+        with tag(self.__class__.__name__, 'delete'):
+            self.collection.remove({'_id': self['_id']})
+            if self.gridfs and self.gridfs.get('cascade'):
+                delete_files(self.db, [self['_id']], inline_collection=self.gridfs.get('inline_collection'))
+
+    def remove(self, query, *args, **kwargs):
         """
-        self.collection.remove({'_id': self['_id']})
+        remove all documents which match the query.
+
+        If `gridfs` has the `cascade` option, the files attached to the
+        removed documents are deleted as well. The documents are then
+        removed by batches of _id, and only the `multi`, `collation` and
+        `session` arguments are supported.
+
+        Return the result of the deletion (`{'n': removed, 'ok': 1.0}`) in
+        both cases.
+        """
+        if not (self.gridfs and self.gridfs.get('cascade')):
+            return self.collection.remove(query, *args, **kwargs)
+        if query is not None and not isinstance(query, Mapping):
+            query = {'_id': query}
+        if len(args) > 1:
+            raise TypeError("remove() with cascade takes at most 3 positional arguments")
+        multi = args[0] if args else kwargs.pop('multi', True)
+        unsupported = set(kwargs) - set(['collation', 'session'])
+        if unsupported:
+            raise TypeError("remove() with cascade doesn't support %s" % ', '.join(sorted(unsupported)))
+        cursor = self.collection.find(query, projection=['_id'], **kwargs)
+        if not multi:
+            cursor = cursor.limit(1)
+        removed = 0
+        docids = []
+        for doc in cursor:
+            docids.append(doc['_id'])
+            if len(docids) >= DELETE_BATCH_SIZE:
+                removed += self._remove_with_files(docids, kwargs.get('session'))
+                docids = []
+        if docids:
+            removed += self._remove_with_files(docids, kwargs.get('session'))
+        return {'n': removed, 'ok': 1.0}
+
+    def _remove_with_files(self, docids, session=None):
+        result = self.collection.delete_many({'_id': {'$in': docids}}, session=session)
+        delete_files(self.db, docids, inline_collection=self.gridfs.get('inline_collection'))
+        return result.deleted_count
 
     @classmethod
     def generate_index(cls, collection):
@@ -446,7 +670,13 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
 
         supports additional index-creation-keywords supported by pymongos ``ensure_index``.
         """
-        # creating index if needed
+        for fields, kwargs in cls._get_index_arguments():
+            collection.create_index(fields, **kwargs)
+
+    @classmethod
+    def _get_index_arguments(cls):
+        # the (fields, keywords) of the create_index() calls of generate_index()
+        arguments = []
         for index in deepcopy(cls.indexes):
             unique = False
             if 'unique' in index:
@@ -456,23 +686,115 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
                 ttl = index.pop('ttl')
 
             given_fields = index.pop("fields", list())
-
-            if isinstance(given_fields, tuple):
-                fields = [given_fields]
-            elif isinstance(given_fields, str):
-                fields = [(given_fields, 1)]
-            else:
-                fields = []
-                for field in given_fields:
-                    if isinstance(field, str):
-                        field = (field, 1)
-                    fields.append(field)
+            fields = cls._get_index_fields(given_fields)
             index.pop('check', None)
             log.debug('Creating index for {}'.format(str(given_fields)))
+            index['unique'] = unique
+            if ttl and len(fields) == 1:
+                index['expireAfterSeconds'] = ttl
+            arguments.append((fields, index))
+        return arguments
+
+    @staticmethod
+    def _get_index_fields(given_fields):
+        if isinstance(given_fields, tuple):
+            return [given_fields]
+        elif isinstance(given_fields, str):
+            return [(given_fields, 1)]
+        fields = []
+        for field in given_fields:
+            if isinstance(field, str):
+                field = (field, 1)
+            fields.append(field)
+        return fields
+
+    @classmethod
+    def _get_index_models(cls):
+        models = []
+        for index in deepcopy(cls.indexes):
+            fields = cls._get_index_fields(index.pop('fields', list()))
+            index.pop('check', None)
+            ttl = index.pop('ttl', None)
+            # like generate_index(), ttl is ignored on compound indexes as
+            # the server only expires documents on single field indexes
             if ttl and len(fields) == 1:
-                collection.create_index(fields, unique=unique, expireAfterSeconds=ttl, **index)
+                index['expireAfterSeconds'] = ttl
+            if not index.get('unique', True):
+                del index['unique']
+            models.append(pymongo.IndexModel(fields, **index))
+        return models
+
+    @classmethod
+    def sync_indexes(cls, collection, dry_run=False, drop=False):
+        """synchronize the indexes of `collection` with the ``indexes``
+        class-attribute.
+
+        The existing indexes are read once and compared to the declared
+        ones. The missing indexes are created with a single
+        ``create_indexes`` call. Unlike :meth:`generate_index`, no default
+        ttl is applied.
+
+        An existing index with the same name or keys but other options is a
+        conflict: it is rebuilt only if `drop` is True. The indexes which are
+        not declared anymore are dropped only if `drop` is True.
+
+        The plan is logged before anything is done. If `dry_run` is True,
+        nothing is done. Return the plan as a dict of index names:
+
+        >>> db.test.MyDoc.sync_indexes(db.test, dry_run=True)
+        {'create': ['foo_1'], 'drop': [], 'conflict': [], 'stale': ['bar_1'], 'unchanged': []}
+        """
+        existing = list(collection.list_indexes())
+        plan, to_create = cls._get_index_plan(collection, existing, drop)
+        if not dry_run:
+            for name in plan['drop']:
+                collection.drop_index(name)
+            if to_create:
+                collection.create_indexes(to_create)
+        return plan
+
+    @classmethod
+    def _get_index_plan(cls, collection, indexes, drop):
+        # the plan of sync_indexes() and the models to create, from the
+        # existing `indexes`
+        existing = dict((index['name'], index) for index in indexes)
+        plan = {'create': [], 'drop': [], 'conflict': [], 'stale': [], 'unchanged': []}
+        to_create = []
+        matched = set()
+        for model in cls._get_index_models():
+            spec = model.document
+            current = existing.get(spec['name'])
+            if current is None:
+                for index in existing.values():
+                    if _get_index_key(index) == _get_index_key(spec):
+                        current = index
+                        break
+            if current is None:
+                plan['create'].append(spec['name'])
+                to_create.append(model)
+                continue
+            matched.add(current['name'])
+            if _get_index_key(current) == _get_index_key(spec) and _same_index_options(current, spec):
+                plan['unchanged'].append(current['name'])
             else:
-                collection.create_index(fields, unique=unique, **index)
+                plan['conflict'].append(current['name'])
+                if drop:
+                    plan['drop'].append(current['name'])
+                    plan['create'].append(spec['name'])
+                    to_create.append(model)
+        for name in existing:
+            if name != '_id_' and name not in matched:
+                plan['stale'].append(name)
+                if drop:
+                    plan['drop'].append(name)
+
+        for action in ('create', 'drop', 'conflict', 'stale'):
+            for name in plan[action]:
+                log.info('%s.sync_indexes: %s %s on %s' % (
+                    cls.__name__, action, name, collection.full_name))
+        return plan, to_create
+
+    @profiled('to_json_type')
     def to_json_type(self):
         """
         convert all document field into json type
@@ -504,6 +826,8 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
         self._process_custom_type('bson', self, self.structure)
         obj = deepcopy(self)
         self._process_custom_type('python', self, self.structure)
+        # inline gridfs files are not part of the json representation
+        obj.pop('_fs', None)
         _convert_to_json(obj, obj)
         if '_id' in obj:
             if isinstance(obj['_id'], ObjectId):
@@ -645,6 +969,7 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
                 raise ConnectionError('No collection found')
         return super(Document, self).__getattribute__(key)
 
+    @profiled('make_reference')
     def _make_reference(self, doc, struct, path=""):
         """
         * wrap all MongoDocument with the CustomType "R()"
@@ -750,6 +1075,31 @@ class Document(SchemaDocument, metaclass=DocumentProperties):
                         self._make_reference(obj, struct[key][0], "%s.%s" % (new_path, no))
 
 
+def _get_index_key(index):
+    key = index['key']
+    items = list(key.items())
+    if '_fts' in key:
+        # text indexes are stored with their fields in `weights`
+        items = [(k, v) for k, v in items if k not in ('_fts', '_ftsx')]
+        items += [(field, 'text') for field in sorted(index.get('weights', {}))]
+    else:
+        text_fields = sorted(k for k, v in items if v == 'text')
+        items = [(k, v) for k, v in items if v != 'text'] + [(k, 'text') for k in text_fields]
+    return items
+
+
+def _same_index_options(current, spec):
+    for option in set(current) | set(spec):
+        if option in ('v', 'ns', 'key', 'name', 'background'):
+            continue
+        if option in ('weights', 'default_language', 'language_override', 'textIndexVersion',
+                      '2dsphereIndexVersion') and option not in spec:
+            continue
+        if current.get(option, False) != spec.get(option, False):
+            return False
+    return True
+
+
 class R(CustomType):
     """ CustomType to deal with autorefs documents """
     mongo_type = DBRef
@@ -767,6 +1117,9 @@ class R(CustomType):
 
     def to_python(self, value):
         if value is not None:
+            # already joined by Cursor.prefetch()
+            if isinstance(value, self._doc) and getattr(value, '_prefetched', False):
+                return value
             if not isinstance(value, DBRef):
                 if '$ref' not in value:
                     value = value.get_dbref()
@@ -782,7 +1135,8 @@ class R(CustomType):
                                    " have to add the attribute `force_autorefs_current_db` as True. Please see the doc"
                                    " for more details.\n The DBRef without database is : %s " % value)
             col = self.connection[database][value.collection]
-            doc = col.find_one({'_id': value.id})
+            with tag(self._doc.__name__, 'R.to_python'):
+                doc = col.find_one({'_id': value.id})
             if doc is None:
                 raise AutoReferenceError('Something wrong append. You probably change'
                                          ' your object when passing it as a value to an autorefs enable document.\n'
@@ -25,8 +25,15 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from gridfs import GridFS, NoFile, GridOut
-from pymongo import ASCENDING, DESCENDING
+import datetime
+from io import BytesIO
+
+from bson.binary import Binary
+from bson.tz_util import utc
+from gridfs import GridFS, NoFile, GridIn, GridOut
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from .monitoring import tag
 
 #try:
 #    from magic import Magic
@@ -34,13 +41,154 @@ from pymongo import ASCENDING, DESCENDING
 #    Magic = None
 
 
+# indexes already created by this process
+_indexed_collections = set()
+
+# max number of ids per $in query when deleting files
+DELETE_BATCH_SIZE = 1000
+
+
+def ensure_index_once(collection, keys, **kwargs):
+    """
+    create the index `keys` on `collection` if it was not already done
+    by this process.
+    """
+    cache_key = (id(collection.database.client), collection.full_name, tuple(keys))
+    if cache_key not in _indexed_collections:
+        collection.create_index(keys, **kwargs)
+        _indexed_collections.add(cache_key)
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _upload_date(codec_options):
+    # now, as the server would return it to a client with `codec_options`:
+    # in milliseconds, and aware if tz_aware is set
+    now = datetime.datetime.utcnow()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    if codec_options.tz_aware:
+        now = now.replace(tzinfo=utc).astimezone(codec_options.tzinfo or utc)
+    return now
+
+
+def delete_file_ids(database, file_ids, batch_size=DELETE_BATCH_SIZE):
+    """
+    delete the GridFS files `file_ids` and all their chunks
+    """
+    for batch in _batches(file_ids, batch_size):
+        database['fs.files'].delete_many({'_id': {'$in': batch}})
+        database['fs.chunks'].delete_many({'files_id': {'$in': batch}})
+
+
+def delete_files(database, docids, inline_collection=None, batch_size=DELETE_BATCH_SIZE):
+    """
+    delete all the files attached to the documents `docids`: GridFS files
+    with their chunks and, if `inline_collection` is given, the inline files
+    stored in this collection.
+    """
+    files = database['fs.files']
+    for batch in _batches(docids, batch_size):
+        file_ids = [f['_id'] for f in files.find({'docid': {'$in': batch}}, projection=['_id'])]
+        delete_file_ids(database, file_ids, batch_size=batch_size)
+        if inline_collection:
+            database[inline_collection].delete_many({'docid': {'$in': batch}})
+
+
+class FSGridIn(GridIn):
+    """
+    GridIn which invalidates the file listing of its FS once closed
+    """
+    _fs = None
+
+    def close(self):
+        super(FSGridIn, self).close()
+        if self._fs is not None:
+            self._fs._invalidate()
+
+
+class InlineFile(object):
+    """
+    Read-only file object for a file stored inline (see the
+    ``inline_threshold`` option of ``Document.gridfs``). It mimics the
+    parts of :class:`~gridfs.grid_file.GridOut` used by mongokit.
+    """
+    def __init__(self, file_document, buffer=None):
+        self._file = file_document
+        if buffer is None:
+            buffer = BytesIO(bytes(file_document['data']))
+        self._buffer = buffer
+
+    @property
+    def _id(self):
+        return self._file.get('_id')
+
+    @property
+    def name(self):
+        return self._file['filename']
+
+    filename = name
+
+    @property
+    def length(self):
+        return self._file['length']
+
+    @property
+    def upload_date(self):
+        return self._file['uploadDate']
+
+    @property
+    def content_type(self):
+        return self._file.get('contentType')
+
+    def __getattr__(self, key):
+        if key in self._file:
+            return self._file[key]
+        raise AttributeError("InlineFile object has no attribute '%s'" % key)
+
+    def read(self, size=-1):
+        return self._buffer.read(size)
+
+    def readline(self, size=-1):
+        return self._buffer.readline(size)
+
+    def seek(self, pos, whence=0):
+        return self._buffer.seek(pos, whence)
+
+    def tell(self):
+        return self._buffer.tell()
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        return iter(self._buffer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
 class FS(GridFS):
-    def __init__(self, obj):
+    def __init__(self, obj, root=None):
         self._obj = obj
+        # the file listing is shared by the FS and its containers
+        self._root = root if root is not None else self
+        self._listing = None
         super(FS, self).__init__(obj.db)
         if not isinstance(self, FSContainer):
             for container in obj.gridfs.get('containers', []):
-                self.__dict__[container] = FSContainer(container, obj)
+                self.__dict__[container] = FSContainer(container, obj, root=self)
         #self._fs = GridFS(self._obj.db)
         #if Magic:
         #    self._magic = Magic(mime=True)
@@ -52,6 +200,120 @@ class FS(GridFS):
         spec.update(kwargs)
         return spec
 
+    def _get_container(self):
+        return None
+
+    def _get_inline_threshold(self):
+        return self._obj.gridfs.get('inline_threshold')
+
+    def _get_inline_collection(self):
+        name = self._obj.gridfs.get('inline_collection')
+        if name:
+            return self._obj.db[name]
+
+    def _get_listing(self):
+        """
+        return the file documents of all the files (including the containers
+        and the inline ones) attached to the document. They are fetched
+        once and cached until a file is written or deleted through this FS.
+        """
+        root = self._root
+        if root._listing is None:
+            files = root._GridFS__files
+            ensure_index_once(files, [('docid', ASCENDING)])
+            listing = list(files.find(root._get_spec()))
+            listing.extend(root._iter_inline())
+            # stable sort: files uploaded at the same time keep their natural order
+            listing.sort(key=lambda f: f['uploadDate'])
+            root._listing = listing
+        return root._listing
+
+    def _filter_listing(self, **kwargs):
+        spec = self._get_spec(**kwargs)
+        spec.pop('docid')
+        return [f for f in self._get_listing() if all(f.get(k) == v for k, v in spec.items())]
+
+    def _invalidate(self):
+        self._root._listing = None
+
+    def refresh(self):
+        """
+        forget the cached file listing so that it is fetched again on the
+        next access.
+        """
+        self._invalidate()
+
+    def _open(self, file_document, session=None):
+        if 'data' in file_document:
+            return InlineFile(file_document)
+        cache = self._obj.gridfs.get('cache')
+        if cache is not None:
+            cached = cache.get(file_document)
+            if cached is not None:
+                return cached
+        grid_out = GridOut(self._GridFS__collection, file_document=file_document, session=session)
+        # the files too big to be cached are streamed, not read in memory
+        if cache is not None and file_document['length'] <= cache.max_size:
+            if cache.put(file_document, grid_out.read()):
+                cached = cache.get(file_document)
+                if cached is not None:
+                    return cached
+            grid_out.seek(0)
+        return grid_out
+
+    def _put_inline(self, key, data):
+        entry = {
+            'filename': key,
+            'container': self._get_container(),
+            'data': Binary(data),
+            'length': len(data),
+            'uploadDate': _upload_date(self._obj.collection.codec_options),
+        }
+        inline_collection = self._get_inline_collection()
+        if inline_collection is not None:
+            entry['docid'] = self._obj['_id']
+            inline_collection.replace_one(
+                {'docid': self._obj['_id'], 'container': entry['container'], 'filename': key},
+                entry, upsert=True)
+        else:
+            # pull the previous version and push the new one rather than
+            # rewriting the whole array, so the files attached by another
+            # writer (or missing from a stale instance) are kept
+            spec = {'container': entry['container'], 'filename': key}
+            self._obj.collection.bulk_write([
+                UpdateOne({'_id': self._obj['_id']}, {'$pull': {'_fs': spec}}),
+                UpdateOne({'_id': self._obj['_id']}, {'$push': {'_fs': entry}}),
+            ])
+            entries = [e for e in self._obj.get('_fs', [])
+                       if (e['container'], e['filename']) != (entry['container'], key)]
+            entries.append(entry)
+            self._obj['_fs'] = entries
+        self._invalidate()
+
+    def _delete_inline(self, key):
+        if not self._get_inline_threshold():
+            return
+        inline_collection = self._get_inline_collection()
+        if inline_collection is not None:
+            inline_collection.delete_many(self._get_spec(filename=key))
+        else:
+            container = self._get_container()
+            self._obj.collection.update_one(
+                {'_id': self._obj['_id']}, {'$pull': {'_fs': {'container': container, 'filename': key}}})
+            if '_fs' in self._obj:
+                self._obj['_fs'] = [e for e in self._obj['_fs']
+                                    if (e['container'], e['filename']) != (container, key)]
+        self._invalidate()
+
+    def _iter_inline(self):
+        if not self._get_inline_threshold():
+            return []
+        inline_collection = self._get_inline_collection()
+        if inline_collection is not None:
+            return inline_collection.find(self._get_spec())
+        container = self._get_container()
+        return [e for e in self._obj.get('_fs', []) if container is None or e['container'] == container]
+
     def __getitem__(self, key):
         if not self._obj.get('_id'):
             raise RuntimeError('This document is not saved, no files should be attached')
@@ -62,6 +324,12 @@ class FS(GridFS):
         #if value and Magic:
         #    content_type = self._magic.from_buffer(value)
         spec = self._get_spec(filename=key, content_type=content_type)
+        threshold = self._get_inline_threshold()
+        if threshold and isinstance(value, (str, bytes)):
+            data = value.encode('utf-8') if isinstance(value, str) else value
+            if len(data) < threshold:
+                self._put_inline(key, data)
+                return
         try:
             self.put(value, **spec)
         except TypeError as e:
@@ -81,7 +349,10 @@ class FS(GridFS):
             super(FS, self).__setattr__(key, value)
 
     def __delitem__(self, key):
-        self._GridFS__files.remove(self._get_spec(filename=key))
+        self._delete_inline(key)
+        file_ids = [f['_id'] for f in self._GridFS__files.find(self._get_spec(filename=key), projection=['_id'])]
+        delete_file_ids(self._obj.db, file_ids)
+        self._invalidate()
 
     def __delattr__(self, key):
         if not key.startswith('_'):
@@ -91,19 +362,37 @@ class FS(GridFS):
 
     def __iter__(self):
         if self._obj.get('_id'):
-            for metafile in self._GridFS__files.find(self._get_spec()):
-                yield self.get(metafile['_id'])
+            for file_document in self._filter_listing():
+                if 'data' in file_document:
+                    yield InlineFile(file_document)
+                else:
+                    yield GridOut(self._GridFS__collection, file_document=file_document)
 
     def __repr__(self):
         return "<%s of object '%s'>" % (self.__class__.__name__, self._obj.__class__.__name__)
 
     def new_file(self, filename):
-        return super(FS, self).new_file(encoding='utf-8', **self._get_spec(filename=filename))
+        # the new GridFS version supersedes any inline copy
+        self._delete_inline(filename)
+        grid_in = FSGridIn(self._GridFS__collection, disable_md5=self._GridFS__disable_md5,
+                           encoding='utf-8', **self._get_spec(filename=filename))
+        grid_in._fs = self
+        return grid_in
 
     def put(self, data, **kwargs):
-        return super(FS, self).put(data, encoding='utf-8', **self._get_spec(**kwargs))
+        if 'filename' in kwargs:
+            self._delete_inline(kwargs['filename'])
+        try:
+            with tag(self._obj.__class__.__name__, 'FS.put'):
+                return super(FS, self).put(data, encoding='utf-8', **self._get_spec(**kwargs))
+        finally:
+            self._invalidate()
 
-    def get_version(self, filename, version=-1, **kwargs):
+    def delete(self, file_id, session=None):
+        super(FS, self).delete(file_id, session=session)
+        self._invalidate()
+
+    def get_version(self, filename, version=-1, session=None, **kwargs):
         """Get a file from GridFS by ``"filename"`` or metadata fields.
 
         Returns a version of the file in GridFS whose filename matches
@@ -124,14 +413,21 @@ class FS(GridFS):
         Raises :class:`~gridfs.errors.NoFile` if no such version of
         that file exists.
 
-        An index on ``{filename: 1, uploadDate: -1}`` will
-        automatically be created when this method is called the first
-        time.
+        Files stored inline (see the ``inline_threshold`` option of
+        ``Document.gridfs``) only have one version and are returned as
+        :class:`InlineFile`.
+
+        Without metadata fields, the version is taken from the file listing
+        of the document which is fetched once and cached by the FS. Otherwise,
+        an index on ``{filename: 1, uploadDate: -1}`` is created the first
+        time this method is called by the process.
 
         :Parameters:
           - `filename`: ``"filename"`` of the file to get, or `None`
           - `version` (optional): version of the file to get (defaults
             to -1, the most recent version uploaded)
+          - `session` (optional): a
+            :class:`~pymongo.client_session.ClientSession`
           - `**kwargs` (optional): find files by custom metadata.
 
         .. versionchanged:: 1.11
@@ -140,11 +436,16 @@ class FS(GridFS):
            Accept keyword arguments to find files by custom metadata.
         .. versionadded:: 1.9
         """
+        if filename is not None and not kwargs:
+            versions = self._filter_listing(filename=filename)
+            try:
+                return self._open(versions[version], session=session)
+            except IndexError:
+                raise NoFile("no version %d for filename %r" % (version, filename))
         # This is took from pymongo source. We need to go a little deeper here
-        self._GridFS__files.ensure_index([("filename", ASCENDING),
-                                          ("uploadDate", DESCENDING)])
+        ensure_index_once(self._GridFS__files, [("filename", ASCENDING), ("uploadDate", DESCENDING)])
         ########## Begin of MongoKit hack ##########
-        cursor = self._GridFS__files.find(self._get_spec(filename=filename, **kwargs))
+        cursor = self._GridFS__files.find(self._get_spec(filename=filename, **kwargs), session=session)
         ########## end of MongoKit hack ############
         if version < 0:
             skip = abs(version) - 1
@@ -153,15 +454,18 @@ class FS(GridFS):
             cursor.limit(-1).skip(version).sort("uploadDate", ASCENDING)
         try:
             grid_file = next(cursor)
-            return GridOut(self._GridFS__collection, grid_file["_id"])
         except StopIteration:
             raise NoFile("no version %d for filename %r" % (version, filename))
+        return self._open(grid_file, session=session)
 
 
 class FSContainer(FS):
-    def __init__(self, container_name, obj):
+    def __init__(self, container_name, obj, root=None):
         self._container_name = container_name
-        super(FSContainer, self).__init__(obj)
+        super(FSContainer, self).__init__(obj, root=root)
+
+    def _get_container(self):
+        return self._container_name
 
     def _get_spec(self, **kwargs):
         if not self._obj.get('_id'):
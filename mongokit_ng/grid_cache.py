@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+from io import BytesIO
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+from .grid import InlineFile
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+class CachedFile(InlineFile):
+    """
+    Read-only file object served from a memory-mapped file of a
+    :class:`DiskCache`.
+    """
+    def __init__(self, file_document, path):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buffer = BytesIO(b'')
+        super(CachedFile, self).__init__(file_document, buffer=buffer)
+
+    def close(self):
+        self._buffer.close()
+
+
+class DiskCache(object):
+    """
+    Local disk cache for GridFS files.
+
+    Files are keyed by their ``_id`` and their ``md5`` (or ``uploadDate`` if
+    md5 is disabled) so a new version of a file never hits a stale entry.
+    The total size of the cache is bounded by `max_size` bytes and the least
+    recently read files are evicted first.
+
+    Entries are written to a temporary file and atomically renamed, and the
+    eviction is done under a file lock, so a cache directory can be shared
+    by all the worker processes of a host.
+
+    >>> class Doc(Document):
+    ...     structure = {'title': str}
+    ...     gridfs = {'files': ['image'], 'cache': DiskCache('/var/cache/myapp')}
+    """
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    def _get_path(self, file_document):
+        version = file_document.get('md5') or file_document['uploadDate'].isoformat()
+        key = "%s-%s" % (file_document['_id'], version)
+        return os.path.join(self.path, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, file_document):
+        """
+        return a :class:`CachedFile` for `file_document` or None if the file
+        is not cached.
+        """
+        path = self._get_path(file_document)
+        try:
+            # the modification time is used as the "last read" time
+            os.utime(path, None)
+            return CachedFile(file_document, path)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, file_document, data):
+        """
+        store `data` as the content of `file_document`. Return False if the
+        file is too big to be cached.
+        """
+        if len(data) > self.max_size:
+            return False
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._get_path(file_document))
+        except OSError:
+            log.warning("can't write %s in the gridfs cache" % file_document['_id'], exc_info=True)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """
+        remove the least recently read files until the cache fits in
+        `max_size`.
+        """
+        with open(os.path.join(self.path, '.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries = []
+                total = 0
+                for entry in os.scandir(self.path):
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= self.max_size:
+                        break
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        continue
+                    total -= size
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def clear(self):
+        """
+        remove all files from the cache
+        """
+        for entry in os.scandir(self.path):
+            if not entry.name.startswith('.'):
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
@@ -28,6 +28,7 @@
 from .helpers import DotCollapsedDict
 from .mongo_exceptions import UpdateQueryError
 from .mongo_exceptions import OperationFailure
+from .monitoring import tag
 
 
 class DocumentMigration(object):
@@ -66,27 +67,34 @@ class DocumentMigration(object):
             if self.target and self.update:
                 if '_id' in doc:
                     self.target['_id'] = doc['_id']
-                doc.collection.update(self.target, self.update, multi=False)
-                # reload
-                try:
-                    doc.update(doc.collection.get_from_id(doc['_id']))
-                except:
-                    raise OperationFailure('Can not reload an unsaved document. '
-                                           '%s is not found in the database' % doc['_id'])
+                with tag(self.doc_class.__name__, 'migrate'):
+                    doc.collection.update(self.target, self.update, multi=False)
+                    # reload
+                    try:
+                        doc.update(doc.collection.get_from_id(doc['_id']))
+                    except:
+                        raise OperationFailure('Can not reload an unsaved document. '
+                                               '%s is not found in the database' % doc['_id'])
                 # self.reload()
 
-    def migrate_all(self, collection, safe=True):
-        method_names = sorted([i for i in dir(self) if i.startswith('allmigration')])
+    def migrate_all(self, collection, safe=True, skip=(), callback=None):
+        """run the ``allmigration`` methods on `collection`. The methods
+        listed in `skip` are not run (to resume an interrupted migration)
+        and `callback` is called with the name of each method once done."""
+        method_names = sorted([i for i in dir(self) if i.startswith('allmigration') and i not in skip])
         for method_name in method_names:
             self.clean()
             self.collection = collection
             getattr(self, method_name)()
             if self.target and self.update:
                 self.validate_update(self.update)
-                collection.update(self.target, self.update, multi=True)
-                status = collection.database.last_status()
+                with tag(self.doc_class.__name__, 'migrate_all'):
+                    collection.update(self.target, self.update, multi=True)
+                    status = collection.database.last_status()
                 if not status.get('updatedExisting', 1):
                     print("%s : %s >>> deprecated" % (self.__class__.__name__, method_name))
+            if callback is not None:
+                callback(method_name)
 
     def get_deprecated(self, collection):
         method_names = sorted([i for i in dir(self) if i.startswith('migration') or i.startswith('allmigration')])
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+In-memory backend built on mongomock (``pip install mongokit_ng[mock]``).
+
+:class:`MockConnection` is used like :class:`~mongokit_ng.Connection`
+but needs no server, which is handy for tests and benchmarks:
+
+>>> from mongokit_ng.mock import MockConnection
+>>> connection = MockConnection()
+>>> connection.register([MyDoc])
+>>> connection.test.mongokit.MyDoc({'foo': 1}).save()
+
+Registration, wrapping, GridFS and versioning behave as with a server.
+Only the features mongomock implements are available (no text search,
+no $where, only a part of the aggregation framework...). As no command
+is sent and nothing can be explained, the queries are neither audited
+by :class:`~mongokit_ng.QueryAuditor` nor seen by
+:class:`~mongokit_ng.CommandMonitor`.
+"""
+import functools
+from collections import deque
+
+import bson
+import mongomock
+from bson.raw_bson import RawBSONDocument
+from mongomock import filtering, helpers
+from mongomock.collection import Cursor as MongomockCursor
+from mongomock.gridfs import enable_gridfs_integration
+from pymongo.errors import InvalidOperation
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+from .collection import CollectionMixin
+from .connection import MongoPieConnection
+from .cursor import CursorMixin
+from .database import DatabaseMixin
+
+# let gridfs accept mongomock databases and collections
+enable_gridfs_integration()
+
+
+class MockCursor(CursorMixin, MongomockCursor):
+    # mongomock sets it when sliced with an empty range
+    _Cursor__empty = False
+
+    def __init__(self, *args, **kwargs):
+        self._wrap = kwargs.pop('wrap', None)
+        self._Cursor__batch_size = 0
+        super(MockCursor, self).__init__(*args, **kwargs)
+
+    def _refresh(self):
+        # the results are already in memory, they are handed out in batches
+        # of `batch_size` (all at once by default) like a server would do
+        if self._prefetch_batches:
+            return self._refresh_prefetched()
+        data = self._Cursor__data
+        if len(data) or self._Cursor__killed:
+            return len(data)
+        results = self._compute_results(with_limit_and_skip=True)
+        end = self._emitted + self._Cursor__batch_size if self._Cursor__batch_size else len(results)
+        data.extend(results[self._emitted:end])
+        self._emitted += len(data)
+        self._Cursor__id = 0
+        if self._emitted >= len(results):
+            self._Cursor__killed = True
+        return len(data)
+
+    def _run_audit(self):
+        # explain is not supported by mongomock, the queries aren't audited
+        self._audit = None
+
+    def _Cursor__check_okay_to_chain(self):
+        if self._Cursor__id is not None:
+            raise InvalidOperation("cannot set options after executing query")
+
+    def batch_size(self, batch_size):
+        if not isinstance(batch_size, int):
+            raise TypeError("batch_size must be an integer")
+        if batch_size < 0:
+            raise ValueError("batch_size must be >= 0")
+        self._Cursor__check_okay_to_chain()
+        self._Cursor__batch_size = batch_size
+        return self
+
+    def rewind(self):
+        super(MockCursor, self).rewind()
+        self._Cursor__data = deque()
+        self._Cursor__killed = False
+        self._Cursor__id = None
+        return self
+
+    def close(self):
+        super(MockCursor, self).close()
+        self._Cursor__killed = True
+
+    @property
+    def alive(self):
+        return bool(self._Cursor__data) or not self._Cursor__killed
+
+    def clone(self):
+        cursor = MockCursor(self.collection, self._spec, self._sort, self._projection,
+                            self._skip, self._limit, wrap=self._wrap)
+        cursor._factory = self._factory
+        cursor._Cursor__batch_size = self._Cursor__batch_size
+        return cursor
+
+    def distinct(self, key, session=None):
+        # in the order the values are found, as the server does
+        values = []
+        seen = set()
+        for son in self._compute_results():
+            for candidates in filtering.iter_key_candidates(key, son):
+                if candidates is filtering.NOTHING:
+                    continue
+                if not isinstance(candidates, (tuple, list)):
+                    candidates = [candidates]
+                for value in candidates:
+                    hashable = helpers.hashdict(value) if isinstance(value, dict) else value
+                    if hashable not in seen:
+                        seen.add(hashable)
+                        values.append(value)
+        return values
+
+    def _read_preference(self):
+        return self.collection.read_preference
+
+    # the attributes of pymongo's cursor used by the paginators
+
+    @property
+    def _Cursor__collection(self):
+        return self.collection
+
+    @property
+    def _Cursor__spec(self):
+        return self._spec
+
+    @_Cursor__spec.setter
+    def _Cursor__spec(self, spec):
+        self._spec = spec
+        self._factory = functools.partial(
+            self.collection._get_dataset, self._spec, self._sort, self._projection, dict)
+
+    @property
+    def _Cursor__ordering(self):
+        return self._sort
+
+    @property
+    def _Cursor__skip(self):
+        return self._skip
+
+    @property
+    def _Cursor__limit(self):
+        return self._limit or 0
+
+    @property
+    def _Cursor__projection(self):
+        return self._projection
+
+    @_Cursor__projection.setter
+    def _Cursor__projection(self, projection):
+        self._projection = projection
+        self._factory = functools.partial(
+            self.collection._get_dataset, self._spec, self._sort, self._projection, dict)
+
+
+class MockCollection(CollectionMixin, mongomock.Collection):
+    def _new_collection(self, name):
+        return self.database.get_collection(name)
+
+    def find(self, filter=None, projection=None, skip=0, limit=0, sort=None, **kwargs):
+        wrap = kwargs.pop('wrap', None)
+        # let mongomock check the arguments
+        cursor = super(MockCollection, self).find(filter, projection, skip, limit, sort=sort, **kwargs)
+        cursor = MockCursor(self, cursor._spec, cursor._sort, projection, skip, limit,
+                            collation=kwargs.get('collation'), wrap=wrap)
+        if kwargs.get('batch_size'):
+            cursor.batch_size(kwargs['batch_size'])
+        return cursor
+
+    def insert_many(self, documents, *args, **kwargs):
+        # mongomock only accepts dicts (see Document.bulk_load)
+        documents = [bson.decode(doc.raw) if isinstance(doc, RawBSONDocument) else doc
+                     for doc in documents]
+        return super(MockCollection, self).insert_many(documents, *args, **kwargs)
+
+
+class MockDatabase(DatabaseMixin, mongomock.Database):
+    def __init__(self, *args, **kwargs):
+        super(MockDatabase, self).__init__(*args, **kwargs)
+        # share the cache of the collections with mongomock
+        self._collection_accesses = self._collections
+
+    def _new_collection(self, name):
+        return self.get_collection(name)
+
+    def get_collection(self, name, codec_options=None, read_preference=None,
+                       write_concern=None, read_concern=None):
+        collection = self._collection_accesses.get(name)
+        if collection is None:
+            self._ensure_valid_collection_name(name)
+            collection = self._collection_accesses[name] = MockCollection(
+                self, name=name, read_preference=read_preference or self.read_preference,
+                codec_options=codec_options or self._codec_options, _db_store=self._store)
+        return collection
+
+    def last_status(self):
+        return {'ok': 1.}
+
+
+class MockConnection(MongoPieConnection, mongomock.MongoClient):
+    """
+    Connection to an in-memory server. The connections created with the
+    same `store` (a :class:`mongomock.store.ServerStore`) share their data.
+    """
+    def __init__(self, *args, **kwargs):
+        if 'store' in kwargs:
+            kwargs['_store'] = kwargs.pop('store')
+        # mongomock only takes a read preference object
+        if isinstance(kwargs.get('readPreference'), str):
+            mode = read_pref_mode_from_name(kwargs.pop('readPreference'))
+            kwargs['read_preference'] = make_read_preference(mode, None)
+        super(MockConnection, self).__init__(*args, **kwargs)
+        # share the cache of the databases with mongomock
+        self._database_accesses = self._databases
+
+    def _new_database(self, name):
+        return self.get_database(name)
+
+    def get_database(self, name=None, codec_options=None, read_preference=None,
+                     write_concern=None):
+        if name is None:
+            return self.get_default_database()
+        database = self._database_accesses.get(name)
+        if database is None:
+            database = self._database_accesses[name] = MockDatabase(
+                self, name, read_preference=read_preference or self.read_preference,
+                codec_options=codec_options or self._codec_options, _store=self._store[name])
+        return database
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import bisect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from bson import BSON
+from pymongo.monitoring import CommandListener
+
+# upper bounds of the duration buckets in milliseconds
+DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_local = threading.local()
+_monitors = []
+
+
+def is_enabled():
+    return bool(_monitors)
+
+
+@contextmanager
+def tag(document, method):
+    """
+    attribute the commands sent by the current thread in the block to the
+    `document` class name and `method`. The innermost tag wins.
+    """
+    if not _monitors:
+        yield
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append((document, method))
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def current_tag():
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        return stack[-1]
+    return None, None
+
+
+def get_comment(connection, document, method):
+    """
+    return the comment to add to the queries of `document`.`method` sent
+    by `connection`, or None if no monitor of this connection asks for it
+    """
+    for monitor in getattr(connection, '_command_monitors', ()):
+        if monitor.comment and monitor in _monitors:
+            return "mongokit:%s.%s" % (document, method)
+    return None
+
+
+class RollingHistogram(object):
+    """
+    Histogram of the values added in the last `window` seconds. The
+    window is divided into `slots` which expire one at a time.
+    """
+    def __init__(self, window=60, slots=6, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.slot_duration = float(window) / slots
+        self._slots = deque(maxlen=slots)
+
+    def add(self, value, now=None):
+        slot = int((now or time.time()) // self.slot_duration)
+        if not self._slots or self._slots[-1][0] != slot:
+            self._slots.append((slot, [0] * (len(self.buckets) + 1)))
+        self._slots[-1][1][bisect.bisect_left(self.buckets, value)] += 1
+
+    def counts(self, now=None):
+        """
+        return the number of values in each bucket, the last one counting
+        the values greater than the last bucket bound
+        """
+        oldest = int((now or time.time()) // self.slot_duration) - self._slots.maxlen + 1
+        counts = [0] * (len(self.buckets) + 1)
+        for slot, slot_counts in self._slots:
+            if slot >= oldest:
+                for no, count in enumerate(slot_counts):
+                    counts[no] += count
+        return counts
+
+    def percentile(self, percent, now=None):
+        """
+        return the upper bound of the bucket holding the `percent`
+        percentile, or None if the histogram is empty
+        """
+        counts = self.counts(now)
+        total = sum(counts)
+        if not total:
+            return None
+        rank = total * percent / 100.
+        seen = 0
+        for no, count in enumerate(counts):
+            seen += count
+            if count and seen >= rank:
+                break
+        if no < len(self.buckets):
+            return self.buckets[no]
+        return float('inf')
+
+
+class CommandStats(object):
+    def __init__(self, window, slots):
+        self.count = 0
+        self.errors = 0
+        self.duration = 0.
+        self.max_duration = 0.
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.documents = 0
+        self.histogram = RollingHistogram(window, slots)
+
+    def add(self, duration, bytes_sent, bytes_received, documents, error=False):
+        self.count += 1
+        self.errors += error
+        self.duration += duration
+        self.max_duration = max(self.max_duration, duration)
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.documents += documents
+        self.histogram.add(duration)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'duration_ms': self.duration,
+            'max_ms': self.max_duration,
+            'p50_ms': self.histogram.percentile(50),
+            'p99_ms': self.histogram.percentile(99),
+            'histogram': list(zip(self.histogram.buckets + (float('inf'),), self.histogram.counts())),
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'documents': self.documents,
+        }
+
+
+class CommandMonitor(CommandListener):
+    """
+    pymongo command listener attributing the duration, the size and the
+    number of documents returned of each command to the document class and
+    the method which sent it (`find`, `find_one`, `one`, `fetch`, `save`,
+    `delete`, `R.to_python`, `FS.put`, `migrate`...).
+
+    >>> monitor = CommandMonitor()
+    >>> connection = Connection(event_listeners=[monitor])
+    >>> monitor.snapshot()
+    [{'document': 'MyDoc', 'method': 'find', 'command': 'find', 'count': 12, 'p99_ms': 5, ...}]
+
+    The commands sent outside of mongokit_ng have no document nor method.
+    The histograms only cover the last `window` seconds while the totals
+    cover the whole life of the monitor. If `comment` is True, the find
+    queries of the documents sent by the connections the monitor listens
+    to get a "mongokit:MyDoc.find" comment so they can be identified in
+    the server logs and profiler. If
+    `measure_size` is True, the commands and replies are encoded once more
+    to measure the bytes sent and received, which has a cost on every
+    command.
+    """
+    def __init__(self, window=60, slots=6, comment=False, measure_size=False):
+        self.window = window
+        self.slots = slots
+        self.comment = comment
+        self.measure_size = measure_size
+        self._pending = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        _monitors.append(self)
+
+    def close(self):
+        """
+        stop tagging the commands for this monitor
+        """
+        if self in _monitors:
+            _monitors.remove(self)
+
+    def started(self, event):
+        document, method = current_tag()
+        size = len(BSON.encode(event.command)) if self.measure_size else 0
+        self._pending[(event.connection_id, event.request_id)] = (document, method, size)
+
+    def succeeded(self, event):
+        self._record(event, event.reply)
+
+    def failed(self, event):
+        self._record(event, None)
+
+    def _record(self, event, reply):
+        document, method, bytes_sent = self._pending.pop(
+            (event.connection_id, event.request_id), (None, None, 0))
+        bytes_received = 0
+        documents = 0
+        if reply is not None:
+            if self.measure_size:
+                bytes_received = len(BSON.encode(reply))
+            cursor = reply.get('cursor')
+            if isinstance(cursor, dict):
+                documents = len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+        key = (document, method, event.command_name)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = CommandStats(self.window, self.slots)
+            stats.add(event.duration_micros / 1000., bytes_sent, bytes_received, documents,
+                      error=reply is None)
+
+    def snapshot(self):
+        """
+        return the statistics by document, method and command name, the
+        most time consuming first
+        """
+        with self._lock:
+            items = [(key, stats.to_dict()) for key, stats in self._stats.items()]
+        snapshot = []
+        for (document, method, command), stats in items:
+            stats.update({'document': document, 'method': method, 'command': command})
+            snapshot.append(stats)
+        snapshot.sort(key=lambda stats: stats['duration_ms'], reverse=True)
+        return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
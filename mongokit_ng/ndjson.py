@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Streaming JSON export of query results, see :meth:`Cursor.to_ndjson`.
+
+The raw documents of each batch received are written one per line in the
+format of :meth:`Document.to_json`, the documents are never instantiated
+nor copied. The datetimes and ObjectIds are converted by the encoder
+itself, so only the i18n and autoref fields (taken from the structure)
+are walked.
+"""
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+from bson.dbref import DBRef
+from bson.objectid import ObjectId
+
+from .cursor import _attach_refs, _get_autoref_paths, _get_ref_database, _missing_reference
+from .helpers import totimestamp
+
+BACKENDS = ('json', 'orjson')
+
+
+def _default(value):
+    # the conversions done by Document.to_json_type()
+    if isinstance(value, datetime.datetime):
+        return totimestamp(value)
+    if isinstance(value, ObjectId):
+        return {'$oid': str(value)}
+    raise TypeError("Object of type %s is not JSON serializable" % value.__class__.__name__)
+
+
+def get_encoder(backend):
+    """
+    return a function encoding a raw document into a json string
+    """
+    if backend == 'json':
+        return json.JSONEncoder(default=_default).encode
+    if backend == 'orjson':
+        if orjson is None:
+            raise ImportError("the orjson backend requires orjson, please install it")
+        # datetimes would be written as ISO strings otherwise
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+        return lambda son: orjson.dumps(son, default=_default, option=option).decode('utf-8')
+    raise ValueError("backend must be one of %s, not %r" % (', '.join(BACKENDS), backend))
+
+
+def _convert_i18n(doc, bits):
+    key, rest = bits[0], bits[1:]
+    if not isinstance(doc, dict) or doc.get(key) is None:
+        return
+    if rest:
+        _convert_i18n(doc[key], rest)
+    elif isinstance(doc[key], list):
+        doc[key] = dict((item['lang'], item['value']) for item in doc[key])
+
+
+def convert_i18n(doc_class, sons):
+    """
+    convert the i18n fields of the raw documents `sons` into dicts of
+    values by language
+    """
+    for path in doc_class.i18n:
+        bits = path.split('.')
+        for son in sons:
+            _convert_i18n(son, bits)
+
+
+def resolve_references(collection, doc_class, sons, annotate=True):
+    """
+    replace the DBRefs held by the autoref fields of the raw documents
+    `sons` of `collection` by the raw referenced documents, like
+    :meth:`Document.to_json` does. They are fetched with one query per
+    referenced collection, and their own autorefs are resolved the same
+    way. If `annotate` is True, the referenced documents get the
+    `_collection` and `_database` of `collection`.
+    """
+    paths = _get_autoref_paths(doc_class) if doc_class.use_autorefs else []
+    if not paths or not sons:
+        return
+    client = collection.database.client
+    fallback = collection.database.name if doc_class.force_autorefs_current_db else None
+    wanted = {}
+    for path, ref_class in paths:
+        def collect(value, ref_class=ref_class):
+            if isinstance(value, DBRef):
+                key = (_get_ref_database(value, fallback), value.collection, ref_class)
+                wanted.setdefault(key, set()).add(value.id)
+            return value
+        for son in sons:
+            _attach_refs(son, doc_class.structure, path.split('.'), collect)
+    if not wanted:
+        return
+
+    found = {}
+    for key, ids in wanted.items():
+        database, name, ref_class = key
+        target = client[database][name]
+        ref_sons = list(target.find({'_id': {'$in': list(ids)}}))
+        convert_i18n(ref_class, ref_sons)
+        resolve_references(target, ref_class, ref_sons, annotate=False)
+        found[key] = dict((son['_id'], son) for son in ref_sons)
+    for path, ref_class in paths:
+        def resolve(value, ref_class=ref_class):
+            if isinstance(value, DBRef):
+                database = _get_ref_database(value, fallback)
+                son = found[(database, value.collection, ref_class)].get(value.id)
+                if son is None:
+                    raise _missing_reference(ref_class, database, value.id)
+                if annotate:
+                    son['_collection'] = collection.name
+                    son['_database'] = collection.database.name
+                return son
+            return value
+        for son in sons:
+            _attach_refs(son, doc_class.structure, path.split('.'), resolve)
+
+
+def to_ndjson(batches, fileobj, collection, doc_class=None, backend='json'):
+    """
+    write the raw documents of `batches` (lists of documents of
+    `collection`) into the text file `fileobj`, one json document per
+    line. Return the number of documents written.
+    """
+    encode = get_encoder(backend)
+    registered = getattr(collection, '_registered_documents', {})
+    count = 0
+    for sons in batches:
+        if doc_class is not None:
+            # a document holding a `type_field` is exported by its own class
+            by_class = {}
+            for son in sons:
+                son_class = doc_class
+                if doc_class.type_field in son and son[doc_class.type_field] in registered:
+                    son_class = registered[son[doc_class.type_field]]._obj_class
+                by_class.setdefault(son_class, []).append(son)
+            for son_class, class_sons in by_class.items():
+                convert_i18n(son_class, class_sons)
+                resolve_references(collection, son_class, class_sons)
+        lines = []
+        for son in sons:
+            # inline gridfs files are not part of the json representation
+            son.pop('_fs', None)
+            lines.append(encode(son))
+        if lines:
+            lines.append('')
+            fileobj.write('\n'.join(lines))
+        count += len(sons)
+    return count
@@ -25,42 +25,139 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import base64
+import time
+
+from bson import BSON
+from bson.errors import BSONError
+from pymongo import ASCENDING
 
 DEFAULT_LIMIT = 10
 
+COUNT_EXACT = 'exact'
+COUNT_ESTIMATED = 'estimated'
+COUNT_NONE = None
+
+
+class CountCache(object):
+    """ Caches the totals computed by Paginator for `ttl` seconds
+
+    The totals are keyed by collection, query filter and count strategy so
+    a cache can be shared by all the paginators of an application.
+    """
+
+    def __init__(self, ttl=60, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache = {}
+
+    def _get_key(self, collection, spec, strategy, count_limit):
+        return (collection.full_name, BSON.encode(spec or {}), strategy, count_limit)
+
+    def get(self, collection, spec, strategy, count_limit=None):
+        key = self._get_key(collection, spec, strategy, count_limit)
+        entry = self._cache.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                return entry[1]
+            self._cache.pop(key, None)
+
+    def set(self, collection, spec, strategy, count, count_limit=None):
+        if len(self._cache) >= self.max_entries:
+            now = time.time()
+            for key, entry in list(self._cache.items()):
+                if entry[0] <= now:
+                    self._cache.pop(key, None)
+            if len(self._cache) >= self.max_entries:
+                self._cache.clear()
+        key = self._get_key(collection, spec, strategy, count_limit)
+        self._cache[key] = (time.time() + self.ttl, count)
+
+    def clear(self):
+        self._cache.clear()
+
 
 class Paginator(object):
     """ Provides pagination on a Cursor object
 
     Keyword arguments:
-    cursor -- Cursor of a returned query
-    page   -- The page number requested
-    limit  -- The number of items per page
+    cursor         -- Cursor of a returned query
+    page           -- The page number requested
+    limit          -- The number of items per page
+    count_strategy -- How the total is computed:
+                      COUNT_EXACT (default) uses `count_documents`,
+                      COUNT_ESTIMATED uses `estimated_document_count` for
+                      cursors without filter (and an exact count otherwise),
+                      COUNT_NONE does not count anything.
+    count_limit    -- Stop counting after this number of items. `count` is then
+                      a lower bound (see `count_is_exact` and `count_display`)
+    count_cache    -- A CountCache instance used to cache the totals
+
+    When the total is not exact, limit + 1 items are fetched to know if
+    there is a next page and `items` is a list instead of a Cursor.
 
     Properties:
-    items        -- Returns the paginated Cursor object
-    is_paginated -- Boolean value determining if the cursor has multiple pages
-    start_index  -- int index of the first item on the requested page
-    end_index    -- int index of the last item on the requested page
-    current_page -- int page number of the requested page
-    previous_page-- int page number of the previous page w.r.t. current requested page
-    next_page    -- int page number of the next page w.r.t. current requested page
-    has_next     -- True or False if the Cursor has a next page
-    has_previous -- True or False if the Cursor has a previous page
-    page_range   -- list of page numbers
-    num_pages    -- int of the number of pages
-    count        -- int total number of items on the cursor
+    items          -- Returns the paginated Cursor object (or list, see above)
+    is_paginated   -- Boolean value determining if the cursor has multiple pages
+    start_index    -- int index of the first item on the requested page
+    end_index      -- int index of the last item on the requested page
+    current_page   -- int page number of the requested page
+    previous_page  -- int page number of the previous page w.r.t. current requested page
+    next_page      -- int page number of the next page w.r.t. current requested page
+    has_next       -- True or False if the Cursor has a next page
+    has_previous   -- True or False if the Cursor has a previous page
+    page_range     -- list of page numbers
+    num_pages      -- int of the number of pages (known so far if the count is not exact)
+    count          -- int total number of items on the cursor (None with COUNT_NONE)
+    count_is_exact -- True or False if count is the exact total
+    count_display  -- str of the total, ie "1000+" when count_limit is reached
     """
 
-    def __init__(self, cursor, page=1, limit=DEFAULT_LIMIT):
+    def __init__(self, cursor, page=1, limit=DEFAULT_LIMIT, count_strategy=COUNT_EXACT, count_limit=None,
+                 count_cache=None):
         self._cursor = cursor
-        self._count = self._cursor.count() if cursor else 0
         self._limit = limit
         self._page = int(page)
+        self._items = None
+        self._has_more = False
+        self._count_limit = count_limit
+        self._count_is_exact = True
+        if not cursor:
+            self._count = 0
+        else:
+            self._count = self._get_count(count_strategy, count_limit, count_cache)
+            if self._count is None or (count_limit is not None and self._count >= count_limit):
+                self._count_is_exact = False
         self._set_page(self._page)
 
+    def _get_count(self, strategy, count_limit, count_cache):
+        if strategy == COUNT_NONE:
+            return None
+        collection = self._cursor.collection
+        spec = self._cursor._Cursor__spec
+        if count_cache is not None:
+            count = count_cache.get(collection, spec, strategy, count_limit)
+            if count is not None:
+                return count
+        if strategy == COUNT_ESTIMATED and not spec:
+            count = collection.estimated_document_count()
+            if count_limit is not None:
+                count = min(count, count_limit)
+        elif strategy in (COUNT_EXACT, COUNT_ESTIMATED):
+            kwargs = {}
+            if count_limit is not None:
+                kwargs['limit'] = count_limit
+            count = collection.count_documents(spec or {}, **kwargs)
+        else:
+            raise ValueError("unknown count strategy: %r" % strategy)
+        if count_cache is not None:
+            count_cache.set(collection, spec, strategy, count, count_limit)
+        return count
+
     @property
     def items(self):
+        if self._items is not None:
+            return self._items
         return self._cursor
 
     @property
@@ -77,6 +174,9 @@ class Paginator(object):
 
     @property
     def end_index(self):
+        if not self._count_is_exact:
+            return self.start_index + len(self._items) - 1
+
         if self._limit == 1:
             return self._page
 
@@ -100,6 +200,8 @@ class Paginator(object):
 
     @property
     def has_next(self):
+        if not self._count_is_exact:
+            return self._has_more
         return self.end_index < self._count
 
     @property
@@ -112,12 +214,22 @@ class Paginator(object):
 
     @property
     def num_pages(self):
-        if self._count <= 0:
+        if not self._count_is_exact:
+            known = self._page + 1 if self._has_more else self._page
+            if not self._items and not self._has_more:
+                known = self._page - 1
+            if self._count:
+                known = max(known, self._pages_for(self._count))
+            return known
+        return self._pages_for(self._count)
+
+    def _pages_for(self, count):
+        if count <= 0:
             return 0
-        if self._count <= self._limit:
+        if count <= self._limit:
             return 1
 
-        pages_f = self._count / float(self._limit)
+        pages_f = count / float(self._limit)
         pages_i = int(pages_f)
 
         return (pages_i + 1) if pages_f > pages_i else pages_i
@@ -126,9 +238,154 @@ class Paginator(object):
     def count(self):
         return self._count
 
+    @property
+    def count_is_exact(self):
+        return self._count_is_exact
+
+    @property
+    def count_display(self):
+        if self._count is None:
+            return ''
+        if not self._count_is_exact:
+            return '%s+' % self._count
+        return str(self._count)
+
     def _set_page(self, _):
         if self._page > 1:
             self._cursor.skip(self.start_index - 1)
 
         if self._cursor:
-            self._cursor.limit(self._limit)
+            if self._count_is_exact:
+                self._cursor.limit(self._limit)
+            else:
+                self._cursor.limit(self._limit + 1)
+                items = list(self._cursor)
+                self._has_more = len(items) > self._limit
+                self._items = items[:self._limit]
+
+
+class KeysetPaginator(object):
+    """ Provides keyset (range) pagination on a Cursor object
+
+    Instead of skipping the documents of the previous pages, the page is
+    fetched with a range query on the sort key starting after (or before)
+    the key of the last (or first) item of the previous page. Each page
+    costs the same no matter how deep it is, as long as the sort key is
+    indexed. The last field of the sort key must be unique (ie `_id`).
+    Null or missing values are allowed in the other fields and sort first,
+    as in MongoDB.
+
+    Keyword arguments:
+    cursor -- Cursor of a returned query (not iterated nor sorted yet)
+    sort   -- list of (field, direction) used as sort key, ie [('created', -1), ('_id', -1)]
+    token  -- continuation token of the requested page (None for the first page)
+    limit  -- The number of items per page
+
+    Properties:
+    items          -- list of the items of the requested page
+    has_next       -- True or False if the Cursor has a next page
+    has_previous   -- True or False if the Cursor has a previous page
+    next_token     -- token of the next page (None if there is no next page)
+    previous_token -- token of the previous page (None if there is no previous page)
+    """
+
+    def __init__(self, cursor, sort=None, token=None, limit=DEFAULT_LIMIT):
+        self._cursor = cursor
+        self._sort = [(key, ASCENDING) if isinstance(key, str) else tuple(key)
+                      for key in (sort or [('_id', ASCENDING)])]
+        self._limit = limit
+        self._token = token
+        self._has_more = False
+        self._backward = False
+        self._items = []
+        self._fetch()
+
+    @property
+    def items(self):
+        return self._items
+
+    @property
+    def has_next(self):
+        if self._backward:
+            return True
+        return self._has_more
+
+    @property
+    def has_previous(self):
+        if self._backward:
+            return self._has_more
+        return self._token is not None and bool(self._items)
+
+    @property
+    def next_token(self):
+        if self.has_next and self._items:
+            return self._make_token(self._items[-1], 1)
+
+    @property
+    def previous_token(self):
+        if self.has_previous and self._items:
+            return self._make_token(self._items[0], -1)
+
+    def _get_key(self, item):
+        values = []
+        for field, _ in self._sort:
+            value = item
+            for bit in field.split('.'):
+                value = value.get(bit) if isinstance(value, dict) else None
+            values.append(value)
+        return values
+
+    def _make_token(self, item, direction):
+        data = BSON.encode({'k': self._get_key(item), 'd': direction})
+        return base64.urlsafe_b64encode(data).decode('ascii')
+
+    def _parse_token(self, token):
+        try:
+            data = BSON(base64.urlsafe_b64decode(token.encode('ascii'))).decode()
+        except (BSONError, ValueError, TypeError):
+            raise ValueError("invalid pagination token: %r" % token)
+        if len(data.get('k', [])) != len(self._sort) or data.get('d') not in (1, -1):
+            raise ValueError("invalid pagination token: %r" % token)
+        return data['k'], data['d']
+
+    def _range_query(self, values, backward):
+        # (a, b) > (x, y) <=> a > x or (a == x and b > y)
+        # null and missing values sort before any other value, and
+        # {field: None} matches both of them
+        clauses = []
+        for i, (field, direction) in enumerate(self._sort):
+            after = (direction == ASCENDING) != backward
+            clause = dict((f, values[j]) for j, (f, _) in enumerate(self._sort[:i]))
+            if values[i] is None:
+                if not after:
+                    # nothing sorts before null
+                    continue
+                clause[field] = {'$ne': None}
+            elif after:
+                clause[field] = {'$gt': values[i]}
+            else:
+                clause['$or'] = [{field: {'$lt': values[i]}}, {field: None}]
+            clauses.append(clause)
+        if not clauses:
+            return {self._sort[0][0]: {'$in': []}}
+        if len(clauses) == 1:
+            return clauses[0]
+        return {'$or': clauses}
+
+    def _fetch(self):
+        sort = self._sort
+        if self._token is not None:
+            values, direction = self._parse_token(self._token)
+            self._backward = direction == -1
+            query = self._range_query(values, self._backward)
+            spec = self._cursor._Cursor__spec
+            self._cursor._Cursor__spec = {'$and': [spec, query]} if spec else query
+            if self._backward:
+                sort = [(field, -direction) for field, direction in sort]
+        self._cursor.sort(sort).limit(self._limit + 1)
+        items = list(self._cursor)
+        self._has_more = len(items) > self._limit
+        items = items[:self._limit]
+        if self._backward:
+            items.reverse()
+        self._items = items
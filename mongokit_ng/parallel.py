@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Parallel scan of a collection, see :meth:`Document.parallel_scan`.
+
+The documents are split into ranges of a key (`_id` by default) whose
+boundaries are picked from a `$sample` of the collection. Each range is
+read by its own cursor, in a thread or in a process.
+"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+
+from bson.decimal128 import Decimal128
+from bson.int64 import Int64
+from pymongo import ASCENDING, MongoClient
+
+# documents sampled per range to pick the boundaries
+OVERSAMPLING = 20
+
+_NUMBER_TYPES = (int, float, Int64, Decimal128, Decimal)
+
+
+def _type_group(value):
+    # the server compares the numbers whatever their type
+    if isinstance(value, _NUMBER_TYPES) and not isinstance(value, bool):
+        return 'number'
+    return type(value)
+
+
+def get_boundaries(collection, splits, key='_id', filter=None, oversampling=OVERSAMPLING):
+    """
+    return at most `splits` - 1 sorted values of `key` splitting the
+    documents matching `filter` into ranges of about the same size.
+    """
+    if splits < 2:
+        return []
+    pipeline = []
+    if filter:
+        pipeline.append({'$match': filter})
+    pipeline.extend([
+        {'$sample': {'size': splits * oversampling}},
+        {'$match': {key: {'$ne': None}}},
+        {'$project': {'_id': 0, 'value': '$' + key}},
+        {'$sort': {'value': ASCENDING}},
+    ])
+    values = [doc['value'] for doc in collection.aggregate(pipeline)]
+    # a range query only matches the values of the type of its bounds, the
+    # boundaries are all of the most common type
+    if values:
+        group = Counter(_type_group(value) for value in values).most_common(1)[0][0]
+        values = [value for value in values if _type_group(value) == group]
+    boundaries = []
+    for no in range(1, splits):
+        if not values:
+            break
+        value = values[no * len(values) // splits]
+        if not boundaries or value != boundaries[-1]:
+            boundaries.append(value)
+    return boundaries
+
+
+def get_range_filters(boundaries, key='_id', filter=None):
+    """
+    return the queries matching the ranges delimited by `boundaries`. The
+    first range also gets the documents whose `key` is missing or of
+    another type than the boundaries so every document is in one range.
+    """
+    bounds = [None] + list(boundaries) + [None]
+    filters = []
+    for lower, upper in zip(bounds, bounds[1:]):
+        if lower is None and upper is None:
+            spec = {}
+        elif lower is None:
+            spec = {key: {'$not': {'$gte': upper}}}
+        elif upper is None:
+            spec = {key: {'$gte': lower}}
+        else:
+            spec = {key: {'$gte': lower, '$lt': upper}}
+        if filter:
+            spec = {'$and': [filter, spec]} if spec else filter
+        filters.append(spec)
+    return filters
+
+
+def scan_range(document, fn, spec, key='_id', batch_size=None):
+    """
+    apply `fn` to the documents matching `spec`, sorted by `key`, and
+    return the results which are not None
+    """
+    cursor = document.find(spec).sort(key, ASCENDING)
+    if batch_size:
+        cursor = cursor.batch_size(batch_size)
+    results = []
+    for doc in cursor:
+        result = fn(doc)
+        if result is not None:
+            results.append(result)
+    return results
+
+
+def _scan_range_in_process(connection_class, connection_kwargs, database, collection,
+                           doc_class, fn, spec, key, batch_size):
+    # a worker process can run the scans of several connections and classes
+    connection_key = (connection_class, frozenset(connection_kwargs.items()))
+    connection = _connections.get(connection_key)
+    if connection is None:
+        connection = _connections[connection_key] = connection_class(**connection_kwargs)
+    connection.register([doc_class])
+    document = getattr(connection[database][collection], doc_class.__name__)
+    return scan_range(document, fn, spec, key, batch_size)
+
+
+# connections of a worker process, by class and arguments
+_connections = {}
+
+
+def parallel_scan(document, fn, workers=4, filter=None, mode='thread', key='_id',
+                  splits=None, batch_size=None, uri=None, connection_kwargs=None):
+    """
+    Apply `fn` to the documents of `document` (a document bound to a
+    collection) matching `filter` with `workers` threads or processes,
+    and return the values returned by `fn` which are not None, in the
+    order of `key`.
+
+    The processes connect to the server with the `uri` and the
+    `connection_kwargs` (hashable values) given, one of them is required.
+    """
+    if mode not in ('thread', 'process'):
+        raise ValueError("mode must be 'thread' or 'process' not %r" % mode)
+    if mode == 'process' and uri is None and not connection_kwargs:
+        raise ValueError("the process mode needs the uri or the connection_kwargs of the server")
+    splits = splits or workers
+    collection = document.collection
+    boundaries = get_boundaries(collection, splits, key=key, filter=filter)
+    specs = get_range_filters(boundaries, key=key, filter=filter)
+    if mode == 'thread':
+        # the connection is shared, each cursor gets a socket of the pool
+        with ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(scan_range, document, fn, spec, key, batch_size)
+                       for spec in specs]
+            results = [future.result() for future in futures]
+    else:
+        connection = collection.database.connection
+        if not isinstance(connection, MongoClient):
+            raise TypeError("the process mode needs a connection to a server")
+        # each process opens its own connection
+        connection_kwargs = dict(connection_kwargs or {})
+        if uri is not None:
+            connection_kwargs['host'] = uri
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(
+                _scan_range_in_process, type(connection), connection_kwargs,
+                collection.database.name, collection.name, document._obj_class,
+                fn, spec, key, batch_size) for spec in specs]
+            results = [future.result() for future in futures]
+    return [result for range_results in results for result in range_results]
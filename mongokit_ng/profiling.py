@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+CPU profiling hooks for the document lifecycle.
+
+The hooks are always in place but only record something once enabled:
+
+>>> from mongokit_ng import profiling
+>>> profiling.enable()
+>>> ...
+>>> profiling.snapshot()
+{'phases': [{'document': 'MyDoc', 'phase': 'validate_doc', 'count': 120, 'total_ms': 8.2, ...}],
+ 'validation_paths': [{'document': 'MyDoc', 'path': 'comments.author', 'count': 120, ...}]}
+
+For each document class and phase (`skeleton`, `process_custom_type`,
+`validate_doc`, `make_reference`, `get_size`, `wrap`, `to_json_type`),
+the number of calls and the cumulative time are recorded. Recursive calls
+of a phase are counted once. The time spent to validate each path of the
+structure (nested paths included) is recorded as well.
+"""
+import functools
+import threading
+from time import perf_counter
+
+
+class _State(object):
+    enabled = False
+
+
+_state = _State()
+_lock = threading.Lock()
+_local = threading.local()
+_phases = {}
+_paths = {}
+
+
+def enable():
+    _state.enabled = True
+
+
+def disable():
+    _state.enabled = False
+
+
+def is_enabled():
+    return _state.enabled
+
+
+def reset():
+    with _lock:
+        _phases.clear()
+        _paths.clear()
+
+
+def _add(stats, key, elapsed):
+    with _lock:
+        entry = stats.get(key)
+        if entry is None:
+            entry = stats[key] = [0, 0., 0.]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+
+
+def record(document, phase, elapsed):
+    _add(_phases, (document, phase), elapsed)
+
+
+def record_path(document, path, elapsed):
+    _add(_paths, (document, path), elapsed)
+
+
+def _get_active():
+    active = getattr(_local, 'active', None)
+    if active is None:
+        active = _local.active = set()
+    return active
+
+
+def profiled(phase):
+    """
+    decorator recording the time spent in a method of a document under
+    `phase`
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not _state.enabled:
+                return method(self, *args, **kwargs)
+            active = _get_active()
+            if phase in active:
+                return method(self, *args, **kwargs)
+            active.add(phase)
+            start = perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                active.discard(phase)
+                record(self.__class__.__name__, phase, perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def _to_list(stats, name, top):
+    items = []
+    for (document, key), (count, total, maximum) in stats.items():
+        items.append({
+            'document': document,
+            name: key,
+            'count': count,
+            'total_ms': total * 1000,
+            'mean_ms': total * 1000 / count,
+            'max_ms': maximum * 1000,
+        })
+    items.sort(key=lambda item: item['total_ms'], reverse=True)
+    if top is not None:
+        items = items[:top]
+    return items
+
+
+def snapshot(top=None, top_paths=20):
+    """
+    return the recorded phases and the `top_paths` slowest validation
+    paths, the most time consuming first
+    """
+    with _lock:
+        phases = dict((key, list(value)) for key, value in _phases.items())
+        paths = dict((key, list(value)) for key, value in _paths.items())
+    return {
+        'phases': _to_list(phases, 'phase', top),
+        'validation_paths': _to_list(paths, 'path', top_paths),
+    }
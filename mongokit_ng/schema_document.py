@@ -29,6 +29,7 @@ import bson
 import datetime
 import logging
 from copy import deepcopy
+from time import perf_counter
 
 log = logging.getLogger(__name__)
 
@@ -37,6 +38,7 @@ from .helpers import DotCollapsedDict
 from .helpers import DotExpandedDict
 from .helpers import i18nDotedDict
 from .helpers import DotedDict
+from .profiling import profiled, record_path, _state as _profiling
 
 __all__ = [
     'AuthorizedTypeError',
@@ -375,6 +377,7 @@ class SchemaDocument(dict, metaclass=SchemaProperties):
         if self.i18n:
             self._make_i18n()
 
+    @profiled('skeleton')
     def generate_skeleton(self):
         """
         validate and generate the skeleton of the document
@@ -566,6 +569,7 @@ class SchemaDocument(dict, metaclass=SchemaProperties):
                 self.validation_errors[field] = []
             self.validation_errors[field].append(exception(message))
 
+    @profiled('validate_doc')
     def _validate_doc(self, doc, struct, path=""):
         """
         check if doc field types match the doc field structure
@@ -625,8 +629,12 @@ class SchemaDocument(dict, metaclass=SchemaProperties):
                                                   "key of %s must be an instance of %s not %s" % (
                                                       path, key.__name__, type(doc_key).__name__))
                         self._validate_doc(doc[doc_key], struct[key], new_path)
-                else:
-                    if key in doc:
+                elif key in doc:
+                    if _profiling.enabled:
+                        start = perf_counter()
+                        self._validate_doc(doc[key], struct[key], new_path)
+                        record_path(self.__class__.__name__, new_path, perf_counter() - start)
+                    else:
                         self._validate_doc(doc[key], struct[key],  new_path)
         elif isinstance(struct, list):
             if not isinstance(doc, list) and not isinstance(doc, tuple):
@@ -663,6 +671,7 @@ class SchemaDocument(dict, metaclass=SchemaProperties):
                         self._raise_exception(ValidationError, key,
                                               str(e) % key)
 
+    @profiled('process_custom_type')
     def _process_custom_type(self, target, doc, struct, path="", root_path=""):
         for key in struct:
             if type(key) is type:
@@ -25,6 +25,10 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+from collections.abc import Mapping
+
+from pymongo import DeleteMany
+
 from .document import Document
 
 
@@ -80,9 +84,10 @@ class VersionedDocument(Document):
         documents, this might be very very slow.
         """
         if versioning:
-            id_lists = [i['_id'] for i in self.collection.find(query, projection=['_id'])]
+            spec = query if query is None or isinstance(query, Mapping) else {'_id': query}
+            id_lists = [i['_id'] for i in self.collection.find(spec, projection=['_id'])]
             self.versioning_collection.remove({'id': {'$in': id_lists}})
-        self.collection.remove(spec_or_id=query, *args, **kwargs)
+        return super(VersionedDocument, self).remove(query, *args, **kwargs)
 
     def get_revision(self, revision_number):
         doc = self.versioning_collection.RevisionDocument.find_one(
@@ -95,6 +100,30 @@ class VersionedDocument(Document):
         for verdoc in versionned_docs:
             yield self.__class__(verdoc['doc'], collection=self.collection)
 
+    @classmethod
+    def compact_revisions(cls, collection, keep=10, batch_size=1000):
+        """
+        delete the revisions of the documents of `collection` but the
+        `keep` last ones. Return the number of revisions deleted.
+        """
+        if keep < 1:
+            raise ValueError("at least one revision must be kept")
+        versioning_collection = collection.database["versioned_%s" % collection.name]
+        pipeline = [
+            {'$group': {'_id': '$id', 'last': {'$max': '$revision'}}},
+            {'$match': {'last': {'$gt': keep}}},
+        ]
+        deleted = 0
+        requests = []
+        for group in versioning_collection.aggregate(pipeline, allowDiskUse=True):
+            requests.append(DeleteMany({'id': group['_id'], 'revision': {'$lte': group['last'] - keep}}))
+            if len(requests) >= batch_size:
+                deleted += versioning_collection.bulk_write(requests, ordered=False).deleted_count
+                requests = []
+        if requests:
+            deleted += versioning_collection.bulk_write(requests, ordered=False).deleted_count
+        return deleted
+
     def get_last_revision_id(self):
         last_doc = next(self.versioning_collection.find({'id': str(self['_id'])}).sort('revision', -1))
         if last_doc:
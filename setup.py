@@ -18,6 +18,18 @@ setup_requirements = []
 
 test_requirements = []
 
+extras_requirements = {
+    # mock.py uses the internals of mongomock 4.1
+    'mock': ['mongomock>=4.1; python_version >= "3.6"'],
+    'cli': ['click>=7.0'],
+    # motor 3 needs pymongo 4, motor 2 doesn't import on python 3.11+ and
+    # the asyncio API needs python 3.7
+    'async': ['motor>=2.1,<3; python_version >= "3.7" and python_version < "3.11"'],
+    'numpy': ['numpy>=1.15'],
+    'arrow': ['pyarrow>=1.0'],
+    'orjson': ['orjson>=3.0'],
+}
+
 setup(
     author="Windfarer",
     author_email='windfarer@gmail.com',
@@ -34,7 +46,13 @@ setup(
         'Programming Language :: Python :: 3.8',
     ],
     description="mongokit with python3 and pymongo3+",
+    entry_points={
+        'console_scripts': [
+            'mongokit-ng=mongokit_ng.cli:main [cli]',
+        ],
+    },
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
     long_description_content_type='text/markdown',
@@ -1,3 +1,32 @@
 # -*- coding: utf-8 -*-
 
 """Unit test package for mongokit_ng."""
+import os
+import unittest
+
+# MONGOKIT_TEST_BACKEND=mock runs the tests on the in-memory backend
+MOCK_BACKEND = os.environ.get('MONGOKIT_TEST_BACKEND') == 'mock'
+
+
+def skip_on_mock(reason):
+    """
+    skip a test using a feature mongomock doesn't implement
+    """
+    return unittest.skipIf(MOCK_BACKEND, reason)
+
+
+if MOCK_BACKEND:
+    import mongokit_ng
+    from mongomock.store import ServerStore
+    from mongokit_ng.mock import MockConnection
+
+    _store = ServerStore()
+
+    class Connection(MockConnection):
+        def __init__(self, *args, **kwargs):
+            # all the connections of the tests share the same data, as
+            # with a server
+            kwargs.setdefault('store', _store)
+            super(Connection, self).__init__(*args, **kwargs)
+
+    mongokit_ng.Connection = Connection
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import importlib.util
+import sys
+import unittest
+
+from mongokit_ng import *
+from tests import skip_on_mock
+from gridfs import NoFile
+
+unsupported = None
+if sys.version_info < (3, 8):
+    unsupported = "the asyncio tests need python 3.8+"
+elif sys.version_info >= (3, 11):
+    unsupported = "motor 2 does not import on python 3.11+"
+elif importlib.util.find_spec('motor') is None:
+    unsupported = "motor is not installed"
+else:
+    from mongokit_ng.aio import AsyncConnection, AsyncCursor, AsyncDocument
+
+
+@unittest.skipIf(unsupported, unsupported)
+@skip_on_mock('motor needs a server')
+class AsyncTestCase(getattr(unittest, 'IsolatedAsyncioTestCase', unittest.TestCase)):
+    async def asyncSetUp(self):
+        self.connection = AsyncConnection()
+        self.col = self.connection['test']['mongokit']
+
+    async def asyncTearDown(self):
+        await self.connection.drop_database('test')
+        self.connection.close()
+
+    async def test_find_and_save(self):
+        class MyDoc(Document):
+            structure = {
+                'foo': int,
+                'bar': {'bla': str},
+            }
+            required_fields = ['foo']
+        self.connection.register([MyDoc])
+        for i in range(10):
+            doc = self.col.MyDoc()
+            doc['foo'] = i
+            doc['bar']['bla'] = str(i)
+            assert await doc.save() is doc
+        assert isinstance(doc, MyDoc)
+        assert isinstance(doc, AsyncDocument)
+
+        doc = await self.col.MyDoc.find_one({'foo': 3})
+        assert doc['bar']['bla'] == '3'
+        assert isinstance(doc, MyDoc)
+        assert await self.col.MyDoc.find_one(doc['_id']) == doc
+        assert await self.col.MyDoc.find_one({'foo': 42}) is None
+        with self.assertRaises(MultipleResultsFound):
+            await self.col.MyDoc.one()
+
+        cursor = self.col.MyDoc.find({'foo': {'$gt': 4}}).sort('foo', -1).batch_size(2)
+        assert isinstance(cursor, AsyncCursor)
+        values = []
+        async for doc in cursor:
+            values.append(doc['foo'])
+        assert values == [9, 8, 7, 6, 5]
+        docs = await self.col.MyDoc.find().sort('foo').to_list(3)
+        assert [doc['foo'] for doc in docs] == [0, 1, 2]
+        assert all(isinstance(doc, MyDoc) for doc in docs)
+        assert len(await self.col.MyDoc.find_random()) == 3
+
+        doc['foo'] = 'not an int'
+        with self.assertRaises(SchemaTypeError):
+            await doc.save()
+        del doc['foo']
+        with self.assertRaises(RequireFieldError):
+            await doc.save()
+
+        await self.col.update_one({'foo': 0}, {'$set': {'bar.bla': 'reloaded'}})
+        doc = docs[0]
+        await doc.reload()
+        assert doc['bar']['bla'] == 'reloaded'
+        await doc.delete()
+        assert await self.col.count_documents({}) == 9
+        assert (await self.col.MyDoc.remove({'foo': {'$gt': 4}}))['n'] == 5
+        assert await self.col.count_documents({}) == 4
+
+    async def test_register_decorator(self):
+        @self.connection.register
+        class MyDoc(Document):
+            __database__ = 'test'
+            __collection__ = 'mongokit'
+            structure = {'foo': int}
+        doc = self.connection.MyDoc()
+        doc['foo'] = 1
+        await doc.save()
+        assert (await self.connection.MyDoc.find_one())['foo'] == 1
+
+    async def test_autorefs(self):
+        class User(Document):
+            structure = {'name': str}
+
+        class Post(Document):
+            structure = {
+                'title': str,
+                'author': User,
+                'meta': {'editors': [User]},
+            }
+            use_autorefs = True
+        self.connection.register([User, Post])
+        bob = self.connection.test.users.User()
+        bob['name'] = 'bob'
+        eve = self.connection.test.users.User()
+        eve['name'] = 'eve'
+        await eve.save()
+        for i in range(5):
+            post = self.col.Post()
+            post['title'] = str(i)
+            # bob is saved by the first post
+            post['author'] = bob
+            post['meta']['editors'] = [eve, bob]
+            await post.save()
+        assert '_id' in bob
+        assert await self.connection.test.users.count_documents({}) == 2
+        raw = await self.col.find_one({'title': '0'})
+        assert raw['author'] == bob.get_dbref()
+
+        posts = await self.col.Post.find().sort('title').to_list(None)
+        assert [post['author']['name'] for post in posts] == ['bob'] * 5
+        assert [user['name'] for user in posts[0]['meta']['editors']] == ['eve', 'bob']
+        assert isinstance(posts[0]['author'], User)
+
+        # the changed references are saved with the document
+        post = posts[0]
+        post['author']['name'] = 'robert'
+        await post.save()
+        assert (await self.connection.test.users.find_one({'_id': bob['_id']}))['name'] == 'robert'
+
+        await self.connection.test.users.delete_one({'_id': eve['_id']})
+        with self.assertRaises(AutoReferenceError):
+            await self.col.Post.find_one({'title': '1'})
+        post = self.col.Post()
+        post['title'] = 'new'
+        post['author'] = eve
+        with self.assertRaises(AutoReferenceError):
+            await post.save()
+
+    async def test_gridfs(self):
+        class MyDoc(Document):
+            structure = {'title': str}
+            gridfs = {'files': ['source'], 'containers': ['images']}
+        self.connection.register([MyDoc])
+        doc = self.col.MyDoc()
+        doc['title'] = 'foo'
+        await doc.save()
+        await doc.fs.put(b'version 1', filename='source')
+        await doc.fs.put(b'version 2', filename='source', content_type='text/plain')
+        assert await doc.fs.get('source') == b'version 2'
+        assert await doc.fs.get('source', version=0) == b'version 1'
+        grid_out = await doc.fs.open('source')
+        assert grid_out.content_type == 'text/plain'
+        assert await grid_out.read() == b'version 2'
+        with self.assertRaises(NoFile):
+            await doc.fs.open('source', version=2)
+
+        grid_in = doc.fs.images.open_upload_stream('big.png')
+        for i in range(10):
+            await grid_in.write(b'x' * 100000)
+        await grid_in.close()
+        assert len(await doc.fs.images.get('big.png')) == 1000000
+        assert [f['filename'] for f in await doc.fs.images.list()] == ['big.png']
+        assert len(await doc.fs.list()) == 3
+
+        # the files are shared with the synchronous API
+        connection = Connection()
+        connection.register([MyDoc])
+        sync_doc = connection.test.mongokit.MyDoc.find_one()
+        assert sync_doc.fs.source == b'version 2'
+
+        await doc.fs.delete('source')
+        assert await doc.fs.list('source') == []
+
+        MyDoc.gridfs['cascade'] = True
+        self.connection.register([MyDoc])
+        assert await self.col.MyDoc.remove(doc['_id']) == {'n': 1, 'ok': 1.0}
+        assert await self.connection.test.fs.files.count_documents({}) == 0
+
+    async def test_indexes(self):
+        class MyDoc(Document):
+            structure = {'foo': int, 'bar': str}
+            indexes = [{'fields': 'foo', 'unique': True}]
+        self.connection.register([MyDoc])
+        await self.col.MyDoc.generate_index(self.col)
+        assert (await self.col.index_information())['foo_1']['unique'] is True
+
+        MyDoc.indexes = [{'fields': 'bar'}]
+        self.connection.register([MyDoc])
+        plan = await self.col.MyDoc.sync_indexes(self.col, dry_run=True)
+        assert plan == {'create': ['bar_1'], 'drop': [], 'conflict': [], 'stale': ['foo_1'], 'unchanged': []}
+        await self.col.MyDoc.sync_indexes(self.col, drop=True)
+        assert sorted(await self.col.index_information()) == ['_id_', 'bar_1']
+
+    async def test_find_fulltext(self):
+        class MyDoc(Document):
+            structure = {'title': str}
+        self.connection.register([MyDoc])
+        await self.col.create_index([('title', 'text')])
+        for title in ['coffee shop', 'tea shop', 'coffee']:
+            await self.col.MyDoc({'title': title}).save()
+        cursor = self.col.MyDoc.find_fulltext('coffee')
+        assert isinstance(cursor, AsyncCursor)
+        docs = await cursor.to_list(None)
+        assert [doc['title'] for doc in docs] == ['coffee', 'coffee shop']
+        assert isinstance(docs[0], MyDoc)
+
+    def test_unsupported(self):
+        class MyDoc(VersionedDocument):
+            structure = {'foo': int}
+        self.assertRaises(TypeError, self.connection.register, [MyDoc])
+
+        class MyDoc(Document):
+            structure = {'foo': int}
+        self.connection.register([MyDoc])
+        self.assertRaises(TypeError, self.col.MyDoc.bulk_load, [{'foo': 1}])
+        self.assertRaises(TypeError, self.col.MyDoc.parallel_scan, print)
@@ -28,8 +28,10 @@
 import unittest
 
 from mongokit_ng import *
+from tests import skip_on_mock
 from bson.objectid import ObjectId
 from pymongo import ReadPreference
+from pymongo.errors import InvalidOperation
 from pymongo.read_preferences import Secondary, SecondaryPreferred
 
 
@@ -150,6 +152,7 @@ class ApiTestCase(unittest.TestCase):
         assert mydoc == raw_doc
         assert not isinstance(raw_doc, MyDoc)
 
+    @skip_on_mock('$where is not supported by mongomock')
     def test_find(self):
         class MyDoc(Document):
             structure = {
@@ -252,6 +255,10 @@ class ApiTestCase(unittest.TestCase):
             mydoc.save()
         self.assertRaises(MultipleResultsFound, self.col.MyDoc.one)
         self.assertRaises(MultipleResultsFound, self.col.one)
+        self.assertRaises(MultipleResultsFound, self.col.MyDoc.one, {'foo': 0})
+        assert self.col.MyDoc.one({'foo': 42}) is None
+        assert self.col.one({'foo': 42}) is None
+        assert self.col.MyDoc.one({'foo': 9})['foo'] == 9
 
     def test_find_random(self):
         class MyDoc(Document):
@@ -271,6 +278,28 @@ class ApiTestCase(unittest.TestCase):
         assert isinstance(mydoc, MyDoc)
         assert mydoc != raw_mydoc, (mydoc, raw_mydoc)
 
+    def test_sample(self):
+        class MyDoc(Document):
+            structure = {
+                "foo":int
+            }
+        self.connection.register([MyDoc])
+        assert self.col.MyDoc.sample(5) == []
+        for i in range(50):
+            mydoc = self.col.MyDoc()
+            mydoc["foo"] = i
+            mydoc.save()
+        docs = self.col.MyDoc.sample(5)
+        assert len(docs) == 5
+        assert len(set(doc['_id'] for doc in docs)) == 5
+        assert all(isinstance(doc, MyDoc) for doc in docs)
+        docs = self.col.MyDoc.sample(10, filter={'foo': {'$lt': 3}})
+        assert sorted(doc['foo'] for doc in docs) == [0, 1, 2]
+        raw_docs = self.col.sample(2)
+        assert len(raw_docs) == 2
+        assert not isinstance(raw_docs[0], MyDoc)
+
+    @skip_on_mock('$where is not supported by mongomock')
     def test_fetch(self):
         class DocA(Document):
             structure = {
@@ -348,6 +377,7 @@ class ApiTestCase(unittest.TestCase):
         assert self.col.DocA.fetch({'bar':'spam'}).count() == 5
         assert self.col.DocB.fetch({'bar':'spam'}).count() == 3
 
+    @skip_on_mock('$where is not supported by mongomock')
     def test_fetch_inheritance(self):
         class Doc(Document):
             structure = {
@@ -723,6 +753,7 @@ class ApiTestCase(unittest.TestCase):
         assert self.col.find().distinct('foo') == ['blo', 'bla']
         assert self.col.find().distinct('bla') == list(range(15))
 
+    @skip_on_mock('explain is not supported by mongomock')
     def test_explain(self):
         class MyDoc(Document):
             structure = {
@@ -1065,6 +1096,64 @@ class ApiTestCase(unittest.TestCase):
         self.assertEqual(isinstance(self.col.DocA.find()[3], DocA), True)
         self.assertEqual(isinstance(self.col.DocA.find()[3:], self.col.DocA.find().__class__), True)
 
+    def test_prefetch_batches(self):
+        import threading
+        import time
+
+        @self.connection.register
+        class DocA(Document):
+            structure = {'foo':int}
+
+        self.col.insert_many([{'foo': i} for i in range(100)])
+        expected = list(self.col.DocA.find().sort('foo', 1).batch_size(7))
+
+        # count the batches fetched from the database by the background thread
+        cursor_class = type(self.col.find())
+        refresh = cursor_class._refresh
+        fetched = []
+        def counting_refresh(cursor):
+            count = refresh(cursor)
+            if count and threading.current_thread() is not threading.main_thread():
+                fetched.append(count)
+            return count
+        cursor_class._refresh = counting_refresh
+        self.addCleanup(setattr, cursor_class, '_refresh', refresh)
+
+        def wait_fetched(count):
+            for _ in range(200):
+                if len(fetched) >= count:
+                    break
+                time.sleep(0.01)
+
+        # the same documents in the same order
+        cursor = self.col.DocA.find().sort('foo', 1).batch_size(7).prefetch_batches(2)
+        docs = list(cursor)
+        self.assertEqual(docs, expected)
+        self.assertEqual(isinstance(docs[0], DocA), True)
+        self.assertEqual(cursor.alive, False)
+        self.assertEqual(list(cursor.rewind()), expected)
+        self.assertEqual(len(list(self.col.find({'foo': {'$lt': 10}}).limit(5).prefetch_batches())), 5)
+
+        # the next batches are fetched while the first one is processed
+        del fetched[:]
+        cursor = self.col.DocA.find().sort('foo', 1).batch_size(7).prefetch_batches(2)
+        self.assertEqual(next(cursor), expected[0])
+        wait_fetched(3)
+        # the current batch, 2 waiting ones and at most one ready to be queued
+        self.assertIn(len(fetched), (3, 4))
+
+        # closing the cursor stops fetching
+        cursor.close()
+        self.assertEqual([thread for thread in threading.enumerate() if thread.name == 'mongokit-prefetch'], [])
+        count = len(fetched)
+        time.sleep(0.05)
+        self.assertEqual(len(fetched), count)
+
+        self.assertRaises(ValueError, self.col.DocA.find().prefetch_batches, 0)
+        cursor = self.col.DocA.find()
+        next(cursor)
+        self.assertRaises(InvalidOperation, cursor.prefetch_batches, 2)
+
     def test_unwrapped_cursor(self):
         self.assertEqual(self.col.count(), 0)
 
@@ -1091,3 +1180,77 @@ class ApiTestCase(unittest.TestCase):
         assert isinstance(db.read_preference, SecondaryPreferred)
         assert isinstance(col.MyDoc.find()._read_preference(), SecondaryPreferred), col.MyDoc.find().__dict__
         con.close()
+
+    def test_aggregate(self):
+        class MyDoc(Document):
+            structure = {
+                "foo":int,
+                "bar":{"spam":[{"egg":str}]},
+            }
+        class MyOtherDoc(MyDoc):
+            structure = {
+                "_type":str,
+            }
+        self.connection.register([MyDoc, MyOtherDoc])
+        for i in range(10):
+            mydoc = self.col.MyDoc()
+            mydoc["foo"] = i
+            mydoc["bar"]["spam"].append({"egg": str(i)})
+            mydoc.save()
+        other = self.col.MyOtherDoc()
+        other["foo"] = 10
+        other.save()
+
+        cursor = self.col.MyDoc.aggregate([
+            {'$match': {'foo': {'$gte': 5}, 'bar.spam.egg': {'$ne': '6'}}},
+            {'$sort': {'foo': -1}},
+        ], allowDiskUse=True, batchSize=2)
+        docs = list(cursor)
+        assert [doc['foo'] for doc in docs] == [10, 9, 8, 7, 5]
+        assert isinstance(docs[0], MyOtherDoc)
+        assert isinstance(docs[1], MyDoc)
+
+        raw = list(self.col.MyDoc.aggregate([{'$group': {'_id': None, 'total': {'$sum': '$foo'}}}], wrap=False))
+        assert raw == [{'_id': None, 'total': 55}], raw
+
+        self.assertRaises(StructureError, self.col.MyDoc.aggregate, [{'$match': {'fooo': 1}}])
+        self.assertRaises(StructureError, self.col.MyDoc.aggregate, [{'$project': {'bar.spam.eggs': 1}}])
+        # after a $group the documents don't follow the structure anymore
+        list(self.col.MyDoc.aggregate([{'$group': {'_id': '$foo'}}, {'$match': {'total': 1}}], wrap=False))
+
+    @skip_on_mock('$text queries are not supported by mongomock')
+    def test_find_fulltext(self):
+        class MyDoc(Document):
+            structure = {
+                "title":str,
+                "published":bool,
+            }
+        self.connection.register([MyDoc])
+        self.col.create_index([('title', 'text')])
+        for i, title in enumerate(['coffee shop', 'coffee and more coffee', 'tea shop']):
+            mydoc = self.col.MyDoc()
+            mydoc['title'] = title
+            mydoc['published'] = bool(i)
+            mydoc.save()
+
+        cursor = self.col.MyDoc.find_fulltext('coffee', batch_size=1)
+        assert isinstance(cursor, Cursor)
+        docs = list(cursor)
+        assert [doc['title'] for doc in docs] == ['coffee and more coffee', 'coffee shop'], docs
+        assert isinstance(docs[0], MyDoc)
+        assert docs[0]['score'] > docs[1]['score']
+
+        docs = list(self.col.MyDoc.find_fulltext('coffee shop', filter={'published': True}))
+        assert sorted(doc['title'] for doc in docs) == ['coffee and more coffee', 'tea shop'], docs
+        assert len(list(self.col.MyDoc.find_fulltext('coffee shop', limit=1))) == 1
+
+        docs = list(self.col.MyDoc.find_fulltext('shop', projection=['title'], score_field='relevance'))
+        assert sorted(docs[0].keys()) == ['_id', 'relevance', 'title'], docs
+
+        # the fulltext queries are audited like the other ones
+        self.connection.query_auditor = QueryAuditor()
+        try:
+            list(self.col.MyDoc.find_fulltext('tea'))
+        finally:
+            auditor, self.connection.query_auditor = self.connection.query_auditor, None
+        assert [entry['method'] for entry in auditor.entries] == ['find_fulltext'], auditor.entries
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import unittest
+
+from mongokit_ng import *
+from tests import skip_on_mock
+
+
+@skip_on_mock('the auditor needs explain, which mongomock does not support')
+class QueryAuditorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection = Connection()
+        self.col = self.connection.test.mongokit
+        self.auditor = QueryAuditor(min_examined=10)
+
+        class MyDoc(Document):
+            structure = {
+                'foo':int,
+                'bar':int,
+            }
+            indexes = [{'fields': 'foo'}]
+        self.connection.register([MyDoc])
+        self.col.MyDoc.sync_indexes(self.col)
+        for i in range(50):
+            self.col.MyDoc({'foo': i, 'bar': i % 5}).save()
+
+    def tearDown(self):
+        self.connection.query_auditor = None
+        self.connection.drop_database('test')
+
+    def test_auditor(self):
+        self.connection.query_auditor = self.auditor
+        assert self.col.MyDoc.find_one({'foo': 3})['bar'] == 3
+        list(self.col.MyDoc.find({'foo': {'$lt': 5}}).sort('foo', 1))
+        assert self.auditor.report() == []
+        assert [entry['method'] for entry in self.auditor.entries] == ['find_one', 'find']
+
+        assert self.col.MyDoc.one({'foo': 1, 'bar': 1})['foo'] == 1
+        assert self.auditor.report() == []
+        docs = list(self.col.MyDoc.find({'bar': 1}).sort('foo', -1))  # collection scan
+        assert len(docs) == 10
+        list(self.col.MyDoc.find({'foo': {'$gte': 0}}).sort('bar', 1))  # in memory sort
+        list(self.col.MyDoc.find({'foo': {'$gte': 0}, 'bar': 42}))  # too many examined documents
+
+        report = self.auditor.report()
+        assert [(item['method'], item['flags'], item['count']) for item in report] == [
+            ('find', ['COLLSCAN'], 1), ('find', ['SORT'], 1), ('find', ['EXAMINED_RATIO'], 1)], report
+        assert report[0]['document'] == 'MyDoc'
+        assert report[0]['call_site'].startswith(__file__.rstrip('c')), report[0]
+        assert report[0]['filter'] == {'bar': 1}
+        assert report[1]['sort'] == {'bar': 1}
+        assert report[2]['max_examined'] == 50
+
+        self.auditor.clear()
+        assert not self.auditor.entries
+        self.connection.query_auditor = None
+        list(self.col.MyDoc.find({'bar': 1}))
+        assert not self.auditor.entries
+
+    def test_auditor_on_document(self):
+        @self.connection.register
+        class AuditedDoc(Document):
+            structure = {
+                'foo':int,
+            }
+            query_auditor = QueryAuditor(sample_rate=0)
+        self.col.AuditedDoc.fetch_one({'foo': 1})
+        assert not AuditedDoc.query_auditor.entries
+        AuditedDoc.query_auditor.sample_rate = 1
+        self.col.AuditedDoc.fetch_one({'foo': 1})
+        self.col.AuditedDoc.fetch({'foo': 1}).count()
+        assert [entry['method'] for entry in AuditedDoc.query_auditor.entries] == ['fetch_one']
@@ -31,6 +31,7 @@ import logging
 logging.basicConfig(level=logging.DEBUG)
 
 from mongokit_ng import *
+from tests import skip_on_mock
 from bson.objectid import ObjectId
 
 class AutoRefTestCase(unittest.TestCase):
@@ -980,3 +981,51 @@ class AutoRefTestCase(unittest.TestCase):
         event.validate()
         event.save()
 
+
+    @skip_on_mock('the $lookup pipeline of prefetch() is not supported by mongomock')
+    def test_prefetch(self):
+        @self.connection.register
+        class User(Document):
+            __collection__ = 'users'
+            structure = {
+                'name': str,
+            }
+
+        @self.connection.register
+        class BlogPost(Document):
+            structure = {
+                'title': str,
+                'author': User,
+                'comments': [{'user': User, 'text': str}],
+                'readers': [User],
+            }
+            use_autorefs = True
+
+        bob = self.connection.test.users.User({'_id': 'bob', 'name': 'Bob'})
+        bob.save()
+        alice = self.connection.test.users.User({'_id': 'alice', 'name': 'Alice'})
+        alice.save()
+        for i in range(3):
+            post = self.col.BlogPost()
+            post['_id'] = i
+            post['title'] = 'post %s' % i
+            post['author'] = bob if i % 2 else alice
+            post['comments'] = [{'user': bob, 'text': 'hello'}, {'user': alice, 'text': 'world'}]
+            post['readers'] = [alice]
+            post.save()
+
+        posts = list(self.col.BlogPost.find({'_id': {'$gt': 0}}).sort('_id', -1).prefetch(
+            'author', 'comments.user', 'readers'))
+        assert [p['_id'] for p in posts] == [2, 1], posts
+        assert isinstance(posts[0], BlogPost)
+        assert isinstance(posts[0]['author'], User)
+        assert posts[0]['author'] == {'_id': 'alice', 'name': 'Alice'}
+        assert posts[1]['author'] == {'_id': 'bob', 'name': 'Bob'}
+        assert posts[0]['comments'][0]['user'] == {'_id': 'bob', 'name': 'Bob'}
+        assert posts[0]['comments'][1]['user']._prefetched
+        assert posts[0]['readers'] == [{'_id': 'alice', 'name': 'Alice'}]
+        assert posts[0] == self.col.BlogPost.get_from_id(2)
+        assert '_prefetch_0' not in posts[0]
+
+        self.assertRaises(ValueError, self.col.BlogPost.find().prefetch, 'title')
+        self.assertRaises(TypeError, self.col.User.find().prefetch, 'author')
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import datetime
+import unittest
+
+from mongokit_ng import *
+from mongokit_ng.bulk import BulkLoadResult, encode_batch
+
+
+class BulkDoc(Document):
+    structure = {
+        'foo': int,
+        'bar': str,
+        'created': datetime.datetime,
+    }
+    required_fields = ['foo']
+
+
+class BulkLoadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection = Connection()
+        self.col = self.connection.test.mongokit
+        self.connection.register([BulkDoc])
+
+    def tearDown(self):
+        self.connection.drop_database('test')
+
+    def test_encode_batch(self):
+        docs, errors = encode_batch(BulkDoc, [
+            {'foo': 1, 'bar': 'a', 'created': None},
+            {'foo': 'a', 'bar': 'b', 'created': None},
+        ], start=10)
+        assert [index for index, _ in docs] == [10]
+        assert errors == [(11, 'SchemaTypeError: foo must be an instance of int not str')]
+
+    def test_bulk_load(self):
+        self.col.insert_one({'_id': 'taken'})
+
+        def records():
+            for i in range(1000):
+                if i == 10:
+                    yield {'foo': None, 'bar': 'required', 'created': None}
+                elif i == 20:
+                    yield {'foo': i, 'bar': 'unknown field', 'created': None, 'egg': 1}
+                elif i == 30:
+                    yield {'_id': 'taken', 'foo': i, 'bar': 'duplicate', 'created': None}
+                else:
+                    yield {'foo': i, 'bar': str(i), 'created': datetime.datetime(2020, 1, 1)}
+
+        result = self.col.BulkDoc.bulk_load(records(), processes=2, threads=2, batch_size=64, max_pending=2)
+        assert isinstance(result, BulkLoadResult)
+        assert result.inserted == 997
+        assert [index for index, _ in result.errors] == [10, 20, 30]
+        assert result.errors[0][1].startswith('RequireFieldError')
+        assert 'egg' in result.errors[1][1]
+        assert 'E11000' in result.errors[2][1]
+        assert self.col.count_documents({}) == 998
+        doc = self.col.BulkDoc.find_one({'foo': 42})
+        assert doc['bar'] == '42'
+        assert doc['created'] == datetime.datetime(2020, 1, 1)
+
+        result = self.col.BulkDoc.bulk_load(
+            [{'foo': 1, 'bar': 'a', 'created': None}], processes=1, uuid=True)
+        assert result.inserted == 1 and result.errors == []
+        assert self.col.find_one({'bar': 'a'})['_id'].startswith('BulkDoc-')
+
+    def test_unsupported(self):
+        class AutorefDoc(Document):
+            structure = {'doc': BulkDoc}
+            use_autorefs = True
+        self.connection.register([AutorefDoc])
+        self.assertRaises(TypeError, self.col.AutorefDoc.bulk_load, [])
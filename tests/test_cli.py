@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+
+from click.testing import CliRunner
+
+from mongokit_ng import *
+from tests import skip_on_mock
+from mongokit_ng import profiling
+from mongokit_ng.cli import Context, MIGRATION_STATE_COLLECTION, main
+
+
+class CliDoc(Document):
+    __database__ = 'test'
+    __collection__ = 'mongokit'
+    structure = {
+        'foo': int,
+        'bar': str,
+    }
+    indexes = [{'fields': 'foo'}]
+
+
+class CliVersionedDoc(VersionedDocument):
+    __database__ = 'test'
+    __collection__ = 'versioned'
+    structure = {
+        'foo': int,
+    }
+
+
+class CliDocMigration(DocumentMigration):
+    def allmigration01_add_bar(self):
+        self.target = {'bar': {'$exists': False}}
+        self.update = {'$set': {'bar': 'default'}}
+
+    def migration01_upper_bar(self):
+        self.target = {'bar': 'default'}
+        self.update = {'$set': {'bar': 'DEFAULT'}}
+
+
+class CliTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection = Connection()
+        self.connection.register([CliDoc, CliVersionedDoc])
+        self.col = self.connection.test.mongokit
+        self.runner = CliRunner()
+
+    def tearDown(self):
+        self.connection.drop_database('test')
+
+    def invoke(self, *args):
+        context = Context(connection=self.connection)
+        result = self.runner.invoke(main, ['-m', __name__] + list(args), obj=context)
+        if result.exception and not isinstance(result.exception, SystemExit):
+            raise result.exception
+        return result
+
+    def test_sync_indexes(self):
+        result = self.invoke('sync-indexes', '--dry-run')
+        assert result.exit_code == 0, result.output
+        assert 'CliDoc test.mongokit: create foo_1' in result.output
+        assert 'foo_1' not in self.col.index_information()
+        self.invoke('sync-indexes', 'CliDoc')
+        assert 'foo_1' in self.col.index_information()
+        assert 'CliDoc test.mongokit: up to date' in self.invoke('sync-indexes').output
+        result = self.invoke('sync-indexes', 'NotADoc')
+        assert result.exit_code == 2
+        assert 'no Document called NotADoc' in result.output
+
+        # the indexes of a document declaring none anymore are stale
+        self.addCleanup(setattr, CliDoc, 'indexes', CliDoc.indexes)
+        CliDoc.indexes = []
+        result = self.invoke('sync-indexes', 'CliDoc')
+        assert 'CliDoc test.mongokit: stale foo_1' in result.output
+        assert 'foo_1' in self.col.index_information()
+        result = self.invoke('sync-indexes', '--drop')
+        assert 'CliDoc test.mongokit: drop foo_1' in result.output
+        assert 'foo_1' not in self.col.index_information()
+
+    def test_migrate(self):
+        for i in range(5):
+            self.col.insert_one({'foo': i})
+        self.col.insert_one({'foo': 5, 'bar': 'other'})
+        result = self.invoke('migrate', 'CliDocMigration', 'CliDoc', '--batch-size', '2')
+        assert result.exit_code == 0, result.output
+        assert 'CliDocMigration.allmigration01_add_bar done' in result.output
+        assert sorted(doc['bar'] for doc in self.col.find()) == ['DEFAULT'] * 5 + ['other']
+        state = self.connection.test[MIGRATION_STATE_COLLECTION].find_one()
+        assert state['allmigrations'] == ['allmigration01_add_bar']
+        assert state['finished']
+
+        result = self.invoke('migrate', 'CliDocMigration', 'CliDoc', '--resume')
+        assert 'already done' in result.output
+        result = self.invoke('migrate', 'CliDocMigration', 'CliDoc')
+        assert 'allmigration01_add_bar done' in result.output
+
+    def test_compact_revisions(self):
+        doc = self.connection.test.versioned.CliVersionedDoc()
+        for i in range(5):
+            doc['foo'] = i
+            doc.save()
+        other = self.connection.test.versioned.CliVersionedDoc({'foo': 1})
+        other.save()
+        result = self.invoke('compact-revisions', '--keep', '2')
+        assert result.exit_code == 0, result.output
+        assert 'CliVersionedDoc: 3 revisions deleted' in result.output
+        revisions = self.connection.test.versioned_versioned
+        assert sorted(rev['revision'] for rev in revisions.find({'id': str(doc['_id'])})) == [4, 5]
+        assert revisions.count_documents({'id': str(other['_id'])}) == 1
+        self.assertRaises(ValueError, CliVersionedDoc.compact_revisions, self.connection.test.versioned, keep=0)
+
+    def test_profile_validation(self):
+        for i in range(10):
+            self.col.CliDoc({'foo': i, 'bar': str(i)}).save()
+        self.col.insert_one({'foo': 'not an int', 'bar': ''})
+        result = self.invoke('profile-validation', 'CliDoc', '--sample', '20')
+        assert result.exit_code == 0, result.output
+        assert 'CliDoc: 11 documents, 1 invalid' in result.output
+        assert 'validate_doc' in result.output
+        assert not profiling.is_enabled()
+
+    @skip_on_mock('the auditor needs explain, which mongomock does not support')
+    def test_audit(self):
+        for i in range(200):
+            self.col.insert_one({'foo': i})
+        result = self.invoke('audit', 'CliDoc', '--filter', '{"foo": {"$gt": 150}}')
+        assert result.exit_code == 1, result.output
+        assert 'COLLSCAN' in result.output
+        self.col.create_index('foo')
+        result = self.invoke('audit', 'CliDoc', '--filter', '{"foo": {"$gt": 150}}')
+        assert result.exit_code == 0, result.output
+        assert 'flags: none' in result.output
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import datetime
+import unittest
+
+from mongokit_ng import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class ColumnsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection = Connection()
+        self.col = self.connection.test.mongokit
+
+        class MyDoc(Document):
+            structure = {
+                'foo': int,
+                'bar': {'bla': str, 'ratio': float},
+                'tags': [str],
+                'date': datetime.datetime,
+                'flag': bool,
+            }
+        self.connection.register([MyDoc])
+        for i in range(250):
+            self.col.insert_one({
+                'foo': None if i == 3 else i,
+                'bar': {'bla': str(i), 'ratio': i / 4},
+                'tags': ['t%s' % i],
+                'date': datetime.datetime(2020, 1, 1) + datetime.timedelta(hours=i),
+                'flag': i % 2 == 0,
+            })
+        self.col.insert_one({'foo': 250})
+
+    def tearDown(self):
+        self.connection.drop_database('test')
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        columns = self.col.MyDoc.find().sort('foo', 1).batch_size(100).to_columns()
+        assert list(columns) == ['_id', 'foo', 'bar.bla', 'bar.ratio', 'tags', 'date', 'flag']
+        assert columns['foo'].dtype == numpy.int64
+        assert columns['foo'].count() == 250
+        assert columns['foo'].mask[0] and not columns['foo'].mask[1:].any()
+        assert columns['bar.ratio'].dtype == numpy.float64
+        assert columns['bar.ratio'][1] == 0
+        assert columns['date'].dtype == numpy.dtype('datetime64[ms]')
+        assert columns['date'][1] == numpy.datetime64('2020-01-01T00:00')
+        assert columns['flag'].dtype == numpy.bool_
+        assert columns['bar.bla'][2] == '1'
+        assert columns['tags'][2] == ['t1']
+        assert columns['bar.bla'].mask[-1]
+
+        columns = self.col.MyDoc.find({'foo': {'$gte': 200}}).to_columns(['foo'])
+        assert sorted(columns['foo']) == list(range(200, 251))
+        assert len(self.col.MyDoc.find({'foo': -1}).to_columns(['foo'])['foo']) == 0
+        self.assertRaises(ValueError, self.col.MyDoc.find().to_columns, backend='csv')
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_arrow(self):
+        table = self.col.MyDoc.find().sort('foo', 1).to_columns(['_id', 'foo', 'date', 'bar.bla'], backend='arrow')
+        assert table.num_rows == 251
+        assert table.column_names == ['_id', 'foo', 'date', 'bar.bla']
+        assert table.schema.field('foo').type == pyarrow.int64()
+        assert table.schema.field('date').type == pyarrow.timestamp('ms')
+        assert table.schema.field('_id').type == pyarrow.string()
+        assert table.column('foo').null_count == 1
+        assert table.column('bar.bla').to_pylist()[:3] == ['3', '0', '1']
+        assert table.column('bar.bla').to_pylist()[-1] is None
+
+    @unittest.skipIf(numpy is None or pyarrow is None, "numpy or pyarrow is not installed")
+    def test_mistyped_values(self):
+        # loosely typed collections: the values of another type are masked
+        ids = self.col.insert_many([
+            {'foo': 'oops', 'bar': {'ratio': 'x', 'bla': 3}, 'flag': 1, 'date': '2020-01-01'},
+            {'foo': True, 'bar': {'ratio': 2}},
+        ]).inserted_ids
+        fields = ['foo', 'bar.ratio', 'bar.bla', 'flag', 'date']
+        spec = {'_id': {'$in': ids}}
+        columns = self.col.MyDoc.find(spec).sort('_id', 1).to_columns(fields)
+        assert columns['foo'].mask.all()
+        assert list(columns['bar.ratio'].mask) == [True, False]
+        assert columns['bar.ratio'][1] == 2.0
+        assert columns['bar.bla'].mask.all()
+        assert columns['flag'].mask.all()
+        assert columns['date'].mask.all()
+        table = self.col.MyDoc.find(spec).sort('_id', 1).to_columns(fields, backend='arrow')
+        assert table.column('foo').null_count == 2
+        assert table.column('bar.ratio').to_pylist() == [None, 2.0]
+        assert table.column('date').null_count == 2
@@ -31,10 +31,12 @@ import logging
 logging.basicConfig(level=logging.DEBUG)
 
 from mongokit_ng import *
+from tests import skip_on_mock
 from bson.objectid import ObjectId
 
 admin_created = False
 
+@skip_on_mock('authentication is not supported by mongomock')
 class _ExtMongoDBAuthTestCase(unittest.TestCase):
     """Tests MongoDB Authentication.
     To prevent possibly screwing someone's DB, does NOT confirm "strict"
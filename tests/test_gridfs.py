@@ -25,9 +25,13 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from mongokit_ng import *
+from mongokit_ng.grid_cache import DiskCache, CachedFile
 from bson.objectid import ObjectId
 from gridfs import NoFile
 
@@ -236,3 +240,212 @@ class GridFSTestCase(unittest.TestCase):
         doc.fs.delete(new_id)
         assert doc.fs.source == b'Hello World', doc.fs.source
 
+
+    def test_gridfs_inline(self):
+        class Doc(Document):
+            structure = {
+                'title':str,
+            }
+            gridfs = {'files': ['thumbnail'], 'containers':['images'], 'inline_threshold': 16}
+        self.connection.register([Doc])
+        doc = self.col.Doc()
+        doc['title'] = 'Hello'
+        doc.save()
+
+        doc.fs.thumbnail = "small"
+        assert doc.fs.thumbnail == b"small", doc.fs.thumbnail
+        assert self.connection.test.fs.files.find().count() == 0
+        doc.fs.images['first.jpg'] = b"tiny"
+        assert doc.fs.images['first.jpg'] == b"tiny"
+        assert self.connection.test.fs.files.find().count() == 0
+
+        doc = self.col.Doc.find_one({'title':'Hello'})
+        assert doc.fs.thumbnail == b"small", doc.fs.thumbnail
+        assert sorted(i.name for i in doc.fs) == ['first.jpg', 'thumbnail']
+        doc.validate()
+
+        # bigger files go to GridFS and replace the inline copy
+        doc.fs.thumbnail = "a much bigger thumbnail"
+        assert doc.fs.thumbnail == b"a much bigger thumbnail", doc.fs.thumbnail
+        assert self.connection.test.fs.files.find().count() == 1
+        assert [e['filename'] for e in self.col.find_one()['_fs']] == ['first.jpg']
+
+        del doc.fs.images['first.jpg']
+        self.assertRaises(NoFile, doc.fs.images.__getitem__, 'first.jpg')
+
+    def test_gridfs_inline_concurrent_writers(self):
+        class Doc(Document):
+            structure = {
+                'title':str,
+            }
+            gridfs = {'files': ['thumbnail', 'icon'], 'inline_threshold': 16}
+        self.connection.register([Doc])
+        doc = self.col.Doc()
+        doc['title'] = 'Hello'
+        doc.save()
+
+        # a stale instance doesn't drop the files attached by another one
+        stale = self.col.Doc.find_one({'title':'Hello'})
+        doc.fs.thumbnail = "small"
+        stale.fs.icon = "tiny"
+        assert sorted(e['filename'] for e in self.col.find_one()['_fs']) == ['icon', 'thumbnail']
+        del stale.fs.icon
+        stale.fs.icon = "tinier"
+        del doc.fs.thumbnail
+        assert [(e['filename'], bytes(e['data'])) for e in self.col.find_one()['_fs']] == [('icon', b'tinier')]
+
+    def test_gridfs_inline_tz_aware(self):
+        class Doc(Document):
+            structure = {
+                'title':str,
+            }
+            gridfs = {'files': ['thumbnail', 'source'], 'inline_threshold': 16}
+        connection = Connection(tz_aware=True)
+        connection.register([Doc])
+        doc = connection.test.mongokit.Doc()
+        doc['title'] = 'Hello'
+        doc.save()
+        doc.fs.source = "a file bigger than the threshold"
+        doc.fs.thumbnail = "small"
+        # the inline and GridFS files are sorted together
+        assert [f.name for f in doc.fs] == ['source', 'thumbnail']
+        assert doc['_fs'][0]['uploadDate'].tzinfo is not None
+        doc = connection.test.mongokit.Doc.find_one()
+        assert [f.name for f in doc.fs] == ['source', 'thumbnail']
+
+    def test_gridfs_inline_collection(self):
+        class Doc(Document):
+            structure = {
+                'title':str,
+            }
+            gridfs = {'files': ['thumbnail'], 'inline_threshold': 16, 'inline_collection': 'fs.inline'}
+        self.connection.register([Doc])
+        doc = self.col.Doc()
+        doc['title'] = 'Hello'
+        doc.save()
+
+        doc.fs.thumbnail = "small"
+        doc.fs.thumbnail = "smaller"
+        assert doc.fs.thumbnail == b"smaller", doc.fs.thumbnail
+        assert self.connection.test.fs.inline.find().count() == 1
+        assert self.connection.test.fs.files.find().count() == 0
+        assert '_fs' not in self.col.find_one()
+
+        del doc.fs.thumbnail
+        assert self.connection.test.fs.inline.find().count() == 0
+        self.assertRaises(NoFile, getattr, doc.fs, 'thumbnail')
+
+    def test_gridfs_disk_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+
+        class Doc(Document):
+            structure = {
+                'title':str,
+            }
+            gridfs = {'files': ['source'], 'cache': DiskCache(cache_dir, max_size=15)}
+        self.connection.register([Doc])
+        doc = self.col.Doc()
+        doc['title'] = 'Hello'
+        doc.save()
+
+        doc.fs.source = "Hello World !"
+        f = doc.fs.get_last_version('source')
+        assert isinstance(f, CachedFile)
+        assert f.read() == b"Hello World !"
+        assert f.name == 'source'
+
+        # chunks are not read anymore
+        self.connection.test.fs.chunks.remove({})
+        assert doc.fs.source == b"Hello World !", doc.fs.source
+
+        # a new version has another key
+        doc.fs.source = "Salut !"
+        assert doc.fs.source == b"Salut !", doc.fs.source
+
+        # the cache does not grow above max_size
+        doc.fs.source = "0123456789"
+        assert doc.fs.source == b"0123456789", doc.fs.source
+        assert len([i for i in os.listdir(cache_dir) if not i.startswith('.')]) == 1
+
+        # bigger files are streamed from GridFS
+        doc.fs.source = "a file bigger than the cache"
+        f = doc.fs.get_last_version('source')
+        assert not isinstance(f, CachedFile)
+        assert f.read() == b"a file bigger than the cache"
+        assert len([i for i in os.listdir(cache_dir) if not i.startswith('.')]) == 1
+
+    def test_gridfs_listing_cache(self):
+        class Doc(Document):
+            structure = {
+                'title':str,
+            }
+            gridfs = {'files': ['foo'], 'containers':['attachments']}
+        self.connection.register([Doc])
+        doc = self.col.Doc()
+        doc['title'] = 'Hello'
+        doc.save()
+
+        doc.fs.foo = "Hello World !"
+        doc.fs.attachments['eggs.txt'] = "Ola !"
+        assert [i.name for i in doc.fs] == ['foo', 'eggs.txt'], [i.name for i in doc.fs]
+        assert 'docid_1' in self.connection.test.fs.files.index_information()
+
+        # the listing is cached by the FS
+        self.connection.test.fs.files.remove({'filename': 'eggs.txt'})
+        assert [i.name for i in doc.fs.attachments] == ['eggs.txt']
+        assert doc.fs.foo == b"Hello World !"
+        doc.fs.refresh()
+        assert [i.name for i in doc.fs.attachments] == []
+
+        # writes through the FS invalidate the listing
+        f = doc.fs.attachments.new_file('spam.txt')
+        f.write('Saluton !')
+        f.close()
+        assert [i.name for i in doc.fs] == ['foo', 'spam.txt'], [i.name for i in doc.fs]
+
+    def test_gridfs_cascade_delete(self):
+        class Doc(Document):
+            structure = {
+                'title':str,
+            }
+            gridfs = {'files': ['source'], 'containers':['attachments'], 'cascade': True}
+        self.connection.register([Doc])
+        docs = []
+        for i in range(3):
+            doc = self.col.Doc()
+            doc['title'] = 'Hello %s' % i
+            doc.save()
+            doc.fs.source = "Hello World !"
+            doc.fs.attachments['eggs.txt'] = "Ola !"
+            docs.append(doc)
+        assert self.connection.test.fs.files.find().count() == 6
+        assert self.connection.test.fs.chunks.find().count() == 6
+
+        docs[0].delete()
+        assert self.connection.test.fs.files.find().count() == 4
+        assert self.connection.test.fs.chunks.find().count() == 4
+        assert docs[1].fs.source == b"Hello World !"
+
+        del docs[1].fs.source
+        assert self.connection.test.fs.chunks.find().count() == 3
+
+        result = self.col.Doc.remove({'title': {'$in': ['Hello 1', 'Hello 2']}})
+        assert result['n'] == 2, result
+        assert self.col.find().count() == 0
+        assert self.connection.test.fs.files.find().count() == 0
+        assert self.connection.test.fs.chunks.find().count() == 0
+
+        # like pymongo, an id is turned into a query and multi is honored
+        for i in range(3):
+            doc = self.col.Doc()
+            doc['title'] = 'Hello'
+            doc.save()
+            doc.fs.source = "Hello World !"
+        assert self.col.Doc.remove(doc['_id']) == {'n': 1, 'ok': 1.0}
+        assert self.connection.test.fs.files.find().count() == 2
+        assert self.col.Doc.remove({'title': 'Hello'}, multi=False)['n'] == 1
+        assert self.col.find().count() == 1
+        self.assertRaises(TypeError, self.col.Doc.remove, {}, w=0)
+        assert self.col.Doc.remove({}, True)['n'] == 1
+        assert self.connection.test.fs.files.find().count() == 0
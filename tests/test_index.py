@@ -28,6 +28,7 @@
 import unittest
 
 from mongokit_ng import Connection, Document, OperationFailure, BadIndexError, INDEX_GEO2D, INDEX_ASCENDING, INDEX_DESCENDING
+from tests import skip_on_mock
 
 class IndexTestCase(unittest.TestCase):
     def setUp(self):
@@ -595,6 +596,7 @@ class IndexTestCase(unittest.TestCase):
         results = [i['_id'] for i in self.col.MyDoc.fetch().sort([('mydoc.creation_date',-1),('_id',1)])]
         assert results == ['ccc', 'aa', 'aaa', 'bbb'], results
 
+    @skip_on_mock('uses a pymongo client, which needs a server')
     def test_index_pymongo(self):
         import datetime
         date = datetime.datetime.utcnow()
@@ -738,3 +740,41 @@ class IndexTestCase(unittest.TestCase):
         self.col.KWDoc.generate_index(self.col)
         idx_info = self.col.index_information()
         assert 'additional_kws' in idx_info
+
+    def test_sync_indexes(self):
+        @self.connection.register
+        class MyDoc(Document):
+            structure = {
+                'foo': str,
+                'bar': int,
+                'title': str,
+            }
+            indexes = [
+                {'fields': 'foo', 'unique': True},
+                {'fields': ['bar', ('foo', -1)], 'ttl': 3600},
+                {'fields': [('title', 'text')]},
+            ]
+        self.col.create_index('bar')
+        self.col.create_index('foo')
+
+        plan = self.col.MyDoc.sync_indexes(self.col, dry_run=True)
+        assert plan == {'create': ['bar_1_foo_-1', 'title_text'], 'drop': [], 'conflict': ['foo_1'],
+                        'stale': ['bar_1'], 'unchanged': []}, plan
+        assert sorted(self.col.index_information()) == ['_id_', 'bar_1', 'foo_1']
+
+        self.col.MyDoc.sync_indexes(self.col)
+        idx_info = self.col.index_information()
+        assert sorted(idx_info) == ['_id_', 'bar_1', 'bar_1_foo_-1', 'foo_1', 'title_text'], idx_info
+        assert not idx_info['foo_1'].get('unique')
+        assert 'expireAfterSeconds' not in idx_info['bar_1_foo_-1']
+
+        plan = self.col.MyDoc.sync_indexes(self.col, drop=True)
+        assert plan['drop'] == ['foo_1', 'bar_1'], plan
+        assert plan['unchanged'] == ['bar_1_foo_-1', 'title_text'], plan
+        idx_info = self.col.index_information()
+        assert sorted(idx_info) == ['_id_', 'bar_1_foo_-1', 'foo_1', 'title_text'], idx_info
+        assert idx_info['foo_1']['unique']
+
+        plan = self.col.MyDoc.sync_indexes(self.col)
+        assert plan['unchanged'] == ['foo_1', 'bar_1_foo_-1', 'title_text'], plan
+        assert not plan['create'] and not plan['stale'], plan
@@ -561,9 +561,8 @@ class JsonTestCase(unittest.TestCase):
         assert [json.loads(i.to_json()) for i in self.col.MyDoc.fetch()] == [json.loads(jsonstr), json.loads(json2)]
  
     def test_anyjson_import_error(self):
-        import sys
-        newpathlist = sys.path
-        sys.path = []
+        import builtins
+        from unittest import mock
         class MyDoc(Document):
             structure = {
                 "foo":int,
@@ -573,10 +572,15 @@ class JsonTestCase(unittest.TestCase):
         mydoc['_id'] = 'mydoc'
         mydoc["foo"] = 4
         mydoc.save()
-        self.assertRaises(ImportError, mydoc.to_json)
-        self.assertRaises(ImportError, self.col.MyDoc.from_json, '{"_id":"mydoc", "foo":4}')
-        sys.path = newpathlist
-        del newpathlist
+        # json is always imported already, emptying sys.path is not enough
+        real_import = builtins.__import__
+        def fake_import(name, *args, **kwargs):
+            if name in ('json', 'anyjson'):
+                raise ImportError(name)
+            return real_import(name, *args, **kwargs)
+        with mock.patch('builtins.__import__', fake_import):
+            self.assertRaises(ImportError, mydoc.to_json)
+            self.assertRaises(ImportError, self.col.MyDoc.from_json, '{"_id":"mydoc", "foo":4}')
  
     def test_to_json_with_dot_notation(self):
         class MyDoc(Document):
@@ -756,3 +760,68 @@ class JsonTestCase(unittest.TestCase):
         assert mydoc_from_json['_id'] == 'a'
         assert mydoc_from_json['date'] is None
         assert mydoc_from_json['date_in_list'] == []
+
+    def test_to_ndjson(self):
+        class MyDoc(Document):
+            use_dot_notation = True
+            structure = {
+                "bla":{
+                    "foo":str,
+                    "egg":datetime.datetime,
+                },
+                "ids":[ObjectId],
+                "spam":[],
+            }
+            i18n = ['bla.foo']
+        self.connection.register([MyDoc])
+        for i in range(3):
+            mydoc = self.col.MyDoc()
+            mydoc['_id'] = 'mydoc%s' % i
+            mydoc.bla.foo = "bar"
+            mydoc.bla.egg = datetime.datetime(2010, 1, i + 1)
+            mydoc['ids'] = [ObjectId() for _ in range(i)]
+            mydoc['spam'] = [datetime.datetime(2000, 1, 1), datetime.datetime(2008, 8, 8)]
+            mydoc.set_lang('fr')
+            mydoc.bla.foo = "arf"
+            mydoc.save()
+        from io import StringIO
+        output = StringIO()
+        self.assertEqual(self.col.MyDoc.find().sort('_id').to_ndjson(output), 3)
+        lines = output.getvalue().split('\n')
+        self.assertEqual(lines[-1], '')
+        self.assertEqual(lines[:-1], [doc.to_json() for doc in self.col.MyDoc.find().sort('_id')])
+        self.assertRaises(ValueError, self.col.MyDoc.find().to_ndjson, output, backend='yaml')
+
+    def test_to_ndjson_with_autorefs(self):
+        class EmbedDoc(Document):
+            structure = {
+                "bla":{
+                    "foo":str,
+                },
+            }
+        class MyDoc(Document):
+            structure = {
+                "doc":{
+                    "embed":EmbedDoc,
+                },
+                "l": [EmbedDoc],
+            }
+            use_autorefs = True
+        self.connection.register([EmbedDoc, MyDoc])
+        embeds = []
+        for i in range(2):
+            embed = self.col.EmbedDoc()
+            embed['bla']['foo'] = 'embed%s' % i
+            embed.save()
+            embeds.append(embed)
+        for i in range(2):
+            mydoc = self.col.MyDoc()
+            mydoc['_id'] = 'mydoc%s' % i
+            mydoc['doc']['embed'] = embeds[i]
+            mydoc['l'] = embeds
+            mydoc.save()
+        from io import StringIO
+        output = StringIO()
+        self.col.MyDoc.find({'doc': {'$exists': True}}).sort('_id').to_ndjson(output)
+        self.assertEqual(output.getvalue().splitlines(),
+                         [doc.to_json() for doc in self.col.MyDoc.find({'doc': {'$exists': True}}).sort('_id')])
@@ -28,7 +28,9 @@
 import unittest
 
 from mongokit_ng import *
+from tests import skip_on_mock
 
+@skip_on_mock('map/reduce needs PyExecJS on mongomock')
 class MapReduceTestCase(unittest.TestCase):
     def setUp(self):
         self.connection = Connection()
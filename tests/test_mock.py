@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+
+from mongokit_ng import *
+from mongokit_ng.paginator import KeysetPaginator
+from mongokit_ng.mock import MockConnection, MockCollection, MockCursor
+from mongomock.store import ServerStore
+
+
+class MockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection = MockConnection()
+        self.col = self.connection.test.mongokit
+
+    def test_no_server(self):
+        class MyDoc(Document):
+            structure = {
+                'foo': int,
+                'bar': {'bla': str},
+            }
+        self.connection.register([MyDoc])
+        assert isinstance(self.connection.test.mongokit, MockCollection)
+        assert self.col.mydocs.database is self.connection.test
+        for i in range(5):
+            self.col.MyDoc({'foo': i, 'bar': {'bla': str(i)}}).save()
+        cursor = self.col.MyDoc.find({'foo': {'$gt': 1}}).sort('foo', -1)
+        assert isinstance(cursor, MockCursor)
+        docs = list(cursor)
+        assert [doc['foo'] for doc in docs] == [4, 3, 2]
+        assert all(isinstance(doc, MyDoc) for doc in docs)
+        assert list(cursor.rewind())[0]['foo'] == 4
+        assert self.col.MyDoc.find_one({'foo': 3})['bar']['bla'] == '3'
+        assert isinstance(self.col.MyDoc.find()[0], MyDoc)
+        doc = self.col.MyDoc.one({'foo': 0})
+        doc['foo'] = 'not an int'
+        self.assertRaises(SchemaTypeError, doc.save)
+
+    def test_shared_store(self):
+        store = ServerStore()
+        MockConnection(store=store).test.mongokit.insert_one({'_id': 1})
+        assert MockConnection(store=store).test.mongokit.find_one() == {'_id': 1}
+        assert MockConnection().test.mongokit.find_one() is None
+
+    def test_versioning_and_gridfs(self):
+        class MyDoc(VersionedDocument):
+            structure = {
+                'foo': str,
+            }
+            gridfs = {'files': ['source']}
+        self.connection.register([MyDoc])
+        doc = self.col.MyDoc({'_id': 'mydoc', 'foo': 'bla'})
+        doc.save()
+        doc['foo'] = 'bli'
+        doc.save()
+        assert doc['_revision'] == 2
+        assert doc.get_revision(1)['foo'] == 'bla'
+        doc.fs.source = b'Hello World!'
+        assert doc.fs.source == b'Hello World!'
+
+    def test_keyset_pagination(self):
+        class MyDoc(Document):
+            structure = {
+                'foo': int,
+            }
+        self.connection.register([MyDoc])
+        for i in range(15):
+            self.col.MyDoc({'foo': i}).save()
+        page = KeysetPaginator(self.col.MyDoc.find(), sort=[('foo', 1)], limit=10)
+        assert [doc['foo'] for doc in page.items] == list(range(10))
+        page = KeysetPaginator(self.col.MyDoc.find(), sort=[('foo', 1)],
+                               token=page.next_token, limit=10)
+        assert [doc['foo'] for doc in page.items] == list(range(10, 15))
+        assert not page.has_next
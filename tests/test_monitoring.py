@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import unittest
+
+from mongokit_ng import *
+from tests import skip_on_mock
+
+
+@skip_on_mock('no command is sent to a server by mongomock')
+class CommandMonitorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.monitor = CommandMonitor(comment=True, measure_size=True)
+        self.connection = Connection(event_listeners=[self.monitor])
+        self.col = self.connection.test.mongokit
+
+    def tearDown(self):
+        self.monitor.close()
+        self.connection.drop_database('test')
+
+    def get_stats(self, document, method, command):
+        for stats in self.monitor.snapshot():
+            if (stats['document'], stats['method'], stats['command']) == (document, method, command):
+                return stats
+
+    def test_monitor(self):
+        @self.connection.register
+        class User(Document):
+            structure = {
+                'name': str,
+            }
+
+        @self.connection.register
+        class MyDoc(Document):
+            structure = {
+                'foo': int,
+                'user': User,
+            }
+            use_autorefs = True
+            skip_validation = True
+
+        user = self.col.User({'name': 'bob'})
+        user.save()
+        for i in range(3):
+            self.col.MyDoc({'foo': i, 'user': user}).save()
+        docs = list(self.col.MyDoc.find())
+        assert len(docs) == 3
+        self.col.MyDoc.find_one({'foo': 1})
+
+        stats = self.get_stats('MyDoc', 'save', 'insert')
+        assert stats['count'] == 3, self.monitor.snapshot()
+        assert stats['bytes_sent'] > 0
+        stats = self.get_stats('MyDoc', 'find', 'find')
+        assert stats['count'] == 1
+        assert stats['documents'] == 3
+        assert stats['bytes_received'] > 0
+        assert stats['p99_ms'] >= stats['p50_ms']
+        assert sum(count for _, count in stats['histogram']) == 1
+        assert self.get_stats('MyDoc', 'find_one', 'find')['documents'] == 1
+        # the references are fetched again after each save
+        assert self.get_stats('User', 'R.to_python', 'find')['count'] >= 4
+        assert self.get_stats('User', 'save', 'insert')['count'] == 1
+
+        self.monitor.reset()
+        assert self.monitor.snapshot() == []
+
+    def test_comment(self):
+        @self.connection.register
+        class MyDoc(Document):
+            structure = {
+                'foo': int,
+            }
+        self.col.MyDoc({'foo': 1}).save()
+        cursor = self.col.MyDoc.find()
+        list(cursor)
+        assert cursor._Cursor__comment == 'mongokit:MyDoc.find'
+        self.monitor.comment = False
+        cursor = self.col.MyDoc.find()
+        list(cursor)
+        assert cursor._Cursor__comment is None
+
+        # the connections the monitor doesn't listen to are left alone
+        self.monitor.comment = True
+        connection = Connection()
+        connection.register([MyDoc])
+        cursor = connection.test.mongokit.MyDoc.find()
+        list(cursor)
+        assert cursor._Cursor__comment is None
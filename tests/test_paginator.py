@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import unittest
+
+from mongokit_ng import *
+from mongokit_ng.paginator import Paginator, KeysetPaginator, CountCache, COUNT_ESTIMATED, COUNT_NONE
+
+
+class PaginatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection = Connection()
+        self.col = self.connection.test.mongokit
+
+        class MyDoc(Document):
+            structure = {
+                'foo':int,
+            }
+        self.connection.register([MyDoc])
+        for i in range(25):
+            self.col.MyDoc({'foo': i % 3}).save()
+
+    def tearDown(self):
+        self.connection.drop_database('test')
+
+    def test_paginator(self):
+        paginator = Paginator(self.col.MyDoc.find(), page=3, limit=10)
+        assert paginator.count == 25
+        assert paginator.num_pages == 3
+        assert not paginator.has_next
+        assert paginator.has_previous
+        assert (paginator.start_index, paginator.end_index) == (21, 25)
+        assert len(list(paginator.items)) == 5
+
+    def test_paginator_count_limit(self):
+        paginator = Paginator(self.col.MyDoc.find(), page=1, limit=10, count_limit=15)
+        assert paginator.count == 15
+        assert not paginator.count_is_exact
+        assert paginator.count_display == '15+'
+        assert paginator.has_next
+        assert len(paginator.items) == 10
+
+        paginator = Paginator(self.col.MyDoc.find({'foo': 1}), limit=10, count_limit=15)
+        assert paginator.count == 8
+        assert paginator.count_is_exact
+        assert paginator.count_display == '8'
+
+    def test_paginator_without_count(self):
+        paginator = Paginator(self.col.MyDoc.find(), page=2, limit=10, count_strategy=COUNT_NONE)
+        assert paginator.count is None
+        assert paginator.has_next
+        assert paginator.num_pages == 3
+        paginator = Paginator(self.col.MyDoc.find(), page=3, limit=10, count_strategy=COUNT_NONE)
+        assert not paginator.has_next
+        assert paginator.end_index == 25
+        assert len(paginator.items) == 5
+
+    def test_paginator_estimated_count(self):
+        paginator = Paginator(self.col.MyDoc.find(), count_strategy=COUNT_ESTIMATED)
+        assert paginator.count == 25
+        paginator = Paginator(self.col.MyDoc.find({'foo': 1}), count_strategy=COUNT_ESTIMATED)
+        assert paginator.count == 8
+
+    def test_paginator_count_cache(self):
+        cache = CountCache(ttl=60)
+        assert Paginator(self.col.MyDoc.find({'foo': 1}), count_cache=cache).count == 8
+        self.col.MyDoc({'foo': 1}).save()
+        assert Paginator(self.col.MyDoc.find({'foo': 1}), count_cache=cache).count == 8
+        assert Paginator(self.col.MyDoc.find({'foo': 2}), count_cache=cache).count == 8
+        cache.clear()
+        assert Paginator(self.col.MyDoc.find({'foo': 1}), count_cache=cache).count == 9
+
+    def test_keyset_pagination(self):
+        sort = [('foo', -1), ('_id', 1)]
+        expected = [doc['_id'] for doc in self.col.MyDoc.find().sort(sort)]
+
+        page = KeysetPaginator(self.col.MyDoc.find(), sort=sort, limit=10)
+        assert not page.has_previous
+        assert page.previous_token is None
+        assert isinstance(page.items[0], self.col.MyDoc._obj_class)
+        ids = [doc['_id'] for doc in page.items]
+        pages = [list(ids)]
+        while page.has_next:
+            page = KeysetPaginator(self.col.MyDoc.find(), sort=sort, token=page.next_token, limit=10)
+            assert page.has_previous
+            pages.append([doc['_id'] for doc in page.items])
+            ids.extend(pages[-1])
+        assert ids == expected
+        assert [len(p) for p in pages] == [10, 10, 5]
+
+        page = KeysetPaginator(self.col.MyDoc.find(), sort=sort, token=page.previous_token, limit=10)
+        assert [doc['_id'] for doc in page.items] == pages[1]
+        assert page.has_next
+
+    def test_keyset_pagination_with_query(self):
+        page = KeysetPaginator(self.col.MyDoc.find({'foo': 1}), sort=['_id'], limit=5)
+        page = KeysetPaginator(self.col.MyDoc.find({'foo': 1}), sort=['_id'], token=page.next_token, limit=5)
+        assert len(page.items) == 3
+        assert all(doc['foo'] == 1 for doc in page.items)
+        assert not page.has_next
+
+    def test_keyset_pagination_with_nulls(self):
+        self.col.insert_many([{'foo': None} for i in range(4)] + [{} for i in range(4)])
+        for sort in ([('foo', 1), ('_id', 1)], [('foo', -1), ('_id', -1)]):
+            expected = [doc['_id'] for doc in self.col.find().sort(sort)]
+            page = KeysetPaginator(self.col.find(), sort=sort, limit=7)
+            ids = [doc['_id'] for doc in page.items]
+            while page.has_next:
+                page = KeysetPaginator(self.col.find(), sort=sort, token=page.next_token, limit=7)
+                ids.extend(doc['_id'] for doc in page.items)
+            assert ids == expected
+            assert len(ids) == 33
+
+            ids = [doc['_id'] for doc in page.items]
+            while page.has_previous:
+                page = KeysetPaginator(self.col.find(), sort=sort, token=page.previous_token, limit=7)
+                ids[:0] = [doc['_id'] for doc in page.items]
+            assert ids == expected
+
+    def test_keyset_pagination_bad_token(self):
+        self.assertRaises(ValueError, KeysetPaginator, self.col.MyDoc.find(), token='bad')
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+
+from mongokit_ng import *
+from mongokit_ng.parallel import get_boundaries, get_range_filters
+from tests import skip_on_mock
+
+
+class ScanDoc(Document):
+    structure = {
+        'foo': int,
+        'bar': str,
+    }
+
+
+def get_foo(doc):
+    assert isinstance(doc, ScanDoc)
+    return doc['foo']
+
+def set_bar(doc):
+    doc['bar'] = str(doc['foo'])
+    doc.save()
+
+
+class ParallelScanTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection = Connection()
+        self.col = self.connection.test.mongokit
+        self.connection.register([ScanDoc])
+        self.col.insert_many([{'foo': i, 'bar': None} for i in range(500)])
+
+    def tearDown(self):
+        self.connection.drop_database('test')
+
+    def test_boundaries(self):
+        boundaries = get_boundaries(self.col, 4)
+        assert 1 <= len(boundaries) <= 3
+        assert boundaries == sorted(boundaries)
+        # every document is in exactly one range, whatever its key
+        self.col.insert_many([{'_id': 'str%s' % i} for i in range(3)])
+        self.col.insert_one({'_id': None})
+        counts = [self.col.count_documents(spec) for spec in get_range_filters(boundaries)]
+        assert sum(counts) == 504, counts
+        assert get_boundaries(self.col, 1) == []
+        assert get_boundaries(self.connection.test.empty, 4) == []
+        assert get_range_filters([], filter={'foo': 1}) == [{'foo': 1}]
+
+    def test_parallel_scan(self):
+        assert self.col.ScanDoc.parallel_scan(get_foo, workers=4) == list(range(500))
+        results = self.col.ScanDoc.parallel_scan(get_foo, workers=3, filter={'foo': {'$gte': 450}},
+                                                 key='foo', splits=6, batch_size=10)
+        assert results == list(range(450, 500))
+        assert self.col.ScanDoc.parallel_scan(set_bar, workers=2) == []
+        assert self.col.count_documents({'bar': None}) == 0
+        self.assertRaises(ValueError, self.col.ScanDoc.parallel_scan, get_foo, mode='fiber')
+
+    @skip_on_mock('the process mode needs a server')
+    def test_parallel_scan_processes(self):
+        uri = 'mongodb://%s:%s' % self.connection.address
+        results = self.col.ScanDoc.parallel_scan(get_foo, workers=2, mode='process', uri=uri,
+                                                 filter={'foo': {'$lt': 100}})
+        assert results == list(range(100))
+        # the workers keep their connection between the scans
+        results = self.col.ScanDoc.parallel_scan(get_foo, workers=2, mode='process',
+                                                 connection_kwargs={'host': uri}, splits=4)
+        assert results == list(range(500))
+
+    def test_parallel_scan_processes_needs_uri(self):
+        self.assertRaises(ValueError, self.col.ScanDoc.parallel_scan, get_foo, mode='process')
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2011, Nicolas Clairon
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the University of California, Berkeley nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE REGENTS AND CONTRIBUTORS ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE REGENTS AND CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import unittest
+
+from mongokit_ng import *
+from mongokit_ng import profiling
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection = Connection()
+        self.col = self.connection.test.mongokit
+        profiling.reset()
+
+    def tearDown(self):
+        profiling.disable()
+        profiling.reset()
+        self.connection.drop_database('test')
+
+    def get_phase(self, document, phase):
+        for item in profiling.snapshot()['phases']:
+            if (item['document'], item['phase']) == (document, phase):
+                return item
+
+    def test_profiling(self):
+        @self.connection.register
+        class MyDoc(Document):
+            structure = {
+                'foo': int,
+                'bar': {'spam': [str], 'eggs': int},
+            }
+        self.col.MyDoc({'foo': 1, 'bar': {'spam': ['a'], 'eggs': 2}}).save()
+        assert profiling.snapshot() == {'phases': [], 'validation_paths': []}
+
+        profiling.enable()
+        for i in range(3):
+            doc = self.col.MyDoc()
+            doc['foo'] = i
+            doc['bar']['spam'] = ['a'] * 10
+            doc.save()
+        docs = list(self.col.MyDoc.find())
+        docs[0].to_json_type()
+        profiling.disable()
+        self.col.MyDoc().save()
+
+        assert self.get_phase('MyDoc', 'skeleton')['count'] == 3
+        # recursive calls are counted once
+        assert self.get_phase('MyDoc', 'validate_doc')['count'] == 3
+        assert self.get_phase('MyDoc', 'get_size')['count'] == 3
+        assert self.get_phase('MyDoc', 'wrap')['count'] == 4
+        assert self.get_phase('MyDoc', 'to_json_type')['count'] == 1
+        assert self.get_phase('MyDoc', 'process_custom_type')['total_ms'] > 0
+
+        paths = dict((item['path'], item) for item in profiling.snapshot()['validation_paths'])
+        assert sorted(paths) == ['bar', 'bar.eggs', 'bar.spam', 'foo'], paths
+        assert paths['bar']['count'] == 3
+        assert paths['bar']['total_ms'] >= paths['bar.spam']['total_ms']
+        assert len(profiling.snapshot(top_paths=1)['validation_paths']) == 1
+
+        profiling.reset()
+        assert profiling.snapshot()['phases'] == []
@@ -209,7 +209,8 @@ class VersionedTestCase(unittest.TestCase):
         count =  self.col.MyVersionedDoc.collection.find().count()
         assert count == 3, count
 
-        versioned_doc.remove({'foo':'bar'}, versioning=True)
+        result = versioned_doc.remove({'foo':'bar'}, versioning=True)
+        assert result['n'] == 3, result
 
         count =  self.col.MyVersionedDoc.versioning_collection.find().count()
         assert count == 0, count